@@ -1,19 +1,30 @@
 """
 Main Flask application with Flask-Login
 """
+import click
 from flask import Flask, jsonify, render_template, request
 from flask_cors import CORS
 from flask_login import LoginManager, login_required, current_user
 import os
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()  # make sure MONGO_URI, SECRET_KEY, etc. are loaded
 
 from config import config
 from utils.db import db, init_db, get_db_stats
+from utils.rating_buffer import rating_buffer
+from utils.cache import leaderboard_cache
+from utils.events import leaderboard_events
+from utils.suggest import group_suggestions
+from utils.identity import identity_map
+from utils.membership_cache import membership_cache
+from utils.group_cleanup import group_cleanup
+from utils.reconcile import reconcile_rating_stats, reconcile_memberships, reconcile_group_summaries
 from models.user import User
 from models.group import Group
 from models.item import Item
+from models.membership import Membership
 
 # Import blueprints
 from routes.auth import auth_bp
@@ -45,9 +56,9 @@ def create_app(config_name=None):
     CORS(app, 
          supports_credentials=True,
          origins=['http://localhost:3000', 'http://127.0.0.1:3000', 'http://localhost:5000', 'http://127.0.0.1:5000'],
-         allow_headers=['Content-Type', 'Authorization'],
+         allow_headers=['Content-Type', 'Authorization', 'If-None-Match'],
          methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
-         expose_headers=['Content-Type'])
+         expose_headers=['Content-Type', 'ETag', 'X-DB-Reads-Saved'])
     
     # Initialize Flask-Login
     login_manager = LoginManager()
@@ -65,13 +76,133 @@ def create_app(config_name=None):
         """Handle unauthorized access"""
         return jsonify({'error': 'Authentication required'}), 401
     
+    def migrate_memberships():
+        try:
+            migrated = Membership.migrate_from_arrays()
+            if migrated:
+                print(f"Moved members of {migrated} groups into the memberships collection")
+        except Exception as e:
+            print(f"Warning: Membership migration failed: {e}")
+    
     # Initialize database
     with app.app_context():
         try:
-            init_db()
+            init_db(change_log_retention=app.config['CHANGE_LOG_RETENTION'])
+            # Online migration: the app serves requests while it runs
+            if app.config['MEMBERSHIP_MIGRATION_ON_START'] and Membership.migration_pending():
+                threading.Thread(
+                    target=migrate_memberships, name='membership-migration', daemon=True
+                ).start()
         except Exception as e:
             print(f"Warning: Database initialization failed: {e}")
     
+    # Rating write-behind buffer
+    rating_buffer.configure(
+        enabled=app.config['RATING_WRITE_BEHIND'],
+        flush_interval=app.config['RATING_FLUSH_INTERVAL'],
+        flush_threshold=app.config['RATING_FLUSH_THRESHOLD'],
+        max_items=app.config['RATING_BUFFER_MAX_ITEMS'],
+        lease=app.config['RATING_BUFFER_LEASE']
+    )
+    if rating_buffer.enabled:
+        try:
+            rating_buffer.recover()
+        except Exception as e:
+            print(f"Warning: Rating buffer recovery failed: {e}")
+    
+    # Leaderboard cache
+    leaderboard_cache.configure(
+        enabled=app.config['LEADERBOARD_CACHE_ENABLED'],
+        max_entries=app.config['LEADERBOARD_CACHE_MAX_ENTRIES'],
+        ttl=app.config['LEADERBOARD_CACHE_TTL']
+    )
+    
+    # Live leaderboard streams
+    leaderboard_events.configure(
+        enabled=app.config['LEADERBOARD_STREAM_ENABLED'],
+        heartbeat_interval=app.config['LEADERBOARD_STREAM_HEARTBEAT'],
+        poll_interval=app.config['LEADERBOARD_STREAM_POLL_INTERVAL'],
+        max_queue=app.config['LEADERBOARD_STREAM_QUEUE']
+    )
+    
+    # Group name autocomplete
+    group_suggestions.configure(
+        enabled=app.config['GROUP_SUGGEST_ENABLED'],
+        max_groups=app.config['GROUP_SUGGEST_MAX_GROUPS'],
+        refresh_interval=app.config['GROUP_SUGGEST_REFRESH_INTERVAL']
+    )
+    
+    # Per-request identity map for model lookups
+    identity_map.configure(enabled=app.config['IDENTITY_MAP_ENABLED'])
+    
+    @app.after_request
+    def report_reads_saved(response):
+        """Tell the client how many DB reads the identity map saved"""
+        response.headers['X-DB-Reads-Saved'] = str(identity_map.saved())
+        return response
+    
+    @app.teardown_request
+    def finish_identity_map(error=None):
+        """Drop the request's identity map"""
+        identity_map.finish()
+    
+    # Cross-request membership/admin cache
+    membership_cache.configure(
+        enabled=app.config['MEMBERSHIP_CACHE_ENABLED'],
+        max_entries=app.config['MEMBERSHIP_CACHE_MAX_ENTRIES'],
+        ttl=app.config['MEMBERSHIP_CACHE_TTL'],
+        check_interval=app.config['MEMBERSHIP_CACHE_CHECK_INTERVAL']
+    )
+    
+    # Background cleanup of deleted groups (also resumes interrupted ones)
+    group_cleanup.configure(
+        batch_size=app.config['GROUP_CLEANUP_BATCH_SIZE'],
+        interval=app.config['GROUP_CLEANUP_INTERVAL'],
+        lease=app.config['GROUP_CLEANUP_LEASE']
+    )
+    group_cleanup.start()
+    
+    # Maintenance commands
+    @app.cli.command('reconcile-ratings')
+    @click.option('--full', is_flag=True, help='Check every item, not just recently rated ones')
+    @click.option('--batch-size', default=1000, show_default=True, help='Items per batch')
+    def reconcile_ratings_command(full, batch_size):
+        """Recompute item rating stats from the ratings collection"""
+        result = reconcile_rating_stats(batch_size=batch_size, full=full)
+        click.echo(
+            f"Checked {result['items_checked']} items, "
+            f"corrected {result['items_corrected']}"
+        )
+    
+    @app.cli.command('reconcile-members')
+    @click.option('--batch-size', default=1000, show_default=True, help='Groups/users per batch')
+    def reconcile_members_command(batch_size):
+        """Recompute member_count and groups_joined from memberships"""
+        result = reconcile_memberships(batch_size=batch_size)
+        click.echo(
+            f"Corrected {result['groups_corrected']} of {result['groups_checked']} groups, "
+            f"{result['users_corrected']} of {result['users_checked']} users"
+        )
+    
+    @app.cli.command('reconcile-groups')
+    @click.option('--batch-size', default=1000, show_default=True, help='Groups per batch')
+    def reconcile_groups_command(batch_size):
+        """Recompute group card summaries from items and ratings"""
+        result = reconcile_group_summaries(batch_size=batch_size)
+        click.echo(f"Corrected {result['groups_corrected']} of {result['groups_checked']} groups")
+    
+    @app.cli.command('migrate-members')
+    def migrate_members_command():
+        """Move legacy groups.members arrays into the memberships collection"""
+        migrated = Membership.migrate_from_arrays()
+        click.echo(f"Migrated {migrated} groups")
+    
+    @app.cli.command('cleanup-groups')
+    def cleanup_groups_command():
+        """Finish deleting every group marked deleted"""
+        finished = group_cleanup.run_pending()
+        click.echo(f"Deleted {finished} groups")
+    
     # Register blueprints
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(groups_bp, url_prefix='/api')
@@ -134,7 +265,16 @@ def create_app(config_name=None):
             return jsonify({
                 'status': 'healthy',
                 'database': 'connected',
-                'stats': stats
+                'stats': stats,
+                'metrics': {
+                    'rating_buffer': rating_buffer.stats(),
+                    'leaderboard_cache': leaderboard_cache.stats(),
+                    'leaderboard_streams': leaderboard_events.stats(),
+                    'group_suggestions': group_suggestions.stats(),
+                    'identity_map': identity_map.stats(),
+                    'membership_cache': membership_cache.stats(),
+                    'group_cleanup': group_cleanup.stats()
+                }
             }), 200
         except Exception as e:
             return jsonify({
@@ -157,21 +297,29 @@ def create_app(config_name=None):
             },
             'groups': {
                 'POST /api/groups': 'Create group',
-                'GET /api/groups': 'Get all groups',
-                'GET /api/groups/:id': 'Get group details',
+                'GET /api/groups': 'Get all groups (?q=&sort=popular|new|name&limit=&after=)',
+                'GET /api/groups/suggest': 'Group name autocomplete (?prefix=&limit=)',
+                'GET /api/groups/:id': 'Get group details (ETag / If-None-Match)',
+                'GET /api/groups/:id/bootstrap': 'Group page data: user, group, first leaderboard page, my ratings',
                 'POST /api/groups/:id/join': 'Join group',
+                'DELETE /api/groups/:id': 'Delete group (creator; data is removed in the background)',
                 'POST /api/groups/:id/leave': 'Leave group',
-                'GET /api/me/groups': 'Get user groups'
+                'GET /api/me/groups': 'Get user groups',
+                'GET /api/me/dashboard': 'My groups with top 3 items, item count and my unrated count'
             },
             'items': {
                 'POST /api/groups/:id/items': 'Add item to group',
-                'GET /api/groups/:id/items': 'Get group items',
+                'GET /api/groups/:id/items': 'Get group items (?limit=&after= for pages; ETag)',
                 'GET /api/items/:id': 'Get item details',
+                'GET /api/items/:id/rank': 'Get item leaderboard position (?neighbors=K)',
                 'DELETE /api/items/:id': 'Delete item (admin)'
             },
             'ratings': {
                 'POST /api/items/:id/rate': 'Rate item (1-5 stars)',
-                'GET /api/groups/:id/leaderboard': 'Get group leaderboard'
+                'POST /api/groups/:id/ratings/batch': 'Rate many items at once',
+                'GET /api/groups/:id/leaderboard': 'Get group leaderboard (?limit=&after= for pages; ETag)',
+                'GET /api/groups/:id/leaderboard/stream': 'Live leaderboard changes (Server-Sent Events)',
+                'GET /api/groups/:id/changes': 'Items changed since a version (?since=)'
             }
         }), 200
     
@@ -28,6 +28,51 @@ class Config:
     # CORS
     CORS_ORIGINS = os.getenv('CORS_ORIGINS', 'http://localhost:3000').split(',')
     
+    # Rating write-behind buffer (off by default: stats are written through).
+    # Only one worker buffers at a time; the others write through until its
+    # lease expires, then one takes over and recovers.
+    RATING_WRITE_BEHIND = os.getenv('RATING_WRITE_BEHIND', 'false').lower() == 'true'
+    RATING_FLUSH_INTERVAL = float(os.getenv('RATING_FLUSH_INTERVAL', '1.0'))  # seconds
+    RATING_FLUSH_THRESHOLD = int(os.getenv('RATING_FLUSH_THRESHOLD', '500'))  # items
+    RATING_BUFFER_MAX_ITEMS = int(os.getenv('RATING_BUFFER_MAX_ITEMS', '5000'))  # backpressure
+    RATING_BUFFER_LEASE = float(os.getenv('RATING_BUFFER_LEASE', '30'))  # seconds
+    
+    # In-process cache of serialized leaderboards, dropped on every write to the group
+    LEADERBOARD_CACHE_ENABLED = os.getenv('LEADERBOARD_CACHE_ENABLED', 'true').lower() == 'true'
+    LEADERBOARD_CACHE_MAX_ENTRIES = int(os.getenv('LEADERBOARD_CACHE_MAX_ENTRIES', '1024'))
+    LEADERBOARD_CACHE_TTL = float(os.getenv('LEADERBOARD_CACHE_TTL', '30'))  # seconds
+    
+    # Live leaderboard streams (Server-Sent Events)
+    LEADERBOARD_STREAM_ENABLED = os.getenv('LEADERBOARD_STREAM_ENABLED', 'true').lower() == 'true'
+    LEADERBOARD_STREAM_HEARTBEAT = float(os.getenv('LEADERBOARD_STREAM_HEARTBEAT', '15'))  # seconds
+    LEADERBOARD_STREAM_POLL_INTERVAL = float(os.getenv('LEADERBOARD_STREAM_POLL_INTERVAL', '2'))  # seconds
+    LEADERBOARD_STREAM_QUEUE = int(os.getenv('LEADERBOARD_STREAM_QUEUE', '100'))  # messages per client
+    
+    # In-process prefix index for group name autocomplete
+    GROUP_SUGGEST_ENABLED = os.getenv('GROUP_SUGGEST_ENABLED', 'true').lower() == 'true'
+    GROUP_SUGGEST_MAX_GROUPS = int(os.getenv('GROUP_SUGGEST_MAX_GROUPS', '50000'))  # largest groups kept
+    GROUP_SUGGEST_REFRESH_INTERVAL = float(os.getenv('GROUP_SUGGEST_REFRESH_INTERVAL', '300'))  # seconds
+    
+    # Per-request identity map: repeat model lookups within one request skip MongoDB
+    IDENTITY_MAP_ENABLED = os.getenv('IDENTITY_MAP_ENABLED', 'true').lower() == 'true'
+    
+    # Per-worker cache of membership roles; other workers' kicks are seen within the check interval
+    MEMBERSHIP_CACHE_ENABLED = os.getenv('MEMBERSHIP_CACHE_ENABLED', 'true').lower() == 'true'
+    MEMBERSHIP_CACHE_MAX_ENTRIES = int(os.getenv('MEMBERSHIP_CACHE_MAX_ENTRIES', '10000'))
+    MEMBERSHIP_CACHE_TTL = float(os.getenv('MEMBERSHIP_CACHE_TTL', '300'))  # seconds
+    MEMBERSHIP_CACHE_CHECK_INTERVAL = float(os.getenv('MEMBERSHIP_CACHE_CHECK_INTERVAL', '5'))  # seconds
+    
+    # Background cleanup of deleted groups' memberships, items, ratings and change log
+    GROUP_CLEANUP_BATCH_SIZE = int(os.getenv('GROUP_CLEANUP_BATCH_SIZE', '1000'))  # documents per delete
+    GROUP_CLEANUP_INTERVAL = float(os.getenv('GROUP_CLEANUP_INTERVAL', '30'))  # seconds between scans
+    GROUP_CLEANUP_LEASE = float(os.getenv('GROUP_CLEANUP_LEASE', '300'))  # seconds before a stalled cleanup is resumed
+    
+    # Group change log kept for delta sync and stream resume (TTL index)
+    CHANGE_LOG_RETENTION = int(os.getenv('CHANGE_LOG_RETENTION', str(7 * 24 * 3600)))  # seconds
+    
+    # Copy legacy groups.members arrays into memberships in a background thread at startup
+    MEMBERSHIP_MIGRATION_ON_START = os.getenv('MEMBERSHIP_MIGRATION_ON_START', 'true').lower() == 'true'
+    
     # File upload (for future use)
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
 
@@ -49,6 +94,9 @@ class TestingConfig(Config):
     """Testing configuration"""
     TESTING = True
     MONGO_URI = 'mongodb://localhost:27017/test_ranking_app'
+    GROUP_CLEANUP_INTERVAL = 0  # tests run group_cleanup.run_pending() themselves
+    GROUP_SUGGEST_REFRESH_INTERVAL = 0  # tests call group_suggestions.rebuild() themselves
+    MEMBERSHIP_MIGRATION_ON_START = False  # tests call Membership.migrate_from_arrays() themselves
 
 
 # Config dictionary
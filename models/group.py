@@ -5,13 +5,46 @@ Group model - simplified to match frontend
 """
 from utils.db import groups_collection
 import utils.db
+from utils.cache import leaderboard_cache, group_count_cache
+from utils.events import leaderboard_events
+from utils.suggest import group_suggestions
+from utils.identity import identity_map
+from utils.membership_cache import membership_cache
+from utils.pagination import encode_cursor, decode_cursor, keyset_filter, sort_values
+from models.group_change import GroupChange
+from models.membership import Membership, ADMIN_ROLES
+from pymongo import ReturnDocument
 from bson import ObjectId
+from bson.errors import InvalidId
 from datetime import datetime
+import re
 
 
 class Group:
     """Group model for ranking communities"""
     
+    # Searches up to this many characters match name prefixes instead of
+    # whole words, so results appear while the first word is being typed
+    PREFIX_SEARCH_MAX_LENGTH = 3
+    
+    # Fields a group card needs (Group.to_dict); list reads project to these
+    CARD_FIELDS = {
+        'name': 1, 'description': 1, 'member_count': 1, 'created_at': 1, 'created_by': 1,
+        'item_count': 1, 'rating_count': 1, 'last_activity_at': 1
+    }
+    
+    # Groups Group.delete() has marked are hidden from every read while
+    # utils.group_cleanup removes their data
+    LIVE = {'deleted_at': {'$exists': False}}
+    
+    # Discover sort orders. Each is served by a (key, _id) index in
+    # init_db; _id keeps ties in a stable order across pages.
+    SORTS = {
+        'popular': [('member_count', -1), ('_id', -1)],
+        'new': [('created_at', -1), ('_id', -1)],
+        'name': [('name_lower', 1), ('_id', 1)]
+    }
+    
     @staticmethod
     def create(name, description, created_by_id):
         """
@@ -25,44 +58,157 @@ class Group:
         Returns:
             dict: Created group document
         """
+        now = datetime.utcnow()
         group = {
             'name': name,
+            'name_lower': name.lower(),
+            'name_words': Group.name_words(name),
             'description': description,
             'created_by': ObjectId(created_by_id),
-            'members': [ObjectId(created_by_id)],
-            'admins': [ObjectId(created_by_id)],
             'member_count': 1,
-            'created_at': datetime.utcnow()
+            'item_count': 0,
+            'rating_count': 0,
+            'version': 0,
+            'created_at': now,
+            'last_activity_at': now
         }
         
         result = groups_collection.insert_one(group)
         group['_id'] = result.inserted_id
+        Membership.add(group['_id'], created_by_id, 'owner')
+        group_suggestions.add(group['_id'], name, group['member_count'])
         return group
     
     @staticmethod
-    def find_by_id(group_id):
-        """Find group by ID"""
-        return groups_collection.find_one({'_id': ObjectId(group_id)})
+    def find_by_id(group_id, fields=None):
+        """
+        Find group by ID
+        
+        Args:
+            group_id (str): Group ID
+            fields (dict, optional): Projection (default: card fields and
+                version, served from the request's identity map)
+        """
+        query = dict(Group.LIVE, _id=ObjectId(group_id))
+        if fields is not None:
+            return groups_collection.find_one(query, fields)
+        return identity_map.get('group', str(group_id), lambda: groups_collection.find_one(
+            query, dict(Group.CARD_FIELDS, version=1)
+        ))
     
     @staticmethod
-    def get_all(search=None, skip=0, limit=20):
+    def get_version(group_id):
         """
-        Get all groups with optional search
+        Get a group's change counter without loading the group
+        
+        Args:
+            group_id (str): Group ID
+            
+        Returns:
+            int or None: Current version, None if the group does not exist
+        """
+        try:
+            group = groups_collection.find_one(dict(Group.LIVE, _id=ObjectId(group_id)), {'version': 1})
+        except InvalidId:
+            return None
+        if not group:
+            return None
+        return group.get('version', 0)
+    
+    @staticmethod
+    def name_words(text):
+        """Lowercased distinct words of a name, for word-prefix search"""
+        return list(dict.fromkeys(re.findall(r'\w+', text.lower())))
+    
+    @staticmethod
+    def get_page(search=None, sort='popular', limit=20, cursor=None):
+        """
+        Get one page of groups for the discover page
+        
+        Listings use keyset pagination on the (sort key, _id) indexes, so
+        any page costs one index seek. Short searches are anchored prefix
+        matches on name_lower and always sort by name; longer ones use the
+        (name, description) text index, are ordered by relevance and return
+        a single page. $text only matches whole words, so a longer search
+        is also run as a prefix match (on the whole name, or on the last
+        word of the query against name_words) to find words still being
+        typed; those results fill the page after the text matches.
         
         Args:
             search (str, optional): Search query
-            skip (int): Number to skip (pagination)
-            limit (int): Number to return
+            sort (str): Key of Group.SORTS
+            limit (int): Page size
+            cursor (str, optional): next_cursor from the previous page
             
         Returns:
-            list: List of group documents
+            tuple: (groups, next_cursor) - next_cursor is None on the last page
+            
+        Raises:
+            ValueError: If the cursor is malformed or from another sort
         """
-        query = {}
+        search = (search or '').strip()
+        query = dict(Group.LIVE)
+        if search and len(search) > Group.PREFIX_SEARCH_MAX_LENGTH:
+            groups = list(groups_collection.find(
+                dict(Group.LIVE, **{'$text': {'$search': search}}),
+                dict(Group.CARD_FIELDS, score={'$meta': 'textScore'})
+            ).sort([('score', {'$meta': 'textScore'}), ('_id', 1)]).limit(limit))
+            if len(groups) < limit:
+                seen = {group['_id'] for group in groups}
+                partial = groups_collection.find(
+                    Group._partial_word_query(search), Group.CARD_FIELDS
+                ).sort(Group.SORTS['name']).limit(limit)
+                groups += [group for group in partial if group['_id'] not in seen][:limit - len(groups)]
+            return groups, None
         if search:
-            query['name'] = {'$regex': search, '$options': 'i'}
+            query['name_lower'] = {'$regex': '^' + re.escape(search.lower())}
+            sort = 'name'
+        
+        sort = sort if sort in Group.SORTS else 'popular'
+        sort_spec = Group.SORTS[sort]
+        if cursor:
+            position = decode_cursor(cursor)
+            if position.get('s') != sort or len(position.get('k', [])) != len(sort_spec):
+                raise ValueError("Cursor does not match this sort")
+            after = keyset_filter(sort_spec, position['k'])
+            query = {'$and': [query, after]}
+        
+        # Fetch one extra row to learn whether another page exists
+        projection = dict(Group.CARD_FIELDS, **{field: 1 for field, _ in sort_spec})
+        groups = list(groups_collection.find(query, projection).sort(sort_spec).limit(limit + 1))
+        next_cursor = None
+        if len(groups) > limit:
+            groups = groups[:limit]
+            next_cursor = encode_cursor({'s': sort, 'k': sort_values(groups[-1], sort_spec)})
+        return groups, next_cursor
+    
+    @staticmethod
+    def _partial_word_query(search):
+        """
+        Filter for names that start with search, or whose words contain the
+        query's complete words and one starting with its last word
+        """
+        clauses = [{'name_lower': {'$regex': '^' + re.escape(search.lower())}}]
+        words = Group.name_words(search)
+        if words:
+            clauses.append({'$and': [{'name_words': word} for word in words[:-1]] + [
+                {'name_words': {'$regex': '^' + re.escape(words[-1])}}
+            ]})
+        return dict(Group.LIVE, **{'$or': clauses})
+    
+    @staticmethod
+    def approximate_count():
+        """
+        Get the number of groups from collection metadata
         
-        # NOTE: .skip().limit() only works reliably if the collection is indexed
-        return list(groups_collection.find(query).skip(skip).limit(limit))
+        Cheap but approximate, and cached for a minute on top of that;
+        meant for "about N groups" in the UI, not for logic.
+        """
+        count = group_count_cache.get('groups')
+        if count is None:
+            count = groups_collection.estimated_document_count()
+            group_count_cache.set('groups', count)
+        return count
 
     # ==========================================================
     # 🐛 FIX: MISSING FUNCTION ADDED HERE
@@ -78,57 +224,83 @@ class Group:
         Returns:
             list: List of group documents
         """
-        # Finds all groups where the 'members' array contains the user's ObjectId
-        # The .find() returns a Cursor, which is converted to a list for iteration
-        return list(groups_collection.find({'members': ObjectId(user_id)}))
+        # The user's group IDs come from the memberships index, then one $in
+        group_ids = Membership.get_group_ids(user_id)
+        if not group_ids:
+            return []
+        return list(groups_collection.find(dict(Group.LIVE, _id={'$in': group_ids}), Group.CARD_FIELDS))
     # ==========================================================
     
     @staticmethod
     def is_member(group_id, user_id):
         """Check if user is a member of the group"""
-        count = groups_collection.count_documents({
-            '_id': ObjectId(group_id),
-            'members': ObjectId(user_id)
-        })
-        return count > 0
+        return Membership.get_role(group_id, user_id) is not None
 
     @staticmethod
     def is_admin(group_id, user_id):
         """Check if user is an admin of the group"""
-        count = groups_collection.count_documents({
-            '_id': ObjectId(group_id),
-            'admins': ObjectId(user_id)
-        })
-        return count > 0
+        return Membership.get_role(group_id, user_id) in ADMIN_ROLES
 
     @staticmethod
     def add_member(group_id, user_id):
-        """Add member to group"""
-        result = groups_collection.update_one(
-            {'_id': ObjectId(group_id)},
-            {
-                '$addToSet': {'members': ObjectId(user_id)},
-                '$inc': {'member_count': 1}
-            }
-        )
-        return result.modified_count > 0
+        """
+        Add member to group
+        
+        The membership upsert only inserts if the user is not in the group
+        yet, and member_count and the user's groups_joined are only touched
+        when it did, so double-clicks and concurrent joins never count
+        twice. The three writes commit together where the deployment has
+        transactions (utils.db.run_in_transaction).
+        
+        Returns:
+            bool: True if the user joined, False if already a member or the
+                group does not exist
+        """
+        def join(session):
+            if not Membership.add(group_id, user_id, session=session):
+                return False
+            result = groups_collection.update_one(
+                dict(Group.LIVE, _id=ObjectId(group_id)),
+                {'$inc': {'member_count': 1}},
+                session=session
+            )
+            if not result.matched_count:
+                # No such group: don't leave an orphaned membership behind
+                if session is None:
+                    Membership.remove(group_id, user_id)
+                else:
+                    session.abort_transaction()
+                return False
+            utils.db.users_collection.update_one(
+                {'_id': ObjectId(user_id)},
+                {'$addToSet': {'groups_joined': str(group_id)}},
+                session=session
+            )
+            return True
+        
+        joined = utils.db.run_in_transaction(join)
+        if joined:
+            Group._members_changed(group_id, user_id)
+        return joined
     
     @staticmethod
     def remove_member(group_id, user_id):
-        """Remove member from group"""
-        # Don't allow creator to leave
-        group = Group.find_by_id(group_id)
-        if group and str(group['created_by']) == str(user_id):
-            raise ValueError("Group creator cannot leave")
+        """
+        Remove member from group
         
-        result = groups_collection.update_one(
-            {'_id': ObjectId(group_id)},
-            {
-                '$pull': {'members': ObjectId(user_id)},
-                '$inc': {'member_count': -1}
-            }
-        )
-        return result.modified_count > 0
+        Returns:
+            bool: True if the user left, False if not a member
+            
+        Raises:
+            ValueError: If the user is the group creator
+        """
+        # The delete only matches non-owners; look closer only if it missed
+        if Group._drop_member(group_id, user_id, roles=('member', 'admin')):
+            return True
+        if Membership.get_role(group_id, user_id) == 'owner':
+            raise ValueError("Group creator cannot leave")
+        return False
+    
     @staticmethod
     def kick_member(group_id, user_id, admin_id):
         """
@@ -145,79 +317,184 @@ class Group:
         Raises:
             ValueError: If user is creator or admin is not authorized
         """
-        group = Group.find_by_id(group_id)
-        if not group:
-            raise ValueError("Group not found")
-        
-        # Check if requester is admin
-        if ObjectId(admin_id) not in group.get('admins', []):
+        # The route has usually checked the admin already; the identity
+        # map serves that second lookup without a query
+        if Membership.get_role(group_id, admin_id) not in ADMIN_ROLES:
             raise ValueError("Only admins can kick members")
         
+        # Only plain members can be kicked; the delete checks the role
+        if Group._drop_member(group_id, user_id, roles=('member',)):
+            return True
+        
+        role = Membership.get_role(group_id, user_id)
+        
         # Cannot kick the group creator
-        if str(group['created_by']) == str(user_id):
+        if role == 'owner':
             raise ValueError("Cannot kick the group creator")
         
         # Cannot kick other admins
-        if ObjectId(user_id) in group.get('admins', []):
+        if role == 'admin':
             raise ValueError("Cannot kick other admins")
         
-        result = groups_collection.update_one(
-            {'_id': ObjectId(group_id)},
-            {
-                '$pull': {'members': ObjectId(user_id)},
-                '$inc': {'member_count': -1}
-            }
-        )
-        return result.modified_count > 0
+        return False
+    
+    @staticmethod
+    def _drop_member(group_id, user_id, roles):
+        """Delete a membership with one of roles, with member_count and groups_joined"""
+        def leave(session):
+            if not Membership.remove(group_id, user_id, roles=roles, session=session):
+                return False
+            groups_collection.update_one(
+                {'_id': ObjectId(group_id)},
+                {'$inc': {'member_count': -1}},
+                session=session
+            )
+            utils.db.users_collection.update_one(
+                {'_id': ObjectId(user_id)},
+                {'$pull': {'groups_joined': str(group_id)}},
+                session=session
+            )
+            return True
+        
+        left = utils.db.run_in_transaction(leave)
+        if left:
+            Group._members_changed(group_id, user_id)
+        return left
+    
+    @staticmethod
+    def _members_changed(group_id, user_id):
+        """Tell caches and other workers about a committed join or leave"""
+        membership_cache.invalidate_group(group_id)
+        identity_map.evict('membership', (str(group_id), str(user_id)))
+        identity_map.evict('user', str(user_id))
+        Group.mark_changed(group_id, members=True)
+    
     @staticmethod
     def delete(group_id):
         """
-        Delete a group and all associated data
+        Delete a group
+        
+        The group is marked deleted and hidden from every read at once;
+        its memberships, items, ratings and change log are removed in
+        batches by the background worker (utils.group_cleanup), so the
+        request doesn't grow with the size of the group.
         
         Args:
             group_id (str): Group ID
             
         Returns:
-            bool: True if successful
+            bool: True if the group existed and is now marked deleted
         """
+        from utils.group_cleanup import group_cleanup
+        
         try:
-            # Delete the group
-            result = groups_collection.delete_one({'_id': ObjectId(group_id)})
+            result = groups_collection.update_one(
+                dict(Group.LIVE, _id=ObjectId(group_id)),
+                {'$set': {'deleted_at': datetime.utcnow()}}
+            )
+            if not result.modified_count:
+                return False
             
-            if result.deleted_count > 0:
-                # Clean up associated items and ratings
-                from models.item import Item
-                from models.rating import Rating
-                
-                # Get all items in this group
-                items = Item.get_by_group(group_id)
-                
-                # Delete all ratings for these items
-                for item in items:
-                    Rating.delete_by_item(str(item['_id']))
-                
-                # Delete all items in the group
-                utils.db.items_collection.delete_many({'group_id': ObjectId(group_id)})
-                
-                return True
-            return False
+            group_suggestions.remove(group_id)
+            # Roles stop granting access now, here and (through the change
+            # log) in other workers, not when the memberships stage runs
+            membership_cache.invalidate_group(group_id)
+            Group.mark_changed(group_id, members=True)
+            group_cleanup.enqueue(group_id)
+            return True
         except Exception as e:
             print(f"Delete group error: {e}")
             return False
     @staticmethod
-    def to_dict(group, user_id=None):
-        """Convert group to dictionary for API responses"""
+    def mark_changed(group_id, item_ids=None, deleted_ids=None, members=False,
+                     item_delta=0, rating_delta=0):
+        """
+        Record that a group, its items or their ratings changed
+        
+        Every write that can alter a group response calls this, so each
+        version bump is seen by all consumers: conditional GETs compare
+        against the version, the request's identity map forgets the group
+        and items, cached leaderboards for the group are dropped,
+        the change log records which items the version touched and live
+        streams are told which items to push.
+        
+        The same update keeps the group's card summary current: item and
+        rating writes pass their change to item_count and rating_count, and
+        any write to items moves last_activity_at.
+        
+        Args:
+            group_id (str or ObjectId): Group ID
+            item_ids (list, optional): Items created or updated
+            deleted_ids (list, optional): Items deleted
+            members (bool): A membership was added or removed
+            item_delta (int): Change in the group's item count
+            rating_delta (int): Change in the group's rating count
+            
+        Returns:
+            int or None: New version, None if the group no longer exists
+        """
+        identity_map.evict('group', str(group_id))
+        for item_id in list(item_ids or ()) + list(deleted_ids or ()):
+            identity_map.evict('item', str(item_id))
+        update = {'$inc': {'version': 1}}
+        if item_delta:
+            update['$inc']['item_count'] = item_delta
+        if rating_delta:
+            update['$inc']['rating_count'] = rating_delta
+        if item_ids or deleted_ids:
+            update['$set'] = {'last_activity_at': datetime.utcnow()}
+        group = groups_collection.find_one_and_update(
+            {'_id': ObjectId(group_id)},
+            update,
+            projection={'version': 1},
+            return_document=ReturnDocument.AFTER
+        )
+        leaderboard_cache.invalidate_tag(str(group_id))
+        if not group:
+            return None
+        GroupChange.record(group_id, group['version'], item_ids or (), deleted_ids or (), members)
+        leaderboard_events.publish(
+            str(group_id), group['version'],
+            item_ids=[str(i) for i in item_ids or ()],
+            deleted_ids=[str(i) for i in deleted_ids or ()]
+        )
+        return group['version']
+    
+    @staticmethod
+    def to_dict(group, user_id=None, roles=None):
+        """
+        Convert group to dictionary for API responses
+        
+        Args:
+            group (dict): Group document
+            user_id (str, optional): Requesting user, for the membership flags
+            roles (dict, optional): group_id -> role from Membership.get_roles;
+                without it the user's role is looked up for this group
+        """
         group_dict = {
             'id': str(group['_id']),
             'name': group['name'],
             'description': group['description'],
-            'member_count': group.get('member_count', len(group.get('members', []))),
-            'created_at': group['created_at'].isoformat()
+            'member_count': group.get('member_count', 0),
+            'item_count': group.get('item_count', 0),
+            'rating_count': group.get('rating_count', 0),
+            'created_at': group['created_at'].isoformat(),
+            'last_activity_at': (group.get('last_activity_at') or group['created_at']).isoformat()
         }
         
         if user_id:
-            group_dict['is_member'] = ObjectId(user_id) in group.get('members', [])
-            group_dict['is_admin'] = ObjectId(user_id) in group.get('admins', [])
+            if roles is None:
+                role = Membership.get_role(group['_id'], user_id)
+            else:
+                role = roles.get(str(group['_id']))
+            group_dict['is_member'] = role is not None
+            group_dict['is_admin'] = role in ADMIN_ROLES
             group_dict['is_owner'] = str(group.get('created_by')) == str(user_id)
             group_dict['isOwner'] = str(group.get('created_by')) == str(user_id)
-        return group_dict
\ No newline at end of file
+        return group_dict
+    
+    @staticmethod
+    def to_dict_many(groups, user_id=None):
+        """Convert a list of groups, reading the user's roles in one query"""
+        roles = Membership.get_roles(user_id, [g['_id'] for g in groups]) if user_id and groups else None
+        return [Group.to_dict(g, user_id, roles) for g in groups]
\ No newline at end of file
@@ -0,0 +1,86 @@
+"""
+Group change log - which items each group version touched
+"""
+import utils.db
+from bson import ObjectId
+from datetime import datetime
+
+
+class GroupChange:
+    """
+    One entry per group version, written by Group.mark_changed
+
+    Entries expire after CHANGE_LOG_RETENTION seconds (config.py); a client
+    whose version is older than the retained history has to resync.
+    """
+
+    # Entries read per delta-sync request
+    MAX_ENTRIES = 500
+
+    @staticmethod
+    def record(group_id, version, item_ids=(), deleted_ids=(), members=False):
+        """
+        Log the items changed by one version bump
+
+        Args:
+            group_id (str): Group ID
+            version (int): Version produced by the write
+            item_ids (list): Items created or updated
+            deleted_ids (list): Items deleted
+            members (bool): The write changed who is in the group (read by
+                other workers' membership caches)
+        """
+        change = {
+            'group_id': ObjectId(group_id),
+            'version': version,
+            'item_ids': [ObjectId(i) for i in item_ids],
+            'deleted_ids': [ObjectId(i) for i in deleted_ids],
+            'created_at': datetime.utcnow()
+        }
+        if members:
+            change['members'] = True
+        utils.db.group_changes_collection.insert_one(change)
+
+    @staticmethod
+    def since(group_id, version, limit=None):
+        """
+        Get the log entries after a version, oldest first
+
+        Args:
+            group_id (str): Group ID
+            version (int): Last version the client has
+            limit (int, optional): Maximum entries (default MAX_ENTRIES)
+
+        Returns:
+            list or None: Entries with consecutive versions starting at
+                version + 1, or None if part of that history is missing
+        """
+        entries = list(
+            utils.db.group_changes_collection.find(
+                {'group_id': ObjectId(group_id), 'version': {'$gt': version}},
+                {'version': 1, 'item_ids': 1, 'deleted_ids': 1}
+            ).sort('version', 1).limit(limit or GroupChange.MAX_ENTRIES)
+        )
+        for expected, entry in enumerate(entries, version + 1):
+            if entry['version'] != expected:
+                return None
+        return entries
+
+    @staticmethod
+    def summarize(entries):
+        """
+        Collapse log entries into the final set of changed items
+
+        Returns:
+            tuple: (updated_ids, deleted_ids) as sorted lists of str
+        """
+        updated, deleted = set(), set()
+        for entry in entries:
+            updated.update(str(i) for i in entry.get('item_ids', []))
+            deleted.update(str(i) for i in entry.get('deleted_ids', []))
+        return sorted(updated - deleted), sorted(deleted)
+
+    @staticmethod
+    def delete_by_group(group_id):
+        """Remove a deleted group's history"""
+        utils.db.group_changes_collection.delete_many({'group_id': ObjectId(group_id)})
@@ -5,17 +5,72 @@ Item model - things that get ranked in groups
 """
 # 🟢 FIX: Import utils.db as a module to resolve import order issues.
 import utils.db 
+import math
 from bson import ObjectId
 from datetime import datetime
 from bson.errors import InvalidId
+from pymongo import ReturnDocument, UpdateOne
+from utils.pagination import encode_cursor, decode_cursor, keyset_filter, sort_values
+from utils.identity import identity_map
+
+# Valid star scores, used as histogram bucket keys
+RATING_SCORES = (1, 2, 3, 4, 5)
+
+
+# z-score for the 95% confidence bound used by rank_score
+RANK_SCORE_Z = 1.96
+
+
+def empty_histogram():
+    """Return a zeroed star histogram as stored on item documents"""
+    return {str(score): 0 for score in RATING_SCORES}
+
+
+def rank_score(rating_sum, rating_count):
+    """
+    Confidence-aware ranking score on the 1-5 star scale
+    
+    Wilson lower bound of the mean rating, normalized to [0, 1] and scaled
+    back to stars, so a single 5-star vote ranks below many 4.8 votes.
+    Mirrors the rank_score stage in Item._derived_stats_stages.
+    
+    Args:
+        rating_sum (int): Sum of scores
+        rating_count (int): Number of ratings
+        
+    Returns:
+        float: Score in [1, 5], or 0.0 for unrated items
+    """
+    if rating_count <= 0:
+        return 0.0
+    n = rating_count
+    z2 = RANK_SCORE_Z ** 2
+    p = (rating_sum / n - 1) / 4
+    bound = (
+        p + z2 / (2 * n)
+        - RANK_SCORE_Z * math.sqrt(p * (1 - p) / n + z2 / (4 * n * n))
+    ) / (1 + z2 / n)
+    return 1 + 4 * bound
+
 
 class Item:
     """Item model for things being ranked"""
     
+    # Sort orders for group listings. Each is served by a
+    # (group_id, ...) compound index in init_db; _id makes the order total.
+    SORTS = {
+        'rating': [('avg_rating', -1), ('rating_count', -1), ('_id', -1)],
+        'score': [('rank_score', -1), ('rating_count', -1), ('_id', -1)],
+        'new': [('created_at', -1), ('_id', -1)]
+    }
+    
     @staticmethod
     def create(group_id, name, description, added_by_id):
         """
         Create new item in a group
+        
+        Returns:
+            dict or None: Created item, None if the group was deleted
         """
         try:
             item = {
@@ -26,25 +81,69 @@ class Item:
                 'created_at': datetime.utcnow(),
                 'rating_count': 0,
                 'rating_sum': 0,
-                'avg_rating': 0.0
+                'rating_hist': empty_histogram(),
+                'avg_rating': 0.0,
+                'rank_score': 0.0
             }
             
             # 🟢 FIX: Access collection via module namespace (guaranteed to work)
             result = utils.db.items_collection.insert_one(item) 
             item['_id'] = result.inserted_id
+            if Item._group_deleted(item['group_id']):
+                utils.db.items_collection.delete_one({'_id': item['_id']})
+                return None
+            Item._mark_changed(
+                [item['_id']], {str(item['_id']): item['group_id']},
+                summary={str(item['_id']): (1, 0)}
+            )
             return item
         except InvalidId as e:
             raise ValueError(f"Invalid ID format provided for item creation: {e}")
     
+    @staticmethod
+    def _group_deleted(group_id):
+        """
+        Check a group after inserting into it
+        
+        Group.delete() marks the group before its cleanup starts, so an
+        insert that still finds the group live here is seen by the cleanup's
+        items stage; one that doesn't must undo itself or be orphaned.
+        """
+        from models.group import Group
+        
+        return Group.get_version(group_id) is None
+    
     @staticmethod
     def find_by_id(item_id):
-        """Find item by ID"""
+        """Find item by ID (repeat lookups in a request use the identity map)"""
         try:
             # 🟢 FIX: Access collection via module namespace
-            return utils.db.items_collection.find_one({'_id': ObjectId(item_id)})
+            return identity_map.get('item', str(item_id), lambda: utils.db.items_collection.find_one(
+                {'_id': ObjectId(item_id)}
+            ))
         except InvalidId:
             return None
     
+    @staticmethod
+    def find_many(item_ids, group_id=None):
+        """
+        Find several items by ID in one query
+        
+        Args:
+            item_ids (list): Item IDs (str)
+            group_id (str, optional): Only return items in this group
+            
+        Returns:
+            dict: Map of item_id (str) -> item document
+        """
+        query = {'_id': {'$in': [ObjectId(i) for i in item_ids]}}
+        if group_id:
+            query['group_id'] = ObjectId(group_id)
+        return {
+            str(item['_id']): item
+            for item in utils.db.items_collection.find(query)
+        }
+    
     @staticmethod
     def get_by_group(group_id, sort='rating'):
         """
@@ -52,81 +151,453 @@ class Item:
         """
         try:
             query = {'group_id': ObjectId(group_id)}
-            sort_field = 'avg_rating' if sort == 'rating' else 'created_at'
-            sort_direction = -1
+            sort_spec = Item.SORTS.get(sort, Item.SORTS['new'])
             
             # 🟢 FIX: Access collection via module namespace
-            return list(utils.db.items_collection.find(query).sort([
-                (sort_field, sort_direction),
-                ('rating_count', -1)
-            ]))
+            return list(utils.db.items_collection.find(query).sort(sort_spec))
         except InvalidId:
             return []
 
+    @staticmethod
+    def top_by_groups(group_ids, top=3):
+        """
+        Pick the top-rated items of several groups at once
+
+        One aggregation over the groups; for each, a $lookup sub-pipeline
+        sorts and limits that group's items on the
+        (group_id, avg_rating, rating_count, _id) index, so only `top`
+        items per group are read however large the group is. Item counts
+        come from the groups' own item_count. The $lookup combines
+        localField/foreignField with a pipeline, which needs MongoDB 5.0+.
+
+        Args:
+            group_ids (list): Group IDs (str or ObjectId)
+            top (int): Items to return per group
+
+        Returns:
+            dict: Map of group_id (str) -> [item], with only the fields a
+                summary card shows
+        """
+        pipeline = [
+            {'$match': {'_id': {'$in': [ObjectId(g) for g in group_ids]}}},
+            {'$lookup': {
+                'from': utils.db.items_collection.name,
+                'localField': '_id',
+                'foreignField': 'group_id',
+                'pipeline': [
+                    {'$sort': dict(Item.SORTS['rating'])},
+                    {'$limit': top},
+                    {'$project': {'name': 1, 'avg_rating': 1, 'rating_count': 1}}
+                ],
+                'as': 'top'
+            }},
+            {'$project': {'top': 1}}
+        ]
+        return {
+            str(row['_id']): row['top']
+            for row in utils.db.groups_collection.aggregate(pipeline)
+        }
+
+    @staticmethod
+    def get_page(group_id, sort='rating', limit=50, cursor=None):
+        """
+        Get one page of a group's items using keyset pagination
+        
+        Args:
+            group_id (str): Group ID
+            sort (str): Key of Item.SORTS
+            limit (int): Page size
+            cursor (str, optional): next_cursor from the previous page
+            
+        Returns:
+            tuple: (items, first_rank, next_cursor) - next_cursor is None on
+                the last page
+            
+        Raises:
+            ValueError: If the cursor is malformed or from another sort
+        """
+        sort = sort if sort in Item.SORTS else 'new'
+        sort_spec = Item.SORTS[sort]
+        query = {'group_id': ObjectId(group_id)}
+        first_rank = 1
+        
+        if cursor:
+            position = decode_cursor(cursor)
+            if position.get('s') != sort or len(position.get('k', [])) != len(sort_spec):
+                raise ValueError("Cursor does not match this sort")
+            query.update(keyset_filter(sort_spec, position['k']))
+            first_rank = int(position.get('r', 0)) + 1
+        
+        # Fetch one extra row to learn whether another page exists
+        items = list(
+            utils.db.items_collection.find(query).sort(sort_spec).limit(limit + 1)
+        )
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = encode_cursor({
+                's': sort,
+                'k': sort_values(items[-1], sort_spec),
+                'r': first_rank + limit - 1
+            })
+        return items, first_rank, next_cursor
+    
+    @staticmethod
+    def get_rank(item, sort='rating', neighbors=0):
+        """
+        Get an item's position in its group's leaderboard
+        
+        Counts the items that sort ahead of it on the same index the
+        leaderboard uses, so ties resolve exactly as in get_by_group.
+        
+        Args:
+            item (dict): Item document
+            sort (str): Key of Item.SORTS
+            neighbors (int): Items to return directly above and below
+            
+        Returns:
+            tuple: (rank, above, below) - above/below are item documents in
+                leaderboard order
+        """
+        sort_spec = Item.SORTS.get(sort, Item.SORTS['new'])
+        position = sort_values(item, sort_spec)
+        group_query = {'group_id': item['group_id']}
+        ahead = dict(group_query, **keyset_filter(sort_spec, position, after=False))
+        
+        rank = utils.db.items_collection.count_documents(ahead) + 1
+        
+        above, below = [], []
+        if neighbors > 0:
+            reverse_spec = [(field, -direction) for field, direction in sort_spec]
+            above = list(
+                utils.db.items_collection.find(ahead).sort(reverse_spec).limit(neighbors)
+            )[::-1]
+            below = list(utils.db.items_collection.find(
+                dict(group_query, **keyset_filter(sort_spec, position))
+            ).sort(sort_spec).limit(neighbors))
+        return rank, above, below
+    
     @staticmethod
     def delete(item_id):
         """Delete item by ID"""
         try:
             # 🟢 FIX: Access collection via module namespace
-            return utils.db.items_collection.delete_one({'_id': ObjectId(item_id)}).deleted_count > 0
+            deleted = utils.db.items_collection.find_one_and_delete(
+                {'_id': ObjectId(item_id)}, projection={'group_id': 1, 'rating_count': 1}
+            )
         except InvalidId:
             return False
+        if not deleted:
+            return False
+        Item._mark_changed(
+            [deleted['_id']], {str(deleted['_id']): deleted['group_id']}, deleted=True,
+            summary={str(deleted['_id']): (-1, -deleted.get('rating_count', 0))}
+        )
+        return True
 
     @staticmethod
-    def update_rating_stats(item_id, old_rating, new_rating):
+    def _mark_changed(item_ids, groups=None, deleted=False, summary=None):
         """
-        Update item rating stats after a rating is created or updated.
+        Report writes to items to Group.mark_changed, once per group
+        
+        Args:
+            item_ids (list): Changed item IDs (str or ObjectId)
+            groups (dict, optional): item_id (str) -> group_id for items
+                whose group is known; the rest are looked up
+            deleted (bool): The items were deleted
+            summary (dict, optional): item_id (str) -> (item_delta,
+                rating_delta) for the group's item_count and rating_count
         """
-        try:
-            # Determine update operation
-            update_op = {}
-            if old_rating is None:
-                # New rating added
-                update_op = {'$inc': {'rating_count': 1, 'rating_sum': new_rating}}
+        from models.group import Group
+        
+        groups = {str(k): v for k, v in (groups or {}).items()}
+        missing = [ObjectId(i) for i in item_ids if str(i) not in groups]
+        if missing:
+            for item in utils.db.items_collection.find(
+                {'_id': {'$in': missing}}, {'group_id': 1}
+            ):
+                groups[str(item['_id'])] = item['group_id']
+        
+        summary = {str(k): v for k, v in (summary or {}).items()}
+        by_group = {}
+        for item_id in item_ids:
+            group_id = groups.get(str(item_id))
+            if group_id is not None:
+                by_group.setdefault(str(group_id), []).append(str(item_id))
+        for group_id, ids in by_group.items():
+            item_delta = sum(summary.get(i, (0, 0))[0] for i in ids)
+            rating_delta = sum(summary.get(i, (0, 0))[1] for i in ids)
+            if deleted:
+                Group.mark_changed(group_id, deleted_ids=ids, item_delta=item_delta, rating_delta=rating_delta)
             else:
-                # Update existing rating - adjust sum only
-                diff = new_rating - old_rating
-                update_op = {'$inc': {'rating_sum': diff}}
-            
-            # Perform the update
-            if update_op:
-                utils.db.items_collection.update_one(
-                    {'_id': ObjectId(item_id)},
-                    update_op
-                )
+                Group.mark_changed(group_id, item_ids=ids, item_delta=item_delta, rating_delta=rating_delta)
+
+    @staticmethod
+    def _derived_stats_stages():
+        """
+        Pipeline stages that derive ranking fields from rating_sum/rating_count.
+        
+        Shared by every write that touches the raw counters so derived
+        fields can never disagree with them. rank_score matches the
+        module-level rank_score() function.
+        """
+        z = RANK_SCORE_Z
+        z2 = z * z
+        wilson = {
+            '$let': {
+                'vars': {
+                    'n': '$rating_count',
+                    'p': {'$divide': [{'$subtract': ['$avg_rating', 1]}, 4]}
+                },
+                'in': {'$add': [1, {'$multiply': [4, {'$divide': [
+                    {'$subtract': [
+                        {'$add': ['$$p', {'$divide': [z2, {'$multiply': [2, '$$n']}]}]},
+                        {'$multiply': [z, {'$sqrt': {'$add': [
+                            {'$divide': [{'$multiply': ['$$p', {'$subtract': [1, '$$p']}]}, '$$n']},
+                            {'$divide': [z2, {'$multiply': [4, '$$n', '$$n']}]}
+                        ]}}]}
+                    ]},
+                    {'$add': [1, {'$divide': [z2, '$$n']}]}
+                ]}]}]}
+            }
+        }
+        return [
+            {'$set': {
+                'avg_rating': {
+                    '$cond': [
+                        {'$gt': ['$rating_count', 0]},
+                        {'$divide': ['$rating_sum', '$rating_count']},
+                        0.0
+                    ]
+                }
+            }},
+            {'$set': {
+                'rank_score': {'$cond': [{'$gt': ['$rating_count', 0]}, wilson, 0.0]}
+            }}
+        ]
+
+    @staticmethod
+    def _rating_delta(old_rating, new_rating):
+        """
+        Return the stat delta for a rating change
+        
+        Returns:
+            tuple: (count_delta, sum_delta, hist_delta) where hist_delta maps
+                score -> change in that star bucket
+        """
+        if old_rating is None:
+            # New rating added
+            return 1, new_rating, {new_rating: 1}
+        # Update existing rating - adjust sum and move it between buckets
+        return 0, new_rating - old_rating, {old_rating: -1, new_rating: 1}
+
+    @staticmethod
+    def _combine_deltas(first, second):
+        """Add two (count_delta, sum_delta, hist_delta) tuples together"""
+        hist = dict(first[2])
+        for score, change in second[2].items():
+            hist[score] = hist.get(score, 0) + change
+        return (
+            first[0] + second[0],
+            first[1] + second[1],
+            {score: change for score, change in hist.items() if change}
+        )
+
+    @staticmethod
+    def _rating_delta_pipeline(count_delta, sum_delta, hist_delta):
+        """Update pipeline applying a rating delta and recomputing derived fields"""
+        counters = {
+            'rating_count': {'$add': [{'$ifNull': ['$rating_count', 0]}, count_delta]},
+            'rating_sum': {'$add': [{'$ifNull': ['$rating_sum', 0]}, sum_delta]}
+        }
+        for score, change in hist_delta.items():
+            field = f'rating_hist.{score}'
+            counters[field] = {'$add': [{'$ifNull': [f'${field}', 0]}, change]}
+        return [{'$set': counters}] + Item._derived_stats_stages()
+
+    @staticmethod
+    def with_delta(item, delta):
+        """
+        Return a copy of an item document with a stat delta applied in memory
+        
+        Args:
+            item (dict): Item document
+            delta (tuple): (count_delta, sum_delta, hist_delta)
             
-            # Recalculate average
-            item = utils.db.items_collection.find_one({'_id': ObjectId(item_id)})
-            if item and item.get('rating_count', 0) > 0:
-                rating_sum = item.get('rating_sum', 0)
-                rating_count = item.get('rating_count', 0)
-                
-                if rating_count > 0:
-                    avg = rating_sum / rating_count
-                    utils.db.items_collection.update_one(
-                        {'_id': ObjectId(item_id)},
-                        {'$set': {'avg_rating': round(avg, 2)}}
-                    )
-                else: 
-                     utils.db.items_collection.update_one(
-                        {'_id': ObjectId(item_id)},
-                        {'$set': {'avg_rating': 0.0}}
-                    )
+        Returns:
+            dict: Updated copy; the stored document is not modified
+        """
+        count_delta, sum_delta, hist_delta = delta
+        item = dict(item)
+        item['rating_count'] = item.get('rating_count', 0) + count_delta
+        item['rating_sum'] = item.get('rating_sum', 0) + sum_delta
+        hist = dict(item.get('rating_hist') or empty_histogram())
+        for score, change in hist_delta.items():
+            hist[str(score)] = hist.get(str(score), 0) + change
+        item['rating_hist'] = hist
+        item['avg_rating'] = (
+            item['rating_sum'] / item['rating_count'] if item['rating_count'] > 0 else 0.0
+        )
+        item['rank_score'] = rank_score(item['rating_sum'], item['rating_count'])
+        return item
 
+    @staticmethod
+    def update_rating_stats(item_id, old_rating, new_rating):
+        """
+        Update item rating stats after a rating is created or updated.
+        
+        Counters, star histogram and average are updated in one atomic
+        pipeline update, so concurrent raters on the same item can't
+        overwrite each other's average. The group's version bump counts a
+        new rating in its rating_count.
+        
+        Returns:
+            dict or None: Updated item document
+        """
+        delta = Item._rating_delta(old_rating, new_rating)
+        try:
+            item = utils.db.items_collection.find_one_and_update(
+                {'_id': ObjectId(item_id)},
+                Item._rating_delta_pipeline(*delta),
+                return_document=ReturnDocument.AFTER
+            )
         except InvalidId:
-            pass
+            return None
+        if item:
+            Item._mark_changed(
+                [item['_id']], {str(item['_id']): item['group_id']},
+                summary={str(item['_id']): (0, delta[0])}
+            )
+        return item
     
     @staticmethod
-    def to_dict(item, user_rating=None):
+    def apply_rating_changes(changes, group_id=None):
+        """
+        Apply many rating changes to item stats with a single bulk_write
+        
+        Args:
+            changes (dict): Map of item_id -> (old_rating, new_rating)
+            group_id (str, optional): Group of the items, if known
+        """
+        Item.apply_rating_deltas({
+            item_id: Item._rating_delta(old_rating, new_rating)
+            for item_id, (old_rating, new_rating) in changes.items()
+            if old_rating != new_rating
+        }, groups={item_id: group_id for item_id in changes} if group_id else None)
+    
+    @staticmethod
+    def apply_rating_deltas(deltas, groups=None):
+        """
+        Apply pre-computed stat deltas with a single bulk_write
+        
+        Args:
+            deltas (dict): Map of item_id -> (count_delta, sum_delta, hist_delta)
+            groups (dict, optional): item_id -> group_id for items whose
+                group is known; the rest are looked up
+        """
+        changed = {
+            ObjectId(item_id): delta
+            for item_id, delta in deltas.items()
+            if delta[0] or delta[1] or any(delta[2].values())
+        }
+        if changed:
+            utils.db.items_collection.bulk_write([
+                UpdateOne({'_id': oid}, Item._rating_delta_pipeline(*delta))
+                for oid, delta in changed.items()
+            ], ordered=False)
+            Item._mark_changed(list(changed), groups, summary={
+                str(oid): (0, delta[0]) for oid, delta in changed.items()
+            })
+    
+    @staticmethod
+    def recompute_rating_stats(item_ids):
+        """
+        Rebuild rating stats for items from the ratings collection
+        
+        Args:
+            item_ids (list): Item IDs (str or ObjectId)
+            
+        Returns:
+            int: Number of item documents that changed
+        """
+        item_oids = [ObjectId(i) for i in item_ids]
+        if not item_oids:
+            return 0
+        # The groups' rating_count moves by however much each count changes
+        before = {
+            item['_id']: item
+            for item in utils.db.items_collection.find(
+                {'_id': {'$in': item_oids}}, {'group_id': 1, 'rating_count': 1}
+            )
+        }
+        
+        group_stage = {
+            '_id': '$item_id',
+            'count': {'$sum': 1},
+            'sum': {'$sum': '$score'}
+        }
+        for score in RATING_SCORES:
+            group_stage[f'h{score}'] = {
+                '$sum': {'$cond': [{'$eq': ['$score', score]}, 1, 0]}
+            }
+        totals = {
+            r['_id']: r
+            for r in utils.db.ratings_collection.aggregate([
+                {'$match': {'item_id': {'$in': item_oids}}},
+                {'$group': group_stage}
+            ])
+        }
+        
+        requests = []
+        for oid in item_oids:
+            row = totals.get(oid, {})
+            requests.append(UpdateOne(
+                {'_id': oid},
+                [{'$set': {
+                    'rating_count': row.get('count', 0),
+                    'rating_sum': row.get('sum', 0),
+                    'rating_hist': {
+                        str(score): row.get(f'h{score}', 0) for score in RATING_SCORES
+                    }
+                }}]
+                + Item._derived_stats_stages()
+            ))
+        result = utils.db.items_collection.bulk_write(requests, ordered=False)
+        if result.modified_count:
+            # bulk_write does not say which documents changed
+            Item._mark_changed(
+                list(before),
+                groups={str(oid): item['group_id'] for oid, item in before.items()},
+                summary={
+                    str(oid): (0, totals.get(oid, {}).get('count', 0) - item.get('rating_count', 0))
+                    for oid, item in before.items()
+                }
+            )
+        return result.modified_count
+    
+    @staticmethod
+    def to_dict(item, user_rating=None, include_histogram=False):
         """
         Convert item to dictionary for API responses
+        
+        Args:
+            item (dict): Item document
+            user_rating (dict, optional): Requesting user's rating document
+            include_histogram (bool): Add the per-star rating counts
         """
-        return {
+        item_dict = {
             'id': str(item['_id']),
             'name': item['name'],
             'description': item.get('description', ''),
-            'avg_rating': item.get('avg_rating', 0),
+            'avg_rating': round(item.get('avg_rating', 0), 2),
+            'rank_score': round(item.get('rank_score', 0), 3),
             'rating_count': item.get('rating_count', 0),
             'created_at': item['created_at'].isoformat(),
             'user_rating': user_rating['score'] if user_rating else None
-        }
\ No newline at end of file
+        }
+        if include_histogram:
+            hist = item.get('rating_hist') or {}
+            item_dict['histogram'] = {
+                str(score): hist.get(str(score), 0) for score in RATING_SCORES
+            }
+        return item_dict
\ No newline at end of file
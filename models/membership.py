@@ -0,0 +1,297 @@
+# models/membership.py
+
+"""
+Membership model - one document per (group, user)
+"""
+import time
+import utils.db
+from bson import ObjectId
+from datetime import datetime
+from pymongo import UpdateOne
+from utils.identity import identity_map
+from utils.membership_cache import membership_cache
+
+MIGRATION_ID = 'membership_arrays'
+
+# Index on the legacy arrays, kept until migrate_from_arrays has finished
+MEMBERS_INDEX = 'members_1'
+
+# Roles that can manage a group
+ADMIN_ROLES = ('admin', 'owner')
+
+# While the migration runs, how often a worker re-checks whether it is done
+MIGRATION_CHECK_INTERVAL = 5.0
+
+_migration = {'pending': True, 'checked_at': None}
+
+
+def _role_from_arrays(group, user_id):
+    """A user's role from a legacy group document's members/admins arrays"""
+    if user_id not in group.get('members', []):
+        return None
+    if user_id == group.get('created_by'):
+        return 'owner'
+    if user_id in group.get('admins', []):
+        return 'admin'
+    return 'member'
+
+
+class Membership:
+    """Group membership, indexed both by group and by user"""
+
+    @staticmethod
+    def add(group_id, user_id, role='member', session=None):
+        """
+        Add a user to a group
+
+        A single upsert on the unique (group_id, user_id) key: it inserts
+        only if the user is not a member, so repeated joins are no-ops.
+
+        Args:
+            group_id (str): Group ID
+            user_id (str): User ID
+            role (str): 'member', 'admin' or 'owner'
+            session (ClientSession, optional): Transaction to write in
+
+        Returns:
+            bool: True if the user was not a member before
+        """
+        result = utils.db.memberships_collection.update_one(
+            {'group_id': ObjectId(group_id), 'user_id': ObjectId(user_id)},
+            {'$setOnInsert': {'role': role, 'joined_at': datetime.utcnow()}},
+            upsert=True,
+            session=session
+        )
+        membership_cache.invalidate_group(group_id)
+        identity_map.evict('membership', (str(group_id), str(user_id)))
+        return result.upserted_id is not None
+
+    @staticmethod
+    def remove(group_id, user_id, roles=None, session=None):
+        """
+        Remove a user from a group
+
+        Args:
+            group_id (str): Group ID
+            user_id (str): User ID
+            roles (tuple, optional): Only remove a member with one of these
+                roles (checked by the delete itself)
+            session (ClientSession, optional): Transaction to write in
+
+        Returns:
+            bool: True if a membership was removed
+        """
+        query = {'group_id': ObjectId(group_id), 'user_id': ObjectId(user_id)}
+        if roles is not None:
+            query['role'] = {'$in': list(roles)}
+        result = utils.db.memberships_collection.delete_one(query, session=session)
+        membership_cache.invalidate_group(group_id)
+        identity_map.evict('membership', (str(group_id), str(user_id)))
+        return result.deleted_count > 0
+
+    @staticmethod
+    def get_role(group_id, user_id):
+        """
+        Get a user's role in a group with one point lookup
+
+        Repeat checks in a request (route guard, then the model method) are
+        served from the identity map, and later requests from the
+        worker's membership cache. Until the array migration has finished,
+        a user with no membership row is looked up in the group's legacy
+        arrays, and non-membership is not cached.
+
+        Returns:
+            str or None: Role, None if the user is not a member
+        """
+        legacy = Membership.legacy_reads()
+
+        def load():
+            membership = utils.db.memberships_collection.find_one(
+                {'group_id': ObjectId(group_id), 'user_id': ObjectId(user_id)},
+                {'_id': 0, 'role': 1}
+            )
+            if membership:
+                return membership['role']
+            if legacy:
+                group = utils.db.groups_collection.find_one(
+                    {'_id': ObjectId(group_id), 'members': ObjectId(user_id)},
+                    {'members': 1, 'admins': 1, 'created_by': 1}
+                )
+                if group:
+                    return _role_from_arrays(group, ObjectId(user_id))
+            return None
+
+        return identity_map.get(
+            'membership', (str(group_id), str(user_id)),
+            lambda: membership_cache.get_role(group_id, user_id, load, cache_none=not legacy)
+        )
+
+    @staticmethod
+    def get_roles(user_id, group_ids):
+        """
+        Get a user's roles in several groups with one query
+
+        Args:
+            user_id (str): User ID
+            group_ids (list): Group IDs (str or ObjectId)
+
+        Returns:
+            dict: Map of group_id (str) -> role, only for groups the user is in
+                (every answer, including non-membership, is also recorded in
+                the request's identity map)
+        """
+        memberships = utils.db.memberships_collection.find(
+            {'user_id': ObjectId(user_id), 'group_id': {'$in': [ObjectId(g) for g in group_ids]}},
+            {'_id': 0, 'group_id': 1, 'role': 1}
+        )
+        roles = {str(m['group_id']): m['role'] for m in memberships}
+        missing = [ObjectId(g) for g in group_ids if str(g) not in roles]
+        if missing and Membership.legacy_reads():
+            legacy = utils.db.groups_collection.find(
+                {'_id': {'$in': missing}, 'members': ObjectId(user_id)},
+                {'members': 1, 'admins': 1, 'created_by': 1}
+            )
+            for group in legacy:
+                roles[str(group['_id'])] = _role_from_arrays(group, ObjectId(user_id))
+        for group_id in group_ids:
+            identity_map.put('membership', (str(group_id), str(user_id)), roles.get(str(group_id)))
+        return roles
+
+    @staticmethod
+    def get_roles_in_group(group_id, user_ids):
+        """
+        Get several users' roles in one group with one query
+
+        Returns:
+            dict: Map of user_id (str) -> role, only for members (also
+                recorded in the request's identity map)
+        """
+        memberships = utils.db.memberships_collection.find(
+            {'group_id': ObjectId(group_id), 'user_id': {'$in': [ObjectId(u) for u in user_ids]}},
+            {'_id': 0, 'user_id': 1, 'role': 1}
+        )
+        roles = {str(m['user_id']): m['role'] for m in memberships}
+        if len(roles) < len(user_ids) and Membership.legacy_reads():
+            group = utils.db.groups_collection.find_one(
+                {'_id': ObjectId(group_id), 'members': {'$exists': True}},
+                {'members': 1, 'admins': 1, 'created_by': 1}
+            )
+            for user_id in user_ids:
+                role = group and _role_from_arrays(group, ObjectId(user_id))
+                if str(user_id) not in roles and role:
+                    roles[str(user_id)] = role
+        for user_id in user_ids:
+            identity_map.put('membership', (str(group_id), str(user_id)), roles.get(str(user_id)))
+        return roles
+
+    @staticmethod
+    def get_group_ids(user_id):
+        """
+        Get the IDs of every group a user belongs to (served from the index),
+        plus groups still holding them in legacy arrays during the migration
+        """
+        memberships = utils.db.memberships_collection.find(
+            {'user_id': ObjectId(user_id)}, {'_id': 0, 'group_id': 1}
+        )
+        group_ids = [m['group_id'] for m in memberships]
+        if Membership.legacy_reads():
+            known = set(group_ids)
+            legacy = utils.db.groups_collection.find({'members': ObjectId(user_id)}, {'_id': 1})
+            group_ids += [g['_id'] for g in legacy if g['_id'] not in known]
+        return group_ids
+
+    @staticmethod
+    def delete_by_group(group_id):
+        """Remove every membership of a deleted group"""
+        result = utils.db.memberships_collection.delete_many({'group_id': ObjectId(group_id)})
+        membership_cache.invalidate_group(group_id)
+        identity_map.evict_where('membership', lambda key, _: key[0] == str(group_id))
+        return result.deleted_count
+
+    @staticmethod
+    def migrate_from_arrays(batch_size=500):
+        """
+        Copy legacy groups.members/admins arrays into memberships
+
+        Runs in batches and is safe to interrupt: each group's memberships
+        are upserted before its arrays are removed, so a restart picks up
+        where the last run stopped and never loses a member. Batches walk
+        the groups in _id order, so one run reads the collection once.
+        Once no group has arrays left, a job_state marker skips the scan on
+        later starts and the legacy members index is dropped. Concurrent
+        runs (one per worker) are safe: the upserts only insert. Reads fall
+        back to the arrays until then (see legacy_reads), and each batch
+        drops its groups from this worker's membership cache.
+
+        Returns:
+            int: Number of groups migrated
+        """
+        if not Membership.migration_pending():
+            return 0
+
+        migrated = 0
+        last_id = None
+        while True:
+            query = {'members': {'$exists': True}}
+            if last_id is not None:
+                query['_id'] = {'$gt': last_id}
+            groups = list(utils.db.groups_collection.find(
+                query, {'members': 1, 'admins': 1, 'created_by': 1, 'created_at': 1}
+            ).sort('_id', 1).limit(batch_size))
+            if not groups:
+                break
+            last_id = groups[-1]['_id']
+
+            requests = []
+            for group in groups:
+                for user_id in set(group.get('members', [])):
+                    requests.append(UpdateOne(
+                        {'group_id': group['_id'], 'user_id': user_id},
+                        {'$setOnInsert': {
+                            'role': _role_from_arrays(group, user_id),
+                            'joined_at': group.get('created_at')
+                        }},
+                        upsert=True
+                    ))
+            if requests:
+                utils.db.memberships_collection.bulk_write(requests, ordered=False)
+            for group in groups:
+                membership_cache.invalidate_group(group['_id'])
+            utils.db.groups_collection.update_many(
+                {'_id': {'$in': [g['_id'] for g in groups]}},
+                {'$unset': {'members': '', 'admins': ''}}
+            )
+            migrated += len(groups)
+
+        utils.db.job_state_collection.update_one(
+            {'_id': MIGRATION_ID},
+            {'$set': {'done': True, 'finished_at': datetime.utcnow()}},
+            upsert=True
+        )
+        _migration.update(pending=False, checked_at=time.monotonic())
+        if MEMBERS_INDEX in utils.db.groups_collection.index_information():
+            utils.db.groups_collection.drop_index(MEMBERS_INDEX)
+        return migrated
+
+    @staticmethod
+    def migration_pending():
+        """True until migrate_from_arrays has finished once"""
+        pending = not utils.db.job_state_collection.find_one({'_id': MIGRATION_ID, 'done': True})
+        _migration.update(pending=pending, checked_at=time.monotonic())
+        return pending
+
+    @staticmethod
+    def legacy_reads():
+        """
+        True if reads must also consult the legacy arrays
+
+        Checked against job_state at most every MIGRATION_CHECK_INTERVAL
+        seconds while the migration is pending; once it has finished the
+        answer never changes, so the worker stops asking.
+        """
+        checked_at = _migration['checked_at']
+        if not _migration['pending']:
+            return False
+        if checked_at is None or time.monotonic() - checked_at >= MIGRATION_CHECK_INTERVAL:
+            return Membership.migration_pending()
+        return True
@@ -4,6 +4,12 @@ Rating model - user ratings for items
 from utils.db import ratings_collection
 from bson import ObjectId
 from datetime import datetime
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+# Server code for a duplicate key; in create_or_update_many it means the
+# rating was changed since the previous scores were read
+DUPLICATE_KEY = 11000
 
 
 class Rating:
@@ -12,7 +18,10 @@ class Rating:
     @staticmethod
     def create_or_update(user_id, group_id, item_id, score):
         """
-        Create or update a rating
+        Create or update a rating in a single upsert
+        
+        The previous document is returned by the same round trip, so the
+        old score is known without a separate lookup.
         
         Args:
             user_id (str): User ID
@@ -23,38 +32,116 @@ class Rating:
         Returns:
             tuple: (old_score, new_score) - old_score is None if creating new
         """
-        # Check if rating exists
-        existing = ratings_collection.find_one({
+        now = datetime.utcnow()
+        query = {
             'user_id': ObjectId(user_id),
             'item_id': ObjectId(item_id),
             'group_id': ObjectId(group_id)
+        }
+        previous = Rating._upsert(query, {
+            '$set': {'score': score, 'updated_at': now},
+            '$setOnInsert': {'created_at': now}
         })
         
-        if existing:
-            # Update existing rating
-            old_score = existing['score']
-            ratings_collection.update_one(
-                {'_id': existing['_id']},
-                {
-                    '$set': {
-                        'score': score,
-                        'updated_at': datetime.utcnow()
-                    }
-                }
-            )
-            return old_score, score
-        else:
-            # Create new rating
-            rating = {
-                'user_id': ObjectId(user_id),
-                'group_id': ObjectId(group_id),
-                'item_id': ObjectId(item_id),
-                'score': score,
-                'created_at': datetime.utcnow(),
-                'updated_at': datetime.utcnow()  # ← ADD THIS
+        # The item stats write (or the write-behind flush) reports the change
+        return previous['score'] if previous else None, score
+    
+    @staticmethod
+    def create_or_update_many(user_id, group_id, scores):
+        """
+        Create or update several ratings by one user in one group
+        
+        Uses one read for the previous scores and one bulk_write for the
+        upserts, regardless of how many items are rated. Each upsert only
+        applies if the rating still has the score that was read (or still
+        doesn't exist), so a concurrent rate of the same item can't make
+        both writers count the same change. A rating that changed in
+        between fails with a duplicate key on the unique index and is
+        redone with the single-item upsert, which returns its true previous
+        score.
+        
+        Args:
+            user_id (str): User ID
+            group_id (str): Group ID
+            scores (dict): Map of item_id (str) -> score (int)
+            
+        Returns:
+            dict: Map of item_id -> (old_score, new_score)
+        """
+        if not scores:
+            return {}
+        
+        user_oid = ObjectId(user_id)
+        group_oid = ObjectId(group_id)
+        existing = ratings_collection.find(
+            {
+                'user_id': user_oid,
+                'group_id': group_oid,
+                'item_id': {'$in': [ObjectId(i) for i in scores]}
+            },
+            {'item_id': 1, 'score': 1}
+        )
+        old_scores = {str(r['item_id']): r['score'] for r in existing}
+        
+        now = datetime.utcnow()
+        def update(score):
+            return {
+                '$set': {'score': score, 'updated_at': now},
+                '$setOnInsert': {'created_at': now}
             }
-            ratings_collection.insert_one(rating)
-            return None, score
+        
+        item_ids = list(scores)
+        try:
+            ratings_collection.bulk_write([
+                UpdateOne(
+                    {
+                        'user_id': user_oid, 'item_id': ObjectId(item_id), 'group_id': group_oid,
+                        'score': old_scores.get(item_id)
+                    },
+                    update(scores[item_id]),
+                    upsert=True
+                )
+                for item_id in item_ids
+            ], ordered=False)
+            conflicts = []
+        except BulkWriteError as e:
+            errors = e.details.get('writeErrors', [])
+            if any(error['code'] != DUPLICATE_KEY for error in errors):
+                raise
+            conflicts = [item_ids[error['index']] for error in errors]
+        
+        changes = {
+            item_id: (old_scores.get(item_id), score)
+            for item_id, score in scores.items()
+        }
+        for item_id in conflicts:
+            previous = Rating._upsert(
+                {'user_id': user_oid, 'item_id': ObjectId(item_id), 'group_id': group_oid},
+                update(scores[item_id])
+            )
+            changes[item_id] = (previous['score'] if previous else None, scores[item_id])
+        return changes
+    
+    @staticmethod
+    def _upsert(query, update):
+        """
+        Upsert one rating and return the document as it was before
+        
+        Returns:
+            dict or None: Previous rating, None if it was just created
+        """
+        try:
+            return ratings_collection.find_one_and_update(
+                query, update, upsert=True,
+                return_document=ReturnDocument.BEFORE
+            )
+        except DuplicateKeyError:
+            # Two concurrent upserts raced on the unique index; the loser
+            # retries and now sees the winner's document.
+            return ratings_collection.find_one_and_update(
+                query, update, upsert=True,
+                return_document=ReturnDocument.BEFORE
+            )
     
     @staticmethod
     def get_user_rating(user_id, item_id):
@@ -74,27 +161,70 @@ class Rating:
         })
     
     @staticmethod
-    def get_user_ratings_for_group(user_id, group_id):
+    def last_rated_at(user_id, group_id):
+        """
+        Get when a user last rated anything in a group
+        
+        Returns:
+            datetime or None: Latest updated_at, None if they never rated
+        """
+        rating = ratings_collection.find_one(
+            {'user_id': ObjectId(user_id), 'group_id': ObjectId(group_id)},
+            {'_id': 0, 'updated_at': 1},
+            sort=[('updated_at', -1)]
+        )
+        return rating.get('updated_at') if rating else None
+    
+    @staticmethod
+    def get_user_ratings_for_group(user_id, group_id, item_ids=None):
         """
         Get all user's ratings for items in a group
         
         Args:
             user_id (str): User ID
             group_id (str): Group ID
+            item_ids (list, optional): Only these items (e.g. one page)
             
         Returns:
             dict: Map of item_id -> rating
         """
-        ratings = ratings_collection.find({
+        query = {
             'user_id': ObjectId(user_id),
             'group_id': ObjectId(group_id)
-        })
+        }
+        if item_ids is not None:
+            query['item_id'] = {'$in': [ObjectId(i) for i in item_ids]}
+        ratings = ratings_collection.find(query)
         
         return {
             str(r['item_id']): r
             for r in ratings
         }
     
+    @staticmethod
+    def count_by_groups(user_id, group_ids):
+        """
+        Count a user's ratings in several groups with one aggregation
+
+        Args:
+            user_id (str): User ID
+            group_ids (list): Group IDs (str or ObjectId)
+
+        Returns:
+            dict: Map of group_id (str) -> number of items the user rated
+        """
+        pipeline = [
+            {'$match': {
+                'user_id': ObjectId(user_id),
+                'group_id': {'$in': [ObjectId(g) for g in group_ids]}
+            }},
+            {'$group': {'_id': '$group_id', 'count': {'$sum': 1}}}
+        ]
+        return {
+            str(row['_id']): row['count']
+            for row in ratings_collection.aggregate(pipeline)
+        }
+
     @staticmethod
     def delete_by_item(item_id):
         """Delete all ratings for an item (when item is deleted)"""
@@ -3,6 +3,7 @@ User model with Flask-Login integration
 """
 from flask_login import UserMixin
 from utils.db import users_collection
+from utils.identity import identity_map
 from bson import ObjectId
 from bson.errors import InvalidId
 import bcrypt
@@ -78,15 +79,20 @@ class User(UserMixin):
     
     @staticmethod
     def find_by_id(user_id):
-        """Find user by ID - Required by Flask-Login"""
+        """Find user by ID - Required by Flask-Login (one read per request)"""
         try:
             if isinstance(user_id, str):
                 user_id = ObjectId(user_id)
-            user_data = users_collection.find_one({'_id': user_id})
-            return User(user_data) if user_data else None
+            return identity_map.get('user', str(user_id), lambda: User._load(user_id))
         except (InvalidId, TypeError):
             return None
     
+    @staticmethod
+    def _load(user_id):
+        """Read a user document by ObjectId"""
+        user_data = users_collection.find_one({'_id': user_id})
+        return User(user_data) if user_data else None
+    
     @staticmethod
     def find_by_email(email):
         """Find user by email"""
@@ -7,7 +7,13 @@ from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
 from models.group import Group
 from models.item import Item
+from models.membership import Membership
+from models.rating import Rating
+from routes.ratings import leaderboard_rows
 from utils.validators import sanitize_input
+from utils.conditional import conditional_on_group
+from utils.pagination import parse_limit
+from utils.suggest import group_suggestions
 import utils.db
 from bson import ObjectId
 
@@ -17,16 +23,71 @@ groups_bp = Blueprint('groups', __name__)
 # 🟢 Get ALL groups (Discover page)
 @groups_bp.route('/groups', methods=['GET'])
 def get_all_groups():
+    """
+    List or search groups, one page at a time
+    
+    Frontend: discover.html
+    Request: GET /api/groups?q=&sort=popular|new|name&limit=20&after=<cursor>
+    
+    total is an approximate count of all groups (null when searching).
+    """
     try:
-        groups = Group.get_all(search=request.args.get('q'))
+        sort = request.args.get('sort', 'popular')
+        if sort not in Group.SORTS:
+            return jsonify({'error': 'sort must be popular, new or name'}), 400
+        try:
+            limit = parse_limit(request.args.get('limit'), default=20)
+        except ValueError:
+            return jsonify({'error': 'limit must be a positive integer'}), 400
+        
+        search = request.args.get('q')
+        try:
+            groups, next_cursor = Group.get_page(search, sort, limit, request.args.get('after'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         user_id = current_user.id if current_user.is_authenticated else None
-        result = [Group.to_dict(g, user_id) for g in groups]
-        return jsonify({'groups': result}), 200
+        result = Group.to_dict_many(groups, user_id)
+        return jsonify({
+            'groups': result,
+            'next_cursor': next_cursor,
+            'total': None if (search or '').strip() else Group.approximate_count()
+        }), 200
     except Exception as e:
         print(f"Get all groups error: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
 
+# 🟢 Group name autocomplete (Discover search box)
+@groups_bp.route('/groups/suggest', methods=['GET'])
+def suggest_groups():
+    """
+    Suggest groups whose name starts with the typed text
+
+    Frontend: discover.html
+    Request: GET /api/groups/suggest?prefix=bes&limit=8
+
+    Served from the in-process prefix index (utils.suggest), largest
+    groups first, without a database round trip.
+    """
+    try:
+        if not group_suggestions.enabled:
+            return jsonify({'error': 'Suggestions are disabled'}), 503
+        try:
+            limit = parse_limit(request.args.get('limit'), default=8, maximum=20)
+        except ValueError:
+            return jsonify({'error': 'limit must be a positive integer'}), 400
+
+        matches = group_suggestions.suggest(request.args.get('prefix', ''), limit)
+        return jsonify({'suggestions': [
+            {'id': group_id, 'name': name, 'member_count': member_count}
+            for group_id, name, member_count in matches
+        ]}), 200
+    except Exception as e:
+        print(f"Suggest groups error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
 # 🟢 Create a new group
 @groups_bp.route('/groups', methods=['POST'])
 @login_required
@@ -55,6 +116,7 @@ def create_group():
 
 # 🟢 Get one group by ID
 @groups_bp.route('/groups/<group_id>', methods=['GET'])
+@conditional_on_group
 def get_group(group_id):
     try:
         group = Group.find_by_id(group_id)
@@ -68,6 +130,56 @@ def get_group(group_id):
         return jsonify({'error': 'Invalid group ID'}), 400
 
 
+# 🟢 Everything group.html needs on first load
+@groups_bp.route('/groups/<group_id>/bootstrap', methods=['GET'])
+@login_required
+def get_group_bootstrap(group_id):
+    """
+    Get the current user, group, first leaderboard page and my ratings
+    
+    Frontend: group.html (replaces /auth/me + /groups/:id + /leaderboard)
+    Request: GET /api/groups/:id/bootstrap?sort=rating|score&limit=50
+    
+    The reads don't grow with the group: the group (via the identity map),
+    the user's role for Group.to_dict (usually from the membership cache),
+    one leaderboard page (from the leaderboard cache, or one keyset query
+    on a miss; first-page ranks start at 1, so no rank query) and the
+    user's ratings in the group. Later pages come from
+    /leaderboard?after=<next_cursor>.
+    """
+    try:
+        sort = request.args.get('sort', 'rating')
+        if sort not in ('rating', 'score'):
+            return jsonify({'error': 'sort must be rating or score'}), 400
+        try:
+            limit = parse_limit(request.args.get('limit'), default=50)
+        except ValueError:
+            return jsonify({'error': 'limit must be a positive integer'}), 400
+        
+        group = Group.find_by_id(group_id)
+        if not group:
+            return jsonify({'error': 'Group not found'}), 404
+        
+        version = group.get('version', 0)
+        rows, next_cursor = leaderboard_rows(group_id, version, sort, limit, None, False)
+        my_ratings = {
+            item_id: rating['score']
+            for item_id, rating in Rating.get_user_ratings_for_group(current_user.id, group_id).items()
+        }
+        
+        return jsonify({
+            'user': current_user.to_dict(),
+            'group': Group.to_dict(group, current_user.id),
+            'version': version,
+            'leaderboard': [dict(row, user_rating=my_ratings.get(row['id'])) for row in rows],
+            'next_cursor': next_cursor,
+            'my_ratings': my_ratings
+        }), 200
+    except Exception as e:
+        print(f"Group bootstrap error: {e}")
+        return jsonify({'error': 'Invalid group ID'}), 400
+
+
 # 🟢 Delete group (Creator Only)
 @groups_bp.route('/groups/<group_id>', methods=['DELETE'])
 @login_required
@@ -92,12 +204,12 @@ def delete_group(group_id):
 @login_required
 def join_group(group_id):
     try:
-        if Group.is_member(group_id, current_user.id):
+        # One conditional write; only a refused join needs a second look
+        if not Group.add_member(group_id, current_user.id):
+            if not Group.find_by_id(group_id):
+                return jsonify({'error': 'Group not found'}), 404
             return jsonify({'error': 'Already a member'}), 400
 
-        Group.add_member(group_id, current_user.id)
-        current_user.update_groups(group_id, 'add')
-
         return jsonify({'message': 'Joined group successfully'}), 200
     except Exception as e:
         print(f"Join group error: {e}")
@@ -109,12 +221,9 @@ def join_group(group_id):
 @login_required
 def leave_group(group_id):
     try:
-        if not Group.is_member(group_id, current_user.id):
+        if not Group.remove_member(group_id, current_user.id):
             return jsonify({'error': 'Not a member'}), 400
 
-        Group.remove_member(group_id, current_user.id)
-        current_user.update_groups(group_id, 'remove')
-
         return jsonify({'message': 'Left group successfully'}), 200
     except ValueError as e:
         return jsonify({'error': str(e)}), 403
@@ -129,12 +238,62 @@ def leave_group(group_id):
 def get_my_groups():
     try:
         groups = Group.get_user_groups(current_user.id)
-        result = [Group.to_dict(g, current_user.id) for g in groups]
+        result = Group.to_dict_many(groups, current_user.id)
         return jsonify({'groups': result}), 200
     except Exception as e:
         print(f"Get my groups error: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+
+# Groups summarized per aggregation on the dashboard
+DASHBOARD_BATCH = 100
+
+
+# 🟢 My groups with their top items (Home page)
+@groups_bp.route('/me/dashboard', methods=['GET'])
+@login_required
+def get_my_dashboard():
+    """
+    Get my groups, each with its top items, item count and my unrated count
+
+    Frontend: home.html
+    Request: GET /api/me/dashboard
+
+    One query for the groups (which carry their item_count), then per
+    DASHBOARD_BATCH groups one aggregation for the top items, one for my
+    ratings and one membership lookup, all $in on group_id, instead of a
+    leaderboard fetch per group.
+    """
+    try:
+        groups = Group.get_user_groups(current_user.id)
+        top_items, rated, roles = {}, {}, {}
+        for start in range(0, len(groups), DASHBOARD_BATCH):
+            group_ids = [g['_id'] for g in groups[start:start + DASHBOARD_BATCH]]
+            top_items.update(Item.top_by_groups(group_ids, top=3))
+            rated.update(Rating.count_by_groups(current_user.id, group_ids))
+            roles.update(Membership.get_roles(current_user.id, group_ids))
+
+        result = []
+        for group in groups:
+            group_id = str(group['_id'])
+            group_dict = Group.to_dict(group, current_user.id, roles)
+            group_dict['unrated_count'] = max(group_dict['item_count'] - rated.get(group_id, 0), 0)
+            group_dict['top_items'] = [
+                {
+                    'id': str(item['_id']),
+                    'name': item['name'],
+                    'avg_rating': round(item.get('avg_rating') or 0, 2),
+                    'rating_count': item.get('rating_count') or 0
+                }
+                for item in top_items.get(group_id, [])
+            ]
+            result.append(group_dict)
+
+        return jsonify({'groups': result}), 200
+    except Exception as e:
+        print(f"Get dashboard error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @groups_bp.route('/groups/<group_id>/members/<user_id>', methods=['DELETE'])
 @login_required
 def kick_member(group_id, user_id):
@@ -148,14 +307,9 @@ def kick_member(group_id, user_id):
         if not Group.is_admin(group_id, current_user.id):
             return jsonify({'error': 'Only group admins can kick members'}), 403
         
-        # Kick the member
-        Group.kick_member(group_id, user_id, current_user.id)
-        
-        # Update user's groups list
-        from models.user import User
-        user = User.find_by_id(user_id)
-        if user:
-            user.update_groups(group_id, 'remove')
+        # Kick the member (also removes the group from their groups_joined)
+        if not Group.kick_member(group_id, user_id, current_user.id):
+            return jsonify({'error': 'Not a member'}), 404
         
         return jsonify({'message': 'Member kicked successfully'}), 200
         
@@ -201,6 +355,7 @@ def update_item(group_id, item_id):
             {"_id": ObjectId(item_id)},
             {"$set": {"name": name, "description": description}}
         )
+        Group.mark_changed(group_id, item_ids=[item_id])
 
         return jsonify({"message": "Item updated successfully"}), 200
 
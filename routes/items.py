@@ -9,6 +9,10 @@ from models.rating import Rating
 from utils.validators import sanitize_input
 from models.rating import Rating # 🟢 ADD THIS
 from utils.validators import validate_rating # 🟢 ADD THIS
+from utils.validators import parse_bool
+from utils.pagination import parse_limit
+from utils.rating_buffer import rating_buffer
+from utils.conditional import conditional_on_group
 
 items_bp = Blueprint('items', __name__)
 
@@ -24,6 +28,9 @@ def add_item(group_id):
     Body: {name, description}
     """
     try:
+        if not Group.find_by_id(group_id):
+            return jsonify({'error': 'Group not found'}), 404
+        
         # Check membership
         if not Group.is_member(group_id, current_user.id):
             return jsonify({'error': 'Must be a group member to add items'}), 403
@@ -39,6 +46,8 @@ def add_item(group_id):
         
         # Create item
         item = Item.create(group_id, name, description, current_user.id)
+        if item is None:
+            return jsonify({'error': 'Group not found'}), 404
         
         return jsonify({
             'message': 'Item added successfully',
@@ -52,33 +61,55 @@ def add_item(group_id):
 
 
 @items_bp.route('/groups/<group_id>/items', methods=['GET'])
+@conditional_on_group
 def get_group_items(group_id):
     """
     Get all items in a group (leaderboard)
     
     Frontend: group.html
-    Request: GET /api/groups/:id/items?sort=rating
+    Request: GET /api/groups/:id/items?sort=rating&histogram=1&limit=50&after=<cursor>
+    
+    Without limit/after every item is returned; with them the response is
+    one page plus next_cursor.
     """
     try:
-        sort = request.args.get('sort', 'rating')  # rating, new, name
+        sort = request.args.get('sort', 'rating')  # rating, score, new
+        include_histogram = parse_bool(request.args.get('histogram'))
+        after = request.args.get('after')
+        try:
+            limit = parse_limit(request.args.get('limit'), default=50 if after else None)
+        except ValueError:
+            return jsonify({'error': 'limit must be a positive integer'}), 400
         
-        items = Item.get_by_group(group_id, sort)
+        next_cursor = None
+        first_rank = 1
+        if limit:
+            try:
+                items, first_rank, next_cursor = Item.get_page(group_id, sort, limit, after)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        else:
+            items = Item.get_by_group(group_id, sort)
         
         # Get user's ratings if logged in
         user_ratings = {}
         if current_user.is_authenticated:
-            user_ratings = Rating.get_user_ratings_for_group(current_user.id, group_id)
+            user_ratings = Rating.get_user_ratings_for_group(
+                current_user.id, group_id,
+                item_ids=[i['_id'] for i in items] if limit else None
+            )
         
         result = []
-        for idx, item in enumerate(items, 1):
+        for idx, item in enumerate(items, first_rank):
             item_dict = Item.to_dict(
                 item, 
-                user_ratings.get(str(item['_id']))
+                user_ratings.get(str(item['_id'])),
+                include_histogram=include_histogram
             )
             item_dict['rank'] = idx  # Add ranking position
             result.append(item_dict)
         
-        return jsonify({'items': result}), 200
+        return jsonify({'items': result, 'next_cursor': next_cursor}), 200
         
     except Exception as e:
         print(f"Get items error: {e}")
@@ -90,12 +121,13 @@ def get_item(item_id):
     """
     Get single item details
     
-    Request: GET /api/items/:id
+    Request: GET /api/items/:id?histogram=1
     """
     try:
         item = Item.find_by_id(item_id)
         
-        if not item:
+        # Items of a deleted group are hidden until the cleanup removes them
+        if not item or not Group.find_by_id(item['group_id']):
             return jsonify({'error': 'Item not found'}), 404
         
         # Get user's rating if logged in
@@ -103,13 +135,60 @@ def get_item(item_id):
         if current_user.is_authenticated:
             user_rating = Rating.get_user_rating(current_user.id, item_id)
         
-        return jsonify({'item': Item.to_dict(item, user_rating)}), 200
+        include_histogram = parse_bool(request.args.get('histogram'))
+        return jsonify({
+            'item': Item.to_dict(item, user_rating, include_histogram=include_histogram)
+        }), 200
         
     except Exception as e:
         print(f"Get item error: {e}")
         return jsonify({'error': 'Invalid item ID'}), 400
 
 
+@items_bp.route('/items/<item_id>/rank', methods=['GET'])
+def get_item_rank(item_id):
+    """
+    Get an item's leaderboard position without loading the leaderboard
+    
+    Request: GET /api/items/:id/rank?sort=rating|score|new&neighbors=3
+    """
+    try:
+        sort = request.args.get('sort', 'rating')
+        if sort not in Item.SORTS:
+            return jsonify({'error': 'sort must be rating, score or new'}), 400
+        try:
+            neighbors = parse_limit(request.args.get('neighbors'), default=0, maximum=10, minimum=0)
+        except ValueError:
+            return jsonify({'error': 'neighbors must be a non-negative integer'}), 400
+        
+        item = Item.find_by_id(item_id)
+        if not item or not Group.find_by_id(item['group_id']):
+            return jsonify({'error': 'Item not found'}), 404
+        
+        rank, above, below = Item.get_rank(item, sort, neighbors)
+        
+        def ranked(docs, first_rank):
+            result = []
+            for offset, doc in enumerate(docs):
+                doc_dict = Item.to_dict(doc)
+                doc_dict['rank'] = first_rank + offset
+                result.append(doc_dict)
+            return result
+        
+        return jsonify({
+            'item_id': item_id,
+            'group_id': str(item['group_id']),
+            'sort': sort,
+            'rank': rank,
+            'above': ranked(above, rank - len(above)),
+            'below': ranked(below, rank + 1)
+        }), 200
+        
+    except Exception as e:
+        print(f"Get item rank error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
 @items_bp.route('/items/<item_id>', methods=['DELETE'])
 @login_required
 def delete_item(item_id):
@@ -120,7 +199,7 @@ def delete_item(item_id):
     """
     try:
         item = Item.find_by_id(item_id)
-        if not item:
+        if not item or not Group.find_by_id(item['group_id']):
             return jsonify({'error': 'Item not found'}), 404
         
         # Check if user is admin of the group
@@ -161,7 +240,7 @@ def rate_item(item_id):
 
         # Get item
         item = Item.find_by_id(item_id)
-        if not item:
+        if not item or not Group.find_by_id(item['group_id']):
             return jsonify({'error': 'Item not found'}), 404
 
         group_id = str(item['group_id'])
@@ -170,21 +249,22 @@ def rate_item(item_id):
         if not Group.is_member(group_id, current_user.id):
             return jsonify({'error': 'Must be a group member to rate items'}), 403
 
-        # Create or update rating
-        old_score, new_score = Rating.create_or_update(
-            current_user.id, group_id, item_id, score
-        )
-
-        # Update item's overall stats
-        Item.update_rating_stats(item_id, old_score, new_score)
+        # Create or update rating (single upsert, returns previous score).
+        # The group's version is bumped once, by the stats write below or,
+        # if the stats are buffered, by the flush.
+        old_score, new_score = Rating.create_or_update(current_user.id, group_id, item_id, score)
 
-        # Return updated item
-        updated_item = Item.find_by_id(item_id)
-        user_rating = Rating.get_user_rating(current_user.id, item_id)
+        # Update item's overall stats; the write returns the updated item
+        if old_score == new_score:
+            updated_item = item
+        elif rating_buffer.add(item_id, old_score, new_score, group_id):
+            updated_item = rating_buffer.overlay(item)
+        else:
+            updated_item = Item.update_rating_stats(item_id, old_score, new_score)
 
         return jsonify({
             'message': 'Rating submitted successfully',
-            'item': Item.to_dict(updated_item, user_rating)
+            'item': Item.to_dict(updated_item, {'score': new_score})
         }), 200
 
     except Exception as e:
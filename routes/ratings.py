@@ -1,46 +1,311 @@
 """
 Rating routes - rate items with stars
 """
-from flask import Blueprint, request, jsonify
+import queue
+
+from flask import Blueprint, Response, request, jsonify, g
 from flask_login import login_required, current_user
 from models.rating import Rating
 from models.item import Item
 from models.group import Group
-from utils.validators import validate_rating
+from models.group_change import GroupChange
+from utils.validators import validate_rating, parse_bool
+from utils.rating_buffer import rating_buffer
+from utils.pagination import parse_limit
+from utils.cache import leaderboard_cache
+from utils.conditional import conditional_on_group
+from utils.events import leaderboard_events
+from bson import ObjectId
 
 ratings_bp = Blueprint('ratings', __name__)
 
+# Upper bound on ratings accepted by one batch request
+MAX_BATCH_RATINGS = 100
 
-# routes/ratings.py
+# Largest leaderboard response kept in leaderboard_cache. Pages are at most
+# parse_limit's maximum; whole leaderboards of bigger groups are rebuilt on
+# each read, so the cache's memory stays within max_entries * this many rows.
+MAX_CACHED_ROWS = 100
+
+
+def leaderboard_rows(group_id, version, sort, limit, after, include_histogram):
+    """
+    Serialized leaderboard rows without user_rating, plus next_cursor
+    
+    Rows are shared by every viewer, so they are cached per group until
+    Group.mark_changed() drops them. Keys include the group version, so
+    writes made by other worker processes are picked up on the next read.
+    Responses over MAX_CACHED_ROWS rows are not cached.
+    Callers must copy rows before adding per-user fields.
+    
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    key = (group_id, version, sort, limit, after, include_histogram)
+    cached = leaderboard_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    generation = leaderboard_cache.generation(group_id)
+    # Both sorts put unrated items (avg_rating/rank_score 0.0) at the bottom.
+    next_cursor = None
+    first_rank = 1
+    if limit:
+        items, first_rank, next_cursor = Item.get_page(group_id, sort, limit, after)
+    else:
+        items = Item.get_by_group(group_id, sort=sort)
+    
+    rows = []
+    # 🟢 FIX: NO FILTER! We show all items, letting the sort order handle placement.
+    for rank, item in enumerate(items, first_rank):
+        item_dict = Item.to_dict(item, include_histogram=include_histogram)
+        item_dict['rank'] = rank
+        rows.append(item_dict)
+    
+    if len(rows) <= MAX_CACHED_ROWS:
+        leaderboard_cache.set(key, (rows, next_cursor), tag=group_id, generation=generation)
+    return rows, next_cursor
 
-# ... (rest of the file content)
 
 @ratings_bp.route('/groups/<group_id>/leaderboard', methods=['GET'])
+@conditional_on_group
 def get_leaderboard(group_id):
     """
     Get group leaderboard (sorted by rating)
     
     Frontend: group.html (default view)
-    Request: GET /api/groups/:id/leaderboard
+    Request: GET /api/groups/:id/leaderboard?sort=rating|score&histogram=1&limit=50&after=<cursor>
+    
+    Without limit/after the whole leaderboard is returned; with them the
+    response is one page plus next_cursor, and ranks continue across pages.
     """
     try:
-        # Item.get_by_group sorts by 'rating' which puts unrated items (avg_rating 0.0) at the bottom.
-        items = Item.get_by_group(group_id, sort='rating')
+        sort = request.args.get('sort', 'rating')
+        if sort not in ('rating', 'score'):
+            return jsonify({'error': 'sort must be rating or score'}), 400
+        include_histogram = parse_bool(request.args.get('histogram'))
+        after = request.args.get('after')
+        try:
+            limit = parse_limit(request.args.get('limit'), default=50 if after else None)
+        except ValueError:
+            return jsonify({'error': 'limit must be a positive integer'}), 400
+        
+        try:
+            rows, next_cursor = leaderboard_rows(
+                group_id, g.get('group_version'), sort, limit, after, include_histogram
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Get user's ratings if logged in
         user_ratings = {}
         if current_user.is_authenticated:
-            user_ratings = Rating.get_user_ratings_for_group(current_user.id, group_id)
+            user_ratings = Rating.get_user_ratings_for_group(
+                current_user.id, group_id,
+                item_ids=[row['id'] for row in rows] if limit else None
+            )
         
         leaderboard = []
-        # 🟢 FIX: NO FILTER! We show all items, letting the sort order handle placement.
-        for rank, item in enumerate(items, 1):
-            item_dict = Item.to_dict(item, user_ratings.get(str(item['_id'])))
-            item_dict['rank'] = rank
-            leaderboard.append(item_dict)
+        for row in rows:
+            rating = user_ratings.get(row['id'])
+            leaderboard.append(dict(row, user_rating=rating['score'] if rating else None))
         
-        return jsonify({'leaderboard': leaderboard}), 200
+        return jsonify({
+            'leaderboard': leaderboard,
+            'next_cursor': next_cursor,
+            'version': g.get('group_version')
+        }), 200
         
     except Exception as e:
         print(f"Get leaderboard error: {e}")
-        return jsonify({'error': 'Internal server error'}), 500
\ No newline at end of file
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@ratings_bp.route('/groups/<group_id>/changes', methods=['GET'])
+def get_changes(group_id):
+    """
+    Get the items that changed since a group version (delta sync)
+    
+    Request: GET /api/groups/:id/changes?since=<version>
+    Response: {version, items, deleted, has_more, resync}
+    
+    Start from the version of a full leaderboard fetch, then pass each
+    response's version back as `since`. `items` holds items created or
+    updated (stats or name), `deleted` the IDs of removed items. When the
+    change log no longer covers `since`, resync is true and the client
+    must refetch the leaderboard.
+    """
+    try:
+        try:
+            since = int(request.args['since'])
+        except (KeyError, ValueError):
+            return jsonify({'error': 'since must be a version number'}), 400
+        
+        version = Group.get_version(group_id)
+        if version is None:
+            return jsonify({'error': 'Group not found'}), 404
+        
+        entries = GroupChange.since(group_id, since) if since <= version else None
+        if entries is None or (since < version and not entries):
+            return jsonify({
+                'version': version, 'items': [], 'deleted': [],
+                'has_more': False, 'resync': True
+            }), 200
+        
+        updated_ids, deleted_ids = GroupChange.summarize(entries)
+        items = Item.find_many(updated_ids, group_id) if updated_ids else {}
+        synced_to = entries[-1]['version'] if entries else since
+        return jsonify({
+            'version': synced_to,
+            'items': [Item.to_dict(items[i]) for i in updated_ids if i in items],
+            'deleted': deleted_ids + [i for i in updated_ids if i not in items],
+            'has_more': synced_to < version,
+            'resync': False
+        }), 200
+        
+    except Exception as e:
+        print(f"Get changes error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@ratings_bp.route('/groups/<group_id>/leaderboard/stream', methods=['GET'])
+def stream_leaderboard(group_id):
+    """
+    Stream leaderboard changes as Server-Sent Events
+    
+    Frontend: group.html (EventSource after the first leaderboard load)
+    Request: GET /api/groups/:id/leaderboard/stream?since=<version>
+    
+    Events: `update` with the changed items (stats, rank per sort) and
+    deleted item IDs; `resync` when the client should refetch the whole
+    leaderboard; `gone` when the group is deleted. Event IDs are group
+    versions, so a reconnecting EventSource resumes via Last-Event-ID and
+    is caught up from the change log.
+    """
+    if not leaderboard_events.enabled:
+        return jsonify({'error': 'Live updates are disabled'}), 503
+    
+    version = Group.get_version(group_id)
+    if version is None:
+        return jsonify({'error': 'Group not found'}), 404
+    
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        since = int(since) if since is not None else version
+    except ValueError:
+        return jsonify({'error': 'since must be a version number'}), 400
+    
+    subscriber = leaderboard_events.subscribe(group_id, version)
+    heartbeat = leaderboard_events.heartbeat_interval
+    
+    def events():
+        try:
+            yield f'retry: {int(heartbeat * 1000)}\n\n'
+            if since != version:
+                # Catch up from the change log (or resync if it is gone)
+                yield leaderboard_events.replay(group_id, since, version)
+            while True:
+                # A closed subscriber drains what is queued, then ends; the
+                # client reconnects with Last-Event-ID and is told to resync.
+                try:
+                    message = subscriber.queue.get(
+                        block=not subscriber.closed, timeout=heartbeat
+                    )
+                except queue.Empty:
+                    if subscriber.closed:
+                        break
+                    yield ': heartbeat\n\n'
+                    continue
+                if message is None:
+                    break
+                yield message
+        finally:
+            leaderboard_events.unsubscribe(subscriber)
+    
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+@ratings_bp.route('/groups/<group_id>/ratings/batch', methods=['POST'])
+@login_required
+def rate_items_batch(group_id):
+    """
+    Rate many items in a group at once
+    
+    Request: POST /api/groups/:id/ratings/batch
+    Body: {ratings: [{item_id, score: 1-5}, ...]}
+    
+    Valid entries are applied together; invalid ones are reported per item.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        entries = data.get('ratings')
+        
+        if not isinstance(entries, list) or not entries:
+            return jsonify({'error': 'ratings must be a non-empty list'}), 400
+        if len(entries) > MAX_BATCH_RATINGS:
+            return jsonify({'error': f'At most {MAX_BATCH_RATINGS} ratings per batch'}), 400
+        
+        if not Group.find_by_id(group_id):
+            return jsonify({'error': 'Group not found'}), 404
+        if not Group.is_member(group_id, current_user.id):
+            return jsonify({'error': 'Must be a group member to rate items'}), 403
+        
+        # Validate entries; later entries for the same item win
+        scores = {}
+        errors = {}
+        for entry in entries:
+            item_id = str(entry.get('item_id', '')) if isinstance(entry, dict) else ''
+            score = entry.get('score') if isinstance(entry, dict) else None
+            if not ObjectId.is_valid(item_id):
+                errors[item_id] = 'Invalid item ID'
+            elif not validate_rating(score):
+                errors[item_id] = 'Rating must be between 1 and 5'
+            else:
+                scores[item_id] = int(score)
+                errors.pop(item_id, None)
+        
+        # Only items that belong to this group may be rated
+        items = Item.find_many(list(scores), group_id) if scores else {}
+        for item_id in list(scores):
+            if item_id not in items:
+                del scores[item_id]
+                errors[item_id] = 'Item not found'
+        
+        # The stats write below (or the buffer's flush) bumps the group's version
+        changes = Rating.create_or_update_many(current_user.id, group_id, scores)
+        through = {}
+        for item_id, (old_score, new_score) in changes.items():
+            if old_score != new_score and not rating_buffer.add(item_id, old_score, new_score, group_id):
+                through[item_id] = (old_score, new_score)
+        Item.apply_rating_changes(through, group_id)
+        updated = {
+            item_id: rating_buffer.overlay(items[item_id])
+            for item_id in changes if item_id not in through
+        }
+        if through:
+            updated.update(Item.find_many(list(through)))
+        results = []
+        for item_id, (old_score, new_score) in changes.items():
+            if item_id not in updated:
+                # Deleted since it was validated
+                results.append({'item_id': item_id, 'status': 'error', 'error': 'Item not found'})
+                continue
+            results.append({
+                'item_id': item_id,
+                'status': 'ok',
+                'item': Item.to_dict(updated[item_id], {'score': new_score})
+            })
+        for item_id, error in errors.items():
+            results.append({'item_id': item_id, 'status': 'error', 'error': error})
+        
+        return jsonify({
+            'message': f'{len(changes)} rating(s) submitted',
+            'results': results
+        }), 200
+        
+    except Exception as e:
+        print(f"Batch rate error: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
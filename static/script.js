@@ -24,6 +24,14 @@ const ITEMS_PER_PAGE = 10;
 
 let isGroupOwner = false;    // set per-group based on backend data
 
+let leaderboardVersion = null;  // group version of allGroupItems
+let leaderboardStream = null;   // EventSource for live updates
+
+const SEARCH_DEBOUNCE_MS = 250;
+let discoverTimer = null;       // pending debounced search
+let discoverRequest = null;     // AbortController of the in-flight search
+let suggestRequest = null;      // AbortController of the in-flight autocomplete
+
 
 /* -----------------------------------------------
    AUTH HELPERS
@@ -117,7 +125,6 @@ document.addEventListener("DOMContentLoaded", initPage);
 async function initPage() {
     console.log("Init page running…");
 
-    const user = await getCurrentUser();
     const path = window.location.pathname;
 
     // Normalize path (Flask static_url_path='' makes paths like '/home.html')
@@ -131,8 +138,11 @@ async function initPage() {
     const isGroup    = p === "group.html";
     const isCreate   = p === "create-group.html";
 
+    // The group page gets the user from its bootstrap request instead
+    const user = isGroup ? null : await getCurrentUser();
+
     // 1️⃣ Not logged in → block protected pages
-    if (!user && (isHome || isDiscover || isGroup || isCreate)) {
+    if (!user && (isHome || isDiscover || isCreate)) {
         console.log("Redirecting to login (not authenticated)");
         window.location.href = "login.html";
         return;
@@ -321,7 +331,8 @@ async function initHomePage() {
     if (!grid) return;
     renderSkeletonCards("my-groups-grid", 3);
 
-    const res = await fetch("/api/me/groups", { credentials: "include" });
+    // One request for every group card, including its top items
+    const res = await fetch("/api/me/dashboard", { credentials: "include" });
     if (!res.ok) {
         grid.innerHTML = "<p>No groups found.</p>";
         return;
@@ -369,6 +380,8 @@ async function initHomePage() {
             <p class="group-description">${g.description || "No description"}</p>
             <div class="group-card-footer">
                 <span class="member-badge">👥 ${g.member_count || 0} members</span>
+                <span class="member-badge">${g.item_count || 0} items</span>
+                ${g.unrated_count ? `<span class="member-badge unrated-badge">${g.unrated_count} to rate</span>` : ""}
                 <div class="group-card-buttons">
                     <button class="btn btn-primary" onclick="window.location.href='group.html?id=${g.id}'">
                         View Group →
@@ -377,11 +390,32 @@ async function initHomePage() {
                 </div>
             </div>
         `;
+        const topItems = renderTopItems(g.top_items || []);
+        if (topItems) card.querySelector(".group-description").after(topItems);
         grid.appendChild(card);
     }
 
 }
 
+// Built with textContent: item names are user input
+function renderTopItems(items) {
+    if (!items.length) return null;
+    const list = document.createElement("ol");
+    list.className = "top-items-list";
+    for (const item of items) {
+        const li = document.createElement("li");
+        const name = document.createElement("span");
+        name.className = "name";
+        name.textContent = item.name;
+        const stars = document.createElement("span");
+        stars.className = "stars";
+        stars.textContent = `⭐ ${item.avg_rating.toFixed(1)}`;
+        li.append(name, " ", stars);
+        list.appendChild(li);
+    }
+    return list;
+}
+
 /****************************************************
  * DISCOVER PAGE
  ****************************************************/
@@ -390,34 +424,96 @@ async function initDiscoverPage() {
     if (form) {
         form.addEventListener("submit", (e) => {
             e.preventDefault();
+            clearTimeout(discoverTimer);
             loadDiscover(form.q.value.trim());
         });
+        // Search as you type, once typing pauses
+        form.q.addEventListener("input", () => {
+            loadSuggestions(form.q.value.trim());
+            clearTimeout(discoverTimer);
+            discoverTimer = setTimeout(() => loadDiscover(form.q.value.trim()), SEARCH_DEBOUNCE_MS);
+        });
+        if (form.sort) form.sort.addEventListener("change", () => loadDiscover(form.q.value.trim()));
     }
     loadDiscover("");
 }
 
-async function loadDiscover(q) {
-    const grid = document.getElementById("discover-groups-grid");
-    if (!grid) return;
+async function loadSuggestions(prefix) {
+    const list = document.getElementById("group-suggestions");
+    if (!list) return;
 
-    // reset any empty-state layout and show skeletons
-    grid.classList.remove("empty-state");
-    renderSkeletonCards("discover-groups-grid", 3);
+    if (suggestRequest) suggestRequest.abort();
+    if (!prefix) {
+        list.innerHTML = "";
+        return;
+    }
+    const request = suggestRequest = new AbortController();
 
-    const res = await fetch(`/api/groups?q=${encodeURIComponent(q)}`, {
-        credentials: "include"
-    });
+    try {
+        const res = await fetch(`/api/groups/suggest?prefix=${encodeURIComponent(prefix)}`, {
+            signal: request.signal
+        });
+        if (!res.ok) return;
+        const data = await res.json();
+        list.innerHTML = "";
+        for (const s of data.suggestions || []) {
+            const option = document.createElement("option");
+            option.value = s.name;
+            option.label = `${s.member_count} members`;
+            list.appendChild(option);
+        }
+    } catch (err) {
+        if (err.name !== "AbortError") console.error("Suggestions failed", err);
+    }
+}
 
-    if (!res.ok) {
+async function loadDiscover(q, after = null) {
+    const grid = document.getElementById("discover-groups-grid");
+    if (!grid) return;
+    const form = document.querySelector(".search-form");
+    const sort = form && form.sort ? form.sort.value : "popular";
+    const more = document.getElementById("discover-more");
+
+    // reset any empty-state layout and show skeletons (first page only)
+    if (!after) {
         grid.classList.remove("empty-state");
-        grid.innerHTML = "<p>Error loading groups</p>";
-        return;
+        renderSkeletonCards("discover-groups-grid", 3);
     }
 
-    const data = await res.json();
+    // A newer search replaces the one still in flight
+    if (discoverRequest) discoverRequest.abort();
+    const request = discoverRequest = new AbortController();
+
+    const params = new URLSearchParams({ q, sort });
+    if (after) params.set("after", after);
+
+    let data;
+    try {
+        const res = await fetch(`/api/groups?${params}`, {
+            credentials: "include",
+            signal: request.signal
+        });
+
+        if (!res.ok) {
+            grid.classList.remove("empty-state");
+            grid.innerHTML = "<p>Error loading groups</p>";
+            return;
+        }
+        data = await res.json();
+    } catch (err) {
+        if (err.name === "AbortError") return;
+        throw err;
+    }
     const groups = Array.isArray(data) ? data : data.groups || [];
 
-    if (!groups.length) {
+    const total = document.getElementById("discover-total");
+    if (total) total.textContent = data.total != null ? `About ${data.total} groups` : "";
+    if (more) {
+        more.hidden = !data.next_cursor;
+        more.onclick = () => loadDiscover(q, data.next_cursor);
+    }
+
+    if (!groups.length && !after) {
         // pretty empty-state card
         grid.classList.add("empty-state");
         grid.innerHTML = `
@@ -432,7 +528,7 @@ async function loadDiscover(q) {
     }
 
     grid.classList.remove("empty-state");
-    grid.innerHTML = "";
+    if (!after) grid.innerHTML = "";
 
     for (const g of groups) {
         const card = document.createElement("div");
@@ -545,8 +641,14 @@ async function submitRating(itemId, score) {
         body: JSON.stringify({ score })
     });
 
-    if (res.ok) loadLeaderboard(groupId);
-    else alert("Rating failed.");
+    if (!res.ok) return alert("Rating failed.");
+
+    // The live stream pushes rank changes; without it, refetch everything
+    if (!leaderboardStream) return loadLeaderboard(groupId);
+
+    const data = await res.json();
+    mergeLeaderboardItems([data.item]);
+    refreshAll();
 }
 
 /****************************************************
@@ -557,8 +659,19 @@ async function initGroupPage() {
     const id = params.get("id");
     if (!id) return (window.location.href = "home.html");
 
-    await loadGroupInfo(id);
-    await loadLeaderboard(id);
+    // One request for the user, group, first leaderboard page and my ratings
+    const res = await fetch(`/api/groups/${id}/bootstrap`, { credentials: "include" });
+    if (res.status === 401) return (window.location.href = "login.html");
+    if (!res.ok) return (window.location.href = "home.html");
+
+    const data = await res.json();
+    renderGroupInfo(id, data.group);
+    allGroupItems = data.leaderboard || [];
+    leaderboardVersion = data.version ?? null;
+    refreshAll();
+
+    openLeaderboardStream(id);
+    loadRemainingLeaderboard(id, data.next_cursor);
 
     // Attach listeners
     document.getElementById("item-search").addEventListener("input", refreshAll);
@@ -588,15 +701,9 @@ async function initGroupPage() {
 }
 
 /****************************************************
- * LOAD GROUP INFO
+ * GROUP INFO
  ****************************************************/
-async function loadGroupInfo(id) {
-    const res = await fetch(`/api/groups/${id}`, {
-        credentials: "include"
-    });
-
-    const data = await res.json();
-
+function renderGroupInfo(id, data) {
     document.getElementById("group-title").textContent = data.name;
     document.getElementById("group-description").textContent =
         data.description || "";
@@ -638,8 +745,80 @@ async function loadLeaderboard(id) {
 
     const data = await res.json();
     allGroupItems = data.leaderboard || [];
+    leaderboardVersion = data.version ?? null;
 
     refreshAll();
+    openLeaderboardStream(id);
+}
+
+// Fetch the pages after the bootstrap page; live updates that arrive
+// meanwhile are merged by item ID, so overlapping pages are harmless.
+async function loadRemainingLeaderboard(id, cursor) {
+    while (cursor) {
+        const res = await fetch(
+            `/api/groups/${id}/leaderboard?limit=100&after=${encodeURIComponent(cursor)}`,
+            { credentials: "include" }
+        );
+        if (!res.ok) return;
+
+        const data = await res.json();
+        mergeLeaderboardItems(data.leaderboard || []);
+        refreshAll();
+        cursor = data.next_cursor;
+    }
+}
+
+/****************************************************
+ * LIVE UPDATES (Server-Sent Events)
+ ****************************************************/
+function openLeaderboardStream(id) {
+    if (leaderboardStream || !window.EventSource) return;
+
+    const since = leaderboardVersion != null ? `?since=${leaderboardVersion}` : "";
+    leaderboardStream = new EventSource(`/api/groups/${id}/leaderboard/stream${since}`, {
+        withCredentials: true
+    });
+
+    leaderboardStream.addEventListener("update", (e) => {
+        const data = JSON.parse(e.data);
+        const deleted = new Set(data.deleted || []);
+        allGroupItems = allGroupItems.filter(item => !deleted.has(item.id));
+        mergeLeaderboardItems(data.items || []);
+        leaderboardVersion = data.version;
+        refreshAll();
+    });
+
+    // Missed changes: fetch a fresh copy, keep the stream open
+    leaderboardStream.addEventListener("resync", () => loadLeaderboard(id));
+
+    leaderboardStream.addEventListener("gone", () => {
+        leaderboardStream.close();
+        leaderboardStream = null;
+    });
+}
+
+// Apply changed items from the server, keeping each item's user_rating
+// unless the change carries one, then recompute ranks in leaderboard order.
+function mergeLeaderboardItems(items) {
+    for (const item of items) {
+        const index = allGroupItems.findIndex(existing => existing.id === item.id);
+        const previous = index >= 0 ? allGroupItems[index] : {};
+        const merged = {
+            ...previous,
+            ...item,
+            user_rating: item.user_rating ?? previous.user_rating ?? null
+        };
+        if (index >= 0) allGroupItems[index] = merged;
+        else allGroupItems.push(merged);
+    }
+
+    // Same order as the server: avg_rating, rating_count, newest first
+    [...allGroupItems]
+        .sort((a, b) =>
+            (b.avg_rating || 0) - (a.avg_rating || 0) ||
+            (b.rating_count || 0) - (a.rating_count || 0) ||
+            b.id.localeCompare(a.id))
+        .forEach((item, index) => { item.rank = index + 1; });
 }
 
 /****************************************************
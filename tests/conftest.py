@@ -3,7 +3,18 @@ Pytest configuration with Flask-Login
 """
 import pytest
 from app import create_app
-from utils.db import users_collection, groups_collection, items_collection, ratings_collection
+from utils.db import (
+    users_collection,
+    groups_collection,
+    items_collection,
+    ratings_collection,
+    job_state_collection,
+    group_changes_collection,
+    memberships_collection
+)
+from utils.cache import leaderboard_cache, group_count_cache
+from utils.suggest import group_suggestions
+from utils.membership_cache import membership_cache
 
 
 @pytest.fixture
@@ -18,6 +29,13 @@ def app():
     groups_collection.delete_many({})
     items_collection.delete_many({})
     ratings_collection.delete_many({})
+    job_state_collection.delete_many({})
+    group_changes_collection.delete_many({})
+    memberships_collection.delete_many({})
+    leaderboard_cache.clear()
+    group_count_cache.clear()
+    group_suggestions.clear()
+    membership_cache.clear()
 
 
 @pytest.fixture
@@ -0,0 +1,176 @@
+"""
+Leaderboard cache tests
+"""
+import time
+
+import pytest
+from bson import ObjectId
+from utils.cache import LRUCache, leaderboard_cache
+from utils.db import items_collection
+from utils.reconcile import reconcile_rating_stats
+
+
+def leaderboard(client, group_id, **params):
+    response = client.get(f'/api/groups/{group_id}/leaderboard', query_string=params)
+    assert response.status_code == 200
+    return response.get_json()['leaderboard']
+
+
+class TestLRUCache:
+    """Test eviction, expiry and invalidation"""
+
+    def test_least_recently_used_entry_is_evicted(self):
+        """The entry read least recently is evicted first"""
+        cache = LRUCache('test', max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        assert cache.get('a') == 1
+        assert cache.get('b') is None
+        assert cache.stats()['evictions'] == 1
+
+    def test_entries_expire(self):
+        """Entries are not served after their TTL"""
+        cache = LRUCache('test', ttl=0.01)
+        cache.set('a', 1)
+        time.sleep(0.02)
+        assert cache.get('a') is None
+
+    def test_invalidate_tag_drops_only_that_tag(self):
+        """Invalidating one group leaves other groups cached"""
+        cache = LRUCache('test')
+        cache.set(('g1', 'rating'), 1, tag='g1')
+        cache.set(('g1', 'score'), 2, tag='g1')
+        cache.set(('g2', 'rating'), 3, tag='g2')
+
+        cache.invalidate_tag('g1')
+        assert cache.get(('g1', 'rating')) is None
+        assert cache.get(('g1', 'score')) is None
+        assert cache.get(('g2', 'rating')) == 3
+
+    def test_value_built_across_an_invalidation_is_not_stored(self):
+        """A read that raced with a write does not repopulate the cache"""
+        cache = LRUCache('test')
+        generation = cache.generation('g1')
+        cache.invalidate_tag('g1')
+        cache.set('a', 'stale', tag='g1', generation=generation)
+        assert cache.get('a') is None
+
+    def test_disabled_cache_always_misses(self):
+        """The switch turns caching off"""
+        cache = LRUCache('test')
+        cache.configure(enabled=False)
+        cache.set('a', 1)
+        assert cache.get('a') is None
+
+    def test_hit_and_miss_counters(self):
+        """Lookups are counted for the health check"""
+        cache = LRUCache('test')
+        cache.get('a')
+        cache.set('a', 1)
+        cache.get('a')
+        stats = cache.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        assert stats['hit_rate'] == 0.5
+
+
+class TestLeaderboardCache:
+    """Test that cached leaderboards never outlive the writes that change them"""
+
+    @pytest.fixture(autouse=True)
+    def enable_cache(self, app):
+        """Cache on regardless of the environment's setting"""
+        leaderboard_cache.configure(enabled=True)
+        yield
+        leaderboard_cache.configure(enabled=app.config['LEADERBOARD_CACHE_ENABLED'])
+
+    def test_repeat_reads_are_served_from_cache(self, auth_client, sample_group, sample_item):
+        """A second read of the same page is a cache hit"""
+        leaderboard(auth_client, sample_group['id'])
+        hits = leaderboard_cache.hits
+        leaderboard(auth_client, sample_group['id'])
+        assert leaderboard_cache.hits == hits + 1
+
+    def test_large_leaderboards_are_not_cached(self, auth_client, sample_group, monkeypatch):
+        """Whole leaderboards over the row budget are rebuilt, pages are cached"""
+        monkeypatch.setattr('routes.ratings.MAX_CACHED_ROWS', 2)
+        for name in ('One', 'Two', 'Three'):
+            auth_client.post(f'/api/groups/{sample_group["id"]}/items', json={'name': name})
+        size = leaderboard_cache.stats()['size']
+        leaderboard(auth_client, sample_group['id'])
+        assert leaderboard_cache.stats()['size'] == size
+        leaderboard(auth_client, sample_group['id'], limit=2)
+        assert leaderboard_cache.stats()['size'] == size + 1
+
+    def test_rating_invalidates(self, auth_client, sample_group, sample_item):
+        """Rating an item shows up on the next read"""
+        leaderboard(auth_client, sample_group['id'])
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 4})
+
+        row = leaderboard(auth_client, sample_group['id'])[0]
+        assert row['avg_rating'] == 4.0
+        assert row['user_rating'] == 4
+
+    def test_batch_rating_invalidates(self, auth_client, sample_group, sample_item):
+        """Batch ratings show up on the next read"""
+        leaderboard(auth_client, sample_group['id'])
+        auth_client.post(f'/api/groups/{sample_group["id"]}/ratings/batch', json={
+            'ratings': [{'item_id': sample_item['id'], 'score': 2}]
+        })
+        assert leaderboard(auth_client, sample_group['id'])[0]['rating_count'] == 1
+
+    def test_add_item_invalidates(self, auth_client, sample_group, sample_item):
+        """New items show up on the next read"""
+        leaderboard(auth_client, sample_group['id'])
+        auth_client.post(f'/api/groups/{sample_group["id"]}/items', json={
+            'name': 'Second Item', 'description': ''
+        })
+        assert len(leaderboard(auth_client, sample_group['id'])) == 2
+
+    def test_update_item_invalidates(self, auth_client, sample_group, sample_item):
+        """Edited items show up on the next read"""
+        leaderboard(auth_client, sample_group['id'])
+        auth_client.put(f'/api/groups/{sample_group["id"]}/items/{sample_item["id"]}', json={
+            'name': 'Renamed Item', 'description': ''
+        })
+        assert leaderboard(auth_client, sample_group['id'])[0]['name'] == 'Renamed Item'
+
+    def test_delete_item_invalidates(self, auth_client, sample_group, sample_item):
+        """Deleted items disappear on the next read"""
+        leaderboard(auth_client, sample_group['id'])
+        auth_client.delete(f'/api/items/{sample_item["id"]}')
+        assert leaderboard(auth_client, sample_group['id']) == []
+
+    def test_delete_group_invalidates(self, auth_client, sample_group, sample_item):
+        """Deleting the group drops its cached leaderboard"""
+        leaderboard(auth_client, sample_group['id'])
+        auth_client.delete(f'/api/groups/{sample_group["id"]}')
+        response = auth_client.get(f'/api/groups/{sample_group["id"]}/leaderboard')
+        assert response.status_code == 404
+
+    def test_reconcile_invalidates_corrected_groups(self, auth_client, sample_group, sample_item):
+        """Stats repaired by reconciliation are served immediately"""
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 5})
+        items_collection.update_one(
+            {'_id': ObjectId(sample_item['id'])}, {'$set': {'rating_count': 7}}
+        )
+        assert leaderboard(auth_client, sample_group['id'])[0]['rating_count'] == 7
+
+        reconcile_rating_stats(full=True)
+        assert leaderboard(auth_client, sample_group['id'])[0]['rating_count'] == 1
+
+    def test_user_rating_is_not_shared(self, auth_client, client, sample_group, sample_item):
+        """The per-user overlay is never cached"""
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 3})
+        assert leaderboard(auth_client, sample_group['id'])[0]['user_rating'] == 3
+
+        auth_client.post('/api/auth/logout')
+        assert leaderboard(client, sample_group['id'])[0]['user_rating'] is None
+
+    def test_cache_metrics_on_health_check(self, client):
+        """Cache counters are exposed on the health check"""
+        metrics = client.get('/api/health').get_json()['metrics']['leaderboard_cache']
+        assert 'hits' in metrics and 'size' in metrics
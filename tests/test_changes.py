@@ -0,0 +1,106 @@
+"""
+Delta-sync (/changes) tests
+"""
+from bson import ObjectId
+from models.group import Group
+from utils.db import group_changes_collection
+
+
+def changes(client, group_id, since):
+    response = client.get(f'/api/groups/{group_id}/changes', query_string={'since': since})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+class TestChanges:
+    """Test syncing leaderboard changes by version"""
+
+    def test_no_changes(self, client, sample_group, sample_item):
+        """A client at the current version gets an empty delta"""
+        version = Group.get_version(sample_group['id'])
+        data = changes(client, sample_group['id'], version)
+        assert data == {
+            'version': version, 'items': [], 'deleted': [], 'has_more': False, 'resync': False
+        }
+
+    def test_rated_and_renamed_items_are_returned(self, auth_client, sample_group, sample_item):
+        """Stat and name changes both show up, each item once"""
+        version = Group.get_version(sample_group['id'])
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 5})
+        auth_client.put(f'/api/groups/{sample_group["id"]}/items/{sample_item["id"]}',
+                        json={'name': 'Renamed Item'})
+
+        data = changes(auth_client, sample_group['id'], version)
+        assert data['version'] == Group.get_version(sample_group['id'])
+        assert [item['id'] for item in data['items']] == [sample_item['id']]
+        assert data['items'][0]['name'] == 'Renamed Item'
+        assert data['items'][0]['avg_rating'] == 5.0
+
+    def test_created_and_deleted_items(self, auth_client, sample_group, sample_item):
+        """New items are returned and deleted ones listed by ID"""
+        version = Group.get_version(sample_group['id'])
+        new_item = auth_client.post(f'/api/groups/{sample_group["id"]}/items', json={
+            'name': 'New Item', 'description': ''
+        }).get_json()['item']
+        auth_client.delete(f'/api/items/{sample_item["id"]}')
+
+        data = changes(auth_client, sample_group['id'], version)
+        assert [item['id'] for item in data['items']] == [new_item['id']]
+        assert data['deleted'] == [sample_item['id']]
+
+    def test_every_version_is_logged(self, auth_client, sample_group, sample_item):
+        """Versions in the log are contiguous, so gaps mean lost history"""
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 3})
+        versions = [
+            entry['version'] for entry in
+            group_changes_collection.find({'group_id': ObjectId(sample_group['id'])}).sort('version', 1)
+        ]
+        assert versions == list(range(1, Group.get_version(sample_group['id']) + 1))
+
+    def test_one_version_per_rating_request(self, auth_client, sample_group, sample_item):
+        """A rating and its stats update are one logical write"""
+        second = auth_client.post(f'/api/groups/{sample_group["id"]}/items', json={'name': 'Second'}).get_json()['item']
+        version = Group.get_version(sample_group['id'])
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 3})
+        assert Group.get_version(sample_group['id']) == version + 1
+
+        auth_client.post(f'/api/groups/{sample_group["id"]}/ratings/batch', json={'ratings': [
+            {'item_id': sample_item['id'], 'score': 4},
+            {'item_id': second['id'], 'score': 5}
+        ]})
+        assert Group.get_version(sample_group['id']) == version + 2
+        assert group_changes_collection.count_documents(
+            {'group_id': ObjectId(sample_group['id']), 'version': {'$gt': version}}
+        ) == 2
+        group = Group.find_by_id(sample_group['id'])
+        assert group['rating_count'] == 2
+
+    def test_expired_history_asks_for_resync(self, auth_client, sample_group, sample_item):
+        """A since older than the retained log returns resync"""
+        version = Group.get_version(sample_group['id'])
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 3})
+        group_changes_collection.delete_many({'version': {'$lte': version + 1}})
+
+        data = changes(auth_client, sample_group['id'], version)
+        assert data['resync'] is True
+        assert data['version'] == Group.get_version(sample_group['id'])
+
+    def test_future_version_asks_for_resync(self, client, sample_group):
+        """A since ahead of the group (e.g. a restored database) returns resync"""
+        version = Group.get_version(sample_group['id'])
+        assert changes(client, sample_group['id'], version + 5)['resync'] is True
+
+    def test_since_is_required(self, client, sample_group):
+        """since must be an integer"""
+        response = client.get(f'/api/groups/{sample_group["id"]}/changes?since=abc')
+        assert response.status_code == 400
+
+    def test_unknown_group(self, client):
+        """Missing groups return 404"""
+        response = client.get(f'/api/groups/{ObjectId()}/changes?since=0')
+        assert response.status_code == 404
+
+    def test_change_log_retention_comes_from_config(self, app):
+        """The TTL index takes its expiry from the app config"""
+        index = group_changes_collection.index_information()['created_at_1']
+        assert index['expireAfterSeconds'] == app.config['CHANGE_LOG_RETENTION']
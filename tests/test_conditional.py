@@ -0,0 +1,87 @@
+"""
+Conditional GET (ETag / If-None-Match) tests
+"""
+import pytest
+from models.group import Group
+
+
+GROUP_ENDPOINTS = ['', '/items', '/leaderboard']
+
+
+def get(client, group_id, endpoint, etag=None):
+    headers = {'If-None-Match': etag} if etag else {}
+    return client.get(f'/api/groups/{group_id}{endpoint}', headers=headers)
+
+
+class TestConditionalGet:
+    """Test group versions and 304 responses"""
+
+    @pytest.mark.parametrize('endpoint', GROUP_ENDPOINTS)
+    def test_unchanged_group_returns_304(self, auth_client, sample_group, sample_item, endpoint):
+        """Repeating a request with its ETag returns an empty 304"""
+        first = get(auth_client, sample_group['id'], endpoint)
+        assert first.status_code == 200
+        assert first.headers['ETag']
+
+        second = get(auth_client, sample_group['id'], endpoint, first.headers['ETag'])
+        assert second.status_code == 304
+        assert second.data == b''
+        assert second.headers['ETag'] == first.headers['ETag']
+
+    @pytest.mark.parametrize('endpoint', GROUP_ENDPOINTS)
+    def test_rating_changes_etag(self, auth_client, sample_group, sample_item, endpoint):
+        """A rating bumps the group version, so stale ETags get a full response"""
+        etag = get(auth_client, sample_group['id'], endpoint).headers['ETag']
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 4})
+
+        response = get(auth_client, sample_group['id'], endpoint, etag)
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+
+    def test_same_score_does_not_bump_version(self, auth_client, sample_group, sample_item):
+        """Re-submitting an identical rating changes nothing"""
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 4})
+        version = Group.get_version(sample_group['id'])
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 4})
+        assert Group.get_version(sample_group['id']) == version
+
+    def test_item_writes_bump_version(self, auth_client, sample_group, sample_item):
+        """Adding, editing and deleting items each bump the version"""
+        versions = [Group.get_version(sample_group['id'])]
+        auth_client.post(f'/api/groups/{sample_group["id"]}/items', json={'name': 'Another Item'})
+        versions.append(Group.get_version(sample_group['id']))
+        auth_client.put(f'/api/groups/{sample_group["id"]}/items/{sample_item["id"]}',
+                        json={'name': 'Renamed'})
+        versions.append(Group.get_version(sample_group['id']))
+        auth_client.delete(f'/api/items/{sample_item["id"]}')
+        versions.append(Group.get_version(sample_group['id']))
+        assert versions == sorted(set(versions))
+
+    def test_membership_change_bumps_version(self, client, auth_client, sample_group):
+        """Joining changes member_count, so the group ETag changes"""
+        etag = get(auth_client, sample_group['id'], '').headers['ETag']
+
+        auth_client.post('/api/auth/logout')
+        client.post('/api/auth/register', json={
+            'username': 'joiner', 'email': 'joiner@example.com', 'password': 'password123'
+        })
+        client.post(f'/api/groups/{sample_group["id"]}/join')
+        client.post('/api/auth/logout')
+        client.post('/api/auth/login', json={'email': 'test@example.com', 'password': 'password123'})
+
+        assert get(client, sample_group['id'], '', etag).status_code == 200
+
+    def test_etag_differs_per_user_and_query(self, auth_client, client, sample_group, sample_item):
+        """Per-user fields and query parameters are part of the ETag"""
+        mine = get(auth_client, sample_group['id'], '/leaderboard').headers['ETag']
+        by_score = get(auth_client, sample_group['id'], '/leaderboard?sort=score').headers['ETag']
+        assert mine != by_score
+
+        auth_client.post('/api/auth/logout')
+        assert get(client, sample_group['id'], '/leaderboard', mine).status_code == 200
+
+    def test_unknown_group_has_no_etag(self, client):
+        """Missing groups keep their normal error response"""
+        response = get(client, '507f1f77bcf86cd799439011', '')
+        assert response.status_code == 404
+        assert 'ETag' not in response.headers
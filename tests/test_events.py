@@ -0,0 +1,169 @@
+"""
+Live leaderboard stream (Server-Sent Events) tests
+"""
+import json
+
+import pytest
+from bson import ObjectId
+from pymongo import ReturnDocument
+from models.group import Group
+from models.group_change import GroupChange
+from utils.db import groups_collection, group_changes_collection
+from utils.events import leaderboard_events
+
+
+@pytest.fixture
+def events(app):
+    """Feeds without threads, so deliveries happen on tick()"""
+    leaderboard_events.configure(enabled=True, heartbeat_interval=0.01, poll_interval=0, max_queue=10)
+    yield leaderboard_events
+    leaderboard_events.close_all()
+    leaderboard_events.configure(
+        enabled=app.config['LEADERBOARD_STREAM_ENABLED'],
+        heartbeat_interval=app.config['LEADERBOARD_STREAM_HEARTBEAT'],
+        poll_interval=app.config['LEADERBOARD_STREAM_POLL_INTERVAL'],
+        max_queue=app.config['LEADERBOARD_STREAM_QUEUE']
+    )
+
+
+def subscribe(events, group_id):
+    return events.subscribe(group_id, Group.get_version(group_id))
+
+
+def parse(message):
+    """Split an SSE message into (event, id, data)"""
+    fields = dict(line.split(': ', 1) for line in message.strip().split('\n'))
+    return fields['event'], fields.get('id'), json.loads(fields['data'])
+
+
+class TestLeaderboardEvents:
+    """Test fan-out, resync and slow-consumer handling"""
+
+    def test_rating_pushes_changed_item(self, events, auth_client, sample_group, sample_item):
+        """A rating delivers the item's new stats and ranks"""
+        subscriber = subscribe(events, sample_group['id'])
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 4})
+        events.tick(sample_group['id'])
+
+        event, event_id, data = parse(subscriber.queue.get_nowait())
+        assert event == 'update'
+        assert int(event_id) == Group.get_version(sample_group['id'])
+        assert [row['id'] for row in data['items']] == [sample_item['id']]
+        row = data['items'][0]
+        assert row['avg_rating'] == 4.0
+        assert row['rating_count'] == 1
+        assert row['ranks'] == {'rating': 1, 'score': 1}
+        assert 'user_rating' not in row
+
+    def test_one_message_is_shared_by_all_subscribers(self, events, auth_client, sample_group, sample_item):
+        """The update is built once per group, not per connection"""
+        first = subscribe(events, sample_group['id'])
+        second = subscribe(events, sample_group['id'])
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 2})
+        events.tick(sample_group['id'])
+
+        assert first.queue.get_nowait() is second.queue.get_nowait()
+        assert events.stats()['subscribers'] == 2
+
+    def test_deleted_item_is_reported(self, events, auth_client, sample_group, sample_item):
+        """Deleting an item sends its ID in `deleted`"""
+        subscriber = subscribe(events, sample_group['id'])
+        auth_client.delete(f'/api/items/{sample_item["id"]}')
+        events.tick(sample_group['id'])
+
+        event, _, data = parse(subscriber.queue.get_nowait())
+        assert data['items'] == []
+        assert data['deleted'] == [sample_item['id']]
+
+    def test_write_from_another_process_is_read_from_log(self, events, sample_group, sample_item):
+        """Writes published by another process are pushed using the change log"""
+        subscriber = subscribe(events, sample_group['id'])
+        version = groups_collection.find_one_and_update(
+            {'_id': ObjectId(sample_group['id'])}, {'$inc': {'version': 1}},
+            return_document=ReturnDocument.AFTER
+        )['version']
+        GroupChange.record(sample_group['id'], version, item_ids=[sample_item['id']])
+        events.tick(sample_group['id'])
+
+        event, _, data = parse(subscriber.queue.get_nowait())
+        assert event == 'update'
+        assert [row['id'] for row in data['items']] == [sample_item['id']]
+
+    def test_unlogged_write_triggers_resync(self, events, sample_group):
+        """A version bump with no change-log entry asks clients to refetch"""
+        subscriber = subscribe(events, sample_group['id'])
+        groups_collection.update_one({'_id': ObjectId(sample_group['id'])}, {'$inc': {'version': 1}})
+        events.tick(sample_group['id'])
+
+        event, _, _ = parse(subscriber.queue.get_nowait())
+        assert event == 'resync'
+
+    def test_slow_consumer_is_dropped(self, events, auth_client, sample_group, sample_item):
+        """A full queue closes that subscriber instead of growing"""
+        events.configure(poll_interval=0, max_queue=1)
+        dropped = events.stats()['dropped']
+        slow = subscribe(events, sample_group['id'])
+        for score in (2, 3):
+            auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': score})
+            events.tick(sample_group['id'])
+
+        assert slow.closed
+        assert events.stats()['dropped'] == dropped + 1
+        assert events.stats()['subscribers'] == 0
+
+    def test_deleted_group_ends_streams(self, events, auth_client, sample_group):
+        """Subscribers get `gone` and then the end of the stream"""
+        subscriber = subscribe(events, sample_group['id'])
+        auth_client.delete(f'/api/groups/{sample_group["id"]}')
+        events.tick(sample_group['id'])
+
+        assert parse(subscriber.queue.get_nowait())[0] == 'gone'
+        assert subscriber.queue.get_nowait() is None
+
+
+class TestLeaderboardStreamRoute:
+    """Test the SSE endpoint"""
+
+    def test_reconnect_replays_missed_changes(self, events, auth_client, sample_group, sample_item):
+        """A client behind the current version is caught up from the change log"""
+        version = Group.get_version(sample_group['id'])
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 4})
+
+        response = auth_client.get(
+            f'/api/groups/{sample_group["id"]}/leaderboard/stream',
+            headers={'Last-Event-ID': str(version)}
+        )
+        assert response.mimetype == 'text/event-stream'
+        chunks = (chunk.decode('utf-8') for chunk in response.response)
+        assert next(chunks).startswith('retry:')
+        event, event_id, data = parse(next(chunks))
+        assert event == 'update'
+        assert int(event_id) == Group.get_version(sample_group['id'])
+        assert data['items'][0]['avg_rating'] == 4.0
+        assert next(chunks) == ': heartbeat\n\n'
+        response.close()
+        assert events.stats()['subscribers'] == 0
+
+    def test_reconnect_without_history_resyncs(self, events, auth_client, sample_group, sample_item):
+        """A client older than the retained change log is told to resync"""
+        version = Group.get_version(sample_group['id'])
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 4})
+        group_changes_collection.delete_many({})
+
+        response = auth_client.get(
+            f'/api/groups/{sample_group["id"]}/leaderboard/stream?since={version}'
+        )
+        chunks = (chunk.decode('utf-8') for chunk in response.response)
+        next(chunks)
+        assert parse(next(chunks))[0] == 'resync'
+        response.close()
+
+    def test_leaderboard_reports_version_to_resume_from(self, events, client, sample_group):
+        """The leaderboard response carries the version to pass as ?since="""
+        data = client.get(f'/api/groups/{sample_group["id"]}/leaderboard').get_json()
+        assert data['version'] == Group.get_version(sample_group['id'])
+
+    def test_unknown_group_is_404(self, events, client):
+        """Streams are only opened for existing groups"""
+        response = client.get(f'/api/groups/{ObjectId()}/leaderboard/stream')
+        assert response.status_code == 404
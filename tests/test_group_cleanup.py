@@ -0,0 +1,163 @@
+"""
+Background group deletion tests
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from models.group import Group
+from models.item import Item
+from models.user import User
+from utils.db import (
+    groups_collection,
+    group_changes_collection,
+    items_collection,
+    ratings_collection,
+    memberships_collection,
+    users_collection
+)
+from utils.group_cleanup import GroupCleanup, group_cleanup
+
+
+@pytest.fixture
+def populated_group(auth_client, sample_group):
+    """The sample group with a second member and three rated items"""
+    member = User.create('member', 'member@example.com', 'password123')
+    Group.add_member(sample_group['id'], member.id)
+    member.update_groups(sample_group['id'], 'add')
+    for n in range(3):
+        item = auth_client.post(f'/api/groups/{sample_group["id"]}/items', json={
+            'name': f'Item {n}', 'description': 'x'
+        }).get_json()['item']
+        auth_client.post(f'/api/items/{item["id"]}/rate', json={'score': 4})
+    return sample_group
+
+
+def remaining(group_id):
+    query = {'group_id': ObjectId(group_id)}
+    return (
+        memberships_collection.count_documents(query),
+        items_collection.count_documents(query),
+        ratings_collection.count_documents(query)
+    )
+
+
+class TestGroupDeletion:
+    """Test that deleted groups disappear at once and their data afterwards"""
+
+    def test_delete_hides_group_immediately(self, auth_client, populated_group):
+        group_id = populated_group['id']
+        response = auth_client.delete(f'/api/groups/{group_id}')
+        assert response.status_code == 200
+
+        assert auth_client.get(f'/api/groups/{group_id}').status_code == 404
+        assert auth_client.get(f'/api/groups/{group_id}/items').status_code == 404
+        assert auth_client.get('/api/groups').get_json()['groups'] == []
+        assert auth_client.get('/api/me/groups').get_json()['groups'] == []
+        assert auth_client.delete(f'/api/groups/{group_id}').status_code == 404
+        # The cascade has not run yet
+        assert remaining(group_id) == (2, 3, 3)
+
+    def test_cleanup_removes_everything(self, auth_client, populated_group):
+        group_id = populated_group['id']
+        auth_client.delete(f'/api/groups/{group_id}')
+
+        assert group_cleanup.run_pending() == 1
+        assert remaining(group_id) == (0, 0, 0)
+        assert groups_collection.count_documents({'_id': ObjectId(group_id)}) == 0
+        assert users_collection.count_documents({'groups_joined': group_id}) == 0
+        assert group_cleanup.run_pending() == 0
+
+    def test_items_are_hidden_and_frozen_immediately(self, auth_client, populated_group):
+        group_id = populated_group['id']
+        item_id = str(items_collection.find_one({'group_id': ObjectId(group_id)})['_id'])
+        auth_client.delete(f'/api/groups/{group_id}')
+
+        assert auth_client.get(f'/api/items/{item_id}').status_code == 404
+        assert auth_client.get(f'/api/items/{item_id}/rank').status_code == 404
+        assert auth_client.post(f'/api/items/{item_id}/rate', json={'score': 1}).status_code == 404
+        assert auth_client.post(f'/api/groups/{group_id}/items', json={'name': 'Late'}).status_code == 404
+        assert auth_client.post(f'/api/groups/{group_id}/ratings/batch', json={
+            'ratings': [{'item_id': item_id, 'score': 1}]
+        }).status_code == 404
+        assert remaining(group_id) == (2, 3, 3)
+
+    def test_item_added_during_delete_is_not_orphaned(self, auth_client, populated_group):
+        group_id = populated_group['id']
+        owner = str(Group.find_by_id(group_id)['created_by'])
+        auth_client.delete(f'/api/groups/{group_id}')
+        # A request that passed its group check before the delete
+        assert Item.create(group_id, 'Late', '', owner) is None
+        group_cleanup.run_pending()
+        assert remaining(group_id) == (0, 0, 0)
+
+    def test_delete_logs_membership_change_at_once(self, auth_client, populated_group):
+        group_id = populated_group['id']
+        version = Group.get_version(group_id)
+        auth_client.delete(f'/api/groups/{group_id}')
+        assert group_changes_collection.count_documents(
+            {'group_id': ObjectId(group_id), 'version': {'$gt': version}, 'members': True}
+        ) == 1
+
+    def test_join_after_delete_is_refused(self, auth_client, populated_group):
+        auth_client.delete(f'/api/groups/{populated_group["id"]}')
+        late = User.create('late', 'late@example.com', 'password123')
+        assert Group.add_member(populated_group['id'], late.id) is False
+
+
+class TestGroupCleanup:
+    """Test batching, resuming and leases"""
+
+    @pytest.fixture
+    def cleanup(self, app):
+        cleanup = GroupCleanup()
+        cleanup.configure(batch_size=1, interval=0)
+        return cleanup
+
+    def test_batches_are_bounded(self, cleanup, auth_client, populated_group):
+        auth_client.delete(f'/api/groups/{populated_group["id"]}')
+        cleanup.run_pending()
+        stats = cleanup.stats()
+        assert stats['documents_deleted']['items'] == 3
+        assert stats['documents_deleted']['ratings'] == 3
+        assert stats['batches'] >= 8
+        assert stats['pending'] == 0
+
+    def test_resumes_after_a_crash(self, cleanup, auth_client, populated_group, monkeypatch):
+        group_id = populated_group['id']
+        auth_client.delete(f'/api/groups/{group_id}')
+
+        original = cleanup._delete_ratings
+        calls = []
+
+        def crash_on_second_batch(gid):
+            calls.append(gid)
+            if len(calls) == 2:
+                raise RuntimeError('worker died')
+            return original(gid)
+
+        monkeypatch.setattr(cleanup, '_delete_ratings', crash_on_second_batch)
+        with pytest.raises(RuntimeError):
+            cleanup.run_pending()
+
+        group = groups_collection.find_one({'_id': ObjectId(group_id)})
+        assert group['cleanup']['stage'] == 'ratings'
+        assert group['cleanup']['ratings'] == 1
+        assert remaining(group_id) == (0, 0, 2)
+
+        # A fresh worker waits for the lease, then finishes the job
+        resumed = GroupCleanup()
+        resumed.configure(batch_size=1, interval=0)
+        assert resumed.run_pending() == 0
+        groups_collection.update_one(
+            {'_id': ObjectId(group_id)},
+            {'$set': {'cleanup_lease': datetime.utcnow() - timedelta(seconds=1)}}
+        )
+        assert resumed.run_pending() == 1
+        assert remaining(group_id) == (0, 0, 0)
+        assert resumed.stats()['documents_deleted']['memberships'] == 0
+
+    def test_progress_on_health_check(self, client):
+        metrics = client.get('/api/health').get_json()['metrics']['group_cleanup']
+        assert metrics['pending'] == 0
+        assert metrics['current'] is None
@@ -1,5 +1,9 @@
 import pytest
-from utils.db import groups_collection
+from datetime import datetime
+from bson import ObjectId
+from models.group import Group
+from models.item import Item
+from utils.db import groups_collection, _backfill_name_lower
 
 
 class TestGroups:
@@ -114,4 +118,278 @@ class TestGroups:
         data = resp.get_json()
         assert "groups" in data
         assert isinstance(data["groups"], list)
-        assert len(data["groups"]) >= 1
\ No newline at end of file
+        assert len(data["groups"]) >= 1
+
+class TestGroupBootstrap:
+    """Test the single-request group page payload"""
+
+    def test_bootstrap_contains_page_data(self, auth_client, sample_group, sample_item):
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 4})
+
+        res = auth_client.get(f'/api/groups/{sample_group["id"]}/bootstrap')
+        assert res.status_code == 200
+        data = res.get_json()
+
+        assert data['user']['username'] == 'testuser'
+        assert data['group']['id'] == sample_group['id']
+        assert data['group']['is_member'] is True
+        assert data['group']['is_owner'] is True
+        assert isinstance(data['version'], int)
+        assert data['leaderboard'][0]['id'] == sample_item['id']
+        assert data['leaderboard'][0]['user_rating'] == 4
+        assert data['my_ratings'] == {sample_item['id']: 4}
+        assert data['next_cursor'] is None
+
+    def test_bootstrap_first_page_continues_with_leaderboard(self, auth_client, sample_group):
+        for n in range(3):
+            auth_client.post(f'/api/groups/{sample_group["id"]}/items', json={'name': f'Item {n}'})
+
+        data = auth_client.get(f'/api/groups/{sample_group["id"]}/bootstrap?limit=2').get_json()
+        assert len(data['leaderboard']) == 2
+
+        rest = auth_client.get(
+            f'/api/groups/{sample_group["id"]}/leaderboard',
+            query_string={'limit': 2, 'after': data['next_cursor']}
+        ).get_json()
+        assert [row['rank'] for row in rest['leaderboard']] == [3]
+
+    def test_bootstrap_requires_login(self, client, sample_group):
+        client.post('/api/auth/logout')
+        res = client.get(f'/api/groups/{sample_group["id"]}/bootstrap')
+        assert res.status_code == 401
+
+    def test_bootstrap_unknown_group(self, auth_client):
+        res = auth_client.get('/api/groups/507f1f77bcf86cd799439011/bootstrap')
+        assert res.status_code == 404
+
+
+class TestDashboard:
+    """Test the home page summary of my groups"""
+
+    def test_dashboard_summarizes_each_group(self, auth_client, sample_group, sample_item):
+        for name in ('Second', 'Third', 'Fourth'):
+            auth_client.post(f'/api/groups/{sample_group["id"]}/items', json={'name': name})
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 5})
+
+        res = auth_client.get('/api/me/dashboard')
+        assert res.status_code == 200
+        group = next(g for g in res.get_json()['groups'] if g['id'] == sample_group['id'])
+
+        assert group['item_count'] == 4
+        assert group['unrated_count'] == 3
+        assert len(group['top_items']) == 3
+        assert group['top_items'][0]['id'] == sample_item['id']
+        assert group['top_items'][0]['avg_rating'] == 5.0
+        assert group['is_member'] is True
+
+    def test_dashboard_includes_empty_groups(self, auth_client, sample_group):
+        res = auth_client.get('/api/me/dashboard')
+        group = next(g for g in res.get_json()['groups'] if g['id'] == sample_group['id'])
+        assert group['item_count'] == 0
+        assert group['unrated_count'] == 0
+        assert group['top_items'] == []
+
+    def test_dashboard_reads_counts_from_group_summary(self, auth_client, sample_group):
+        for n in range(5):
+            auth_client.post(f'/api/groups/{sample_group["id"]}/items', json={'name': f'Item {n}'})
+        top = Item.top_by_groups([sample_group['id']], top=3)[sample_group['id']]
+        assert len(top) == 3
+        assert set(top[0]) == {'_id', 'name', 'avg_rating', 'rating_count'}
+
+        groups_collection.update_one({'_id': ObjectId(sample_group['id'])}, {'$set': {'item_count': 40}})
+        group = next(g for g in auth_client.get('/api/me/dashboard').get_json()['groups']
+                     if g['id'] == sample_group['id'])
+        assert group['item_count'] == 40
+        assert group['unrated_count'] == 40
+        assert len(group['top_items']) == 3
+
+    def test_dashboard_only_lists_my_groups(self, auth_client, sample_group):
+        other = Group.create('Other Group', 'Not mine', str(ObjectId()))
+        ids = {g['id'] for g in auth_client.get('/api/me/dashboard').get_json()['groups']}
+        assert sample_group['id'] in ids
+        assert str(other['_id']) not in ids
+
+    def test_dashboard_requires_login(self, client):
+        res = client.get('/api/me/dashboard')
+        assert res.status_code == 401
+
+
+class TestGroupSearch:
+    """Test discovery search paths"""
+
+    @pytest.fixture
+    def groups(self, auth_client):
+        for name, description in (
+            ('Sushi Squad', 'Rolls and nigiri'),
+            ('Best Burgers', 'Smash burgers around town'),
+        ):
+            auth_client.post('/api/groups', json={'name': name, 'description': description})
+
+    def search(self, client, q):
+        res = client.get('/api/groups', query_string={'q': q})
+        assert res.status_code == 200
+        return [g['name'] for g in res.get_json()['groups']]
+
+    def test_short_query_matches_name_prefix(self, auth_client, groups):
+        assert self.search(auth_client, 'SU') == ['Sushi Squad']
+        assert self.search(auth_client, 'qu') == []
+
+    def test_long_query_matches_description_words(self, auth_client, groups):
+        assert self.search(auth_client, 'nigiri') == ['Sushi Squad']
+
+    def test_long_query_matches_partial_words(self, auth_client, groups):
+        # The debounced search box sends words before they are complete
+        assert self.search(auth_client, 'Sush') == ['Sushi Squad']
+        assert self.search(auth_client, 'burg') == ['Best Burgers']
+        assert self.search(auth_client, 'best burg') == ['Best Burgers']
+
+    def test_text_matches_come_before_partial_matches(self, auth_client, groups):
+        auth_client.post('/api/groups', json={'name': 'Rollercoasters', 'description': 'Rides'})
+        assert self.search(auth_client, 'rolls') == ['Sushi Squad']
+        assert self.search(auth_client, 'roll') == ['Sushi Squad', 'Rollercoasters']
+
+    def test_regex_characters_are_literal(self, auth_client, groups):
+        assert self.search(auth_client, '.*') == []
+
+    def test_groups_without_name_lower_are_backfilled(self, auth_client):
+        groups_collection.insert_one({
+            'name': 'Old Group', 'description': 'Created before prefix search',
+            'created_at': datetime.utcnow()
+        })
+        _backfill_name_lower()
+        assert self.search(auth_client, 'old') == ['Old Group']
+        assert self.search(auth_client, 'grou') == ['Old Group']
+
+
+class TestDiscoverPagination:
+    """Test discover sorts and keyset cursors"""
+
+    @pytest.fixture
+    def many_groups(self, auth_client):
+        ids = []
+        for n, members in enumerate([3, 1, 3, 5, 1]):
+            group = auth_client.post('/api/groups', json={
+                'name': f'{"abcde"[n]}{n} Group', 'description': 'Paged'
+            }).get_json()['group']
+            groups_collection.update_one({'_id': ObjectId(group['id'])}, {'$set': {'member_count': members}})
+            ids.append(group['id'])
+        return ids
+
+    def walk(self, client, **params):
+        """Follow next_cursor to the end, returning every page"""
+        pages, after = [], None
+        while True:
+            query = dict(params, limit=2)
+            if after:
+                query['after'] = after
+            res = client.get('/api/groups', query_string=query)
+            assert res.status_code == 200
+            data = res.get_json()
+            pages.append(data['groups'])
+            after = data['next_cursor']
+            if not after:
+                return pages
+
+    def test_popular_breaks_ties_by_id(self, auth_client, many_groups):
+        pages = self.walk(auth_client, sort='popular')
+        ids = [g['id'] for page in pages for g in page]
+        assert [len(page) for page in pages] == [2, 2, 1]
+        assert ids == [many_groups[i] for i in (3, 2, 0, 4, 1)]
+
+    def test_new_is_newest_first(self, auth_client, many_groups):
+        ids = [g['id'] for page in self.walk(auth_client, sort='new') for g in page]
+        assert ids == list(reversed(many_groups))
+
+    def test_name_is_case_insensitive(self, auth_client, many_groups):
+        groups_collection.update_one(
+            {'_id': ObjectId(many_groups[4])}, {'$set': {'name': 'A4 Group', 'name_lower': 'a4 group'}}
+        )
+        names = [g['name'] for page in self.walk(auth_client, sort='name') for g in page]
+        assert names == ['a0 Group', 'A4 Group', 'b1 Group', 'c2 Group', 'd3 Group']
+
+    def test_prefix_search_pages_by_name(self, auth_client, many_groups):
+        for name in ('a9 Group', 'A7 Group'):
+            auth_client.post('/api/groups', json={'name': name, 'description': 'Paged'})
+        pages = self.walk(auth_client, q='a')
+        assert [[g['name'] for g in page] for page in pages] == [['a0 Group', 'A7 Group'], ['a9 Group']]
+
+    def test_total_is_reported_for_listings(self, auth_client, many_groups):
+        data = auth_client.get('/api/groups?limit=1').get_json()
+        assert data['total'] == 5
+        assert auth_client.get('/api/groups?q=a0').get_json()['total'] is None
+
+    def test_invalid_sort(self, auth_client):
+        assert auth_client.get('/api/groups?sort=random').status_code == 400
+
+    def test_cursor_must_match_sort(self, auth_client, many_groups):
+        after = auth_client.get('/api/groups?sort=new&limit=1').get_json()['next_cursor']
+        res = auth_client.get('/api/groups', query_string={'sort': 'popular', 'after': after})
+        assert res.status_code == 400
+        assert auth_client.get('/api/groups?after=garbage').status_code == 400
+
+
+class TestGroupProjection:
+    """Test that group reads only fetch the fields cards need"""
+
+    def test_list_reads_project_card_fields(self, auth_client, sample_group):
+        groups_collection.update_one(
+            {'_id': ObjectId(sample_group['id'])},
+            {'$set': {'members': [ObjectId() for _ in range(100)], 'notes': 'x' * 1000}}
+        )
+        card = set(Group.CARD_FIELDS) | {'_id'}
+        for sort in Group.SORTS:
+            groups, _ = Group.get_page(sort=sort)
+            assert set(groups[0]) <= card | {field for field, _ in Group.SORTS[sort]}
+        user_id = str(Group.find_by_id(sample_group['id'])['created_by'])
+        assert set(Group.get_user_groups(user_id)[0]) == card
+        assert set(Group.find_by_id(sample_group['id'])) == card | {'version'}
+
+    def test_card_still_renders_membership_flags(self, auth_client, sample_group):
+        res = auth_client.get(f'/api/groups/{sample_group["id"]}')
+        data = res.get_json()
+        assert data['is_member'] is True
+        assert data['is_owner'] is True
+        assert data['member_count'] == 1
+
+
+class TestGroupSummary:
+    """Test the item/rating summary kept on each group for cards"""
+
+    def card(self, auth_client, group_id):
+        return auth_client.get(f'/api/groups/{group_id}').get_json()
+
+    def test_new_group_has_empty_summary(self, auth_client, sample_group):
+        assert sample_group['item_count'] == 0
+        assert sample_group['rating_count'] == 0
+        assert sample_group['last_activity_at'] == sample_group['created_at']
+
+    def test_item_and_rating_writes_update_summary(self, auth_client, sample_group, sample_item):
+        second = auth_client.post(f'/api/groups/{sample_group["id"]}/items', json={'name': 'Second'}).get_json()['item']
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 5})
+        auth_client.post(f'/api/items/{second["id"]}/rate', json={'score': 3})
+        # Changing a score is not a new rating
+        auth_client.post(f'/api/items/{second["id"]}/rate', json={'score': 4})
+
+        card = self.card(auth_client, sample_group['id'])
+        assert card['item_count'] == 2
+        assert card['rating_count'] == 2
+        assert card['last_activity_at'] > sample_group['created_at']
+
+        auth_client.delete(f'/api/items/{second["id"]}')
+        card = self.card(auth_client, sample_group['id'])
+        assert card['item_count'] == 1
+        assert card['rating_count'] == 1
+
+    def test_batch_ratings_count_new_ratings(self, auth_client, sample_group, sample_item):
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 2})
+        second = auth_client.post(f'/api/groups/{sample_group["id"]}/items', json={'name': 'Second'}).get_json()['item']
+        auth_client.post(f'/api/groups/{sample_group["id"]}/ratings/batch', json={'ratings': [
+            {'item_id': sample_item['id'], 'score': 4},
+            {'item_id': second['id'], 'score': 5}
+        ]})
+        assert self.card(auth_client, sample_group['id'])['rating_count'] == 2
+
+    def test_summary_on_list_cards(self, auth_client, sample_group, sample_item):
+        group = next(g for g in auth_client.get('/api/groups').get_json()['groups'] if g['id'] == sample_group['id'])
+        assert group['item_count'] == 1
+        assert 'last_activity_at' in group
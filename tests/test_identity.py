@@ -0,0 +1,128 @@
+"""
+Per-request identity map tests
+"""
+import threading
+
+from bson import ObjectId
+from models.group import Group
+from models.item import Item
+from models.membership import Membership
+from models.user import User
+from utils.db import groups_collection, memberships_collection
+from utils.group_cleanup import group_cleanup
+from utils.identity import identity_map
+
+
+def count_calls(monkeypatch, collection, method):
+    """Count calls to one collection method"""
+    calls = []
+    original = getattr(collection, method)
+
+    def counted(*args, **kwargs):
+        calls.append(args)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(collection, method, counted)
+    return calls
+
+
+class TestIdentityMap:
+    """Test lookups inside and outside a request"""
+
+    def test_repeat_lookups_are_served_from_memory(self, app, sample_group, monkeypatch):
+        calls = count_calls(monkeypatch, groups_collection, 'find_one')
+        with app.test_request_context():
+            first = Group.find_by_id(sample_group['id'])
+            assert Group.find_by_id(sample_group['id']) is first
+            assert Group.find_by_id(ObjectId(sample_group['id'])) is first
+            assert identity_map.saved() == 2
+        assert len(calls) == 1
+
+    def test_misses_are_remembered(self, app, monkeypatch):
+        calls = count_calls(monkeypatch, groups_collection, 'find_one')
+        with app.test_request_context():
+            missing = str(ObjectId())
+            assert Group.find_by_id(missing) is None
+            assert Group.find_by_id(missing) is None
+        assert len(calls) == 1
+
+    def test_no_request_no_map(self, app, sample_group, monkeypatch):
+        # Background threads (rating flush, index rebuilds) have no request
+        calls = count_calls(monkeypatch, groups_collection, 'find_one')
+        thread = threading.Thread(target=lambda: [Group.find_by_id(sample_group['id']) for _ in range(2)])
+        thread.start()
+        thread.join()
+        assert len(calls) == 2
+
+    def test_custom_projection_bypasses_map(self, app, sample_group, monkeypatch):
+        calls = count_calls(monkeypatch, groups_collection, 'find_one')
+        with app.test_request_context():
+            Group.find_by_id(sample_group['id'])
+            Group.find_by_id(sample_group['id'], {'name': 1})
+        assert len(calls) == 2
+
+    def test_writes_evict(self, app, sample_group):
+        user = User.create('other', 'other@example.com', 'password123')
+        with app.test_request_context():
+            assert Group.find_by_id(sample_group['id'])['member_count'] == 1
+            assert not Group.is_member(sample_group['id'], user.id)
+
+            Group.add_member(sample_group['id'], user.id)
+            assert Group.find_by_id(sample_group['id'])['member_count'] == 2
+            assert Group.is_member(sample_group['id'], user.id)
+
+            Group.remove_member(sample_group['id'], user.id)
+            assert not Group.is_member(sample_group['id'], user.id)
+
+    def test_item_update_evicts(self, app, sample_item):
+        with app.test_request_context():
+            Item.find_by_id(sample_item['id'])
+            updated = Item.update_rating_stats(sample_item['id'], None, 5)
+            assert Item.find_by_id(sample_item['id'])['rating_count'] == updated['rating_count'] == 1
+
+    def test_delete_group_evicts(self, app, sample_group, sample_item):
+        owner = str(Group.find_by_id(sample_group['id'])['created_by'])
+        with app.test_request_context():
+            assert Item.find_by_id(sample_item['id'])
+            assert Group.is_admin(sample_group['id'], owner)
+            Group.delete(sample_group['id'])
+            assert Group.find_by_id(sample_group['id']) is None
+            group_cleanup.run_pending()
+            assert Item.find_by_id(sample_item['id']) is None
+            assert Membership.get_role(sample_group['id'], owner) is None
+
+    def test_batched_roles_fill_the_map(self, app, sample_group, monkeypatch):
+        user_id = str(ObjectId())
+        with app.test_request_context():
+            Membership.get_roles(user_id, [sample_group['id']])
+            calls = count_calls(monkeypatch, memberships_collection, 'find_one')
+            assert not Group.is_member(sample_group['id'], user_id)
+        assert calls == []
+
+    def test_requests_do_not_share_entries(self, app, sample_group):
+        with app.test_request_context():
+            Group.find_by_id(sample_group['id'])
+            identity_map.finish()
+        groups_collection.update_one({'_id': ObjectId(sample_group['id'])}, {'$set': {'name': 'Renamed'}})
+        with app.test_request_context():
+            assert Group.find_by_id(sample_group['id'])['name'] == 'Renamed'
+
+
+class TestReadsSavedReporting:
+    """Test the per-request header and health metrics"""
+
+    def test_kick_reuses_admin_check(self, auth_client, sample_group):
+        user = User.create('member', 'member@example.com', 'password123')
+        Group.add_member(sample_group['id'], user.id)
+        response = auth_client.delete(f'/api/groups/{sample_group["id"]}/members/{user.id}')
+        assert response.status_code == 200
+        assert int(response.headers['X-DB-Reads-Saved']) >= 1
+
+    def test_header_on_every_response(self, client):
+        assert client.get('/api/groups').headers['X-DB-Reads-Saved'] == '0'
+
+    def test_metrics_on_health_check(self, auth_client, sample_group):
+        auth_client.get(f'/api/groups/{sample_group["id"]}')
+        metrics = auth_client.get('/api/health').get_json()['metrics']['identity_map']
+        assert metrics['requests'] >= 1
+        assert 'reads_saved' in metrics
@@ -1,3 +1,10 @@
+import json
+
+import pytest
+from bson import json_util
+from utils.pagination import encode_cursor
+
+
 class TestItems:
     """Test item functionality"""
 
@@ -55,4 +62,166 @@ class TestItems:
 
         # Item 2 should be ranked higher
         assert items[0]['id'] == item2['id']
-        assert items[0]['rank'] == 1
\ No newline at end of file
+        assert items[0]['rank'] == 1
+
+    def test_score_sort_prefers_confident_items(self, auth_client, app, sample_group):
+        """sort=score ranks a well-rated item above a single 5-star vote"""
+        lone = auth_client.post(f'/api/groups/{sample_group["id"]}/items', json={
+            'name': 'One Vote', 'description': ''
+        }).get_json()['item']
+        popular = auth_client.post(f'/api/groups/{sample_group["id"]}/items', json={
+            'name': 'Many Votes', 'description': ''
+        }).get_json()['item']
+
+        auth_client.post(f'/api/items/{lone["id"]}/rate', json={'score': 5})
+        auth_client.post(f'/api/items/{popular["id"]}/rate', json={'score': 4})
+
+        other = app.test_client()
+        other.post('/api/auth/register', json={
+            'username': 'seconduser',
+            'email': 'second@example.com',
+            'password': 'password123'
+        })
+        other.post(f'/api/groups/{sample_group["id"]}/join')
+        other.post(f'/api/items/{popular["id"]}/rate', json={'score': 5})
+
+        by_rating = auth_client.get(f'/api/groups/{sample_group["id"]}/leaderboard')
+        assert by_rating.get_json()['leaderboard'][0]['id'] == lone['id']
+
+        by_score = auth_client.get(f'/api/groups/{sample_group["id"]}/leaderboard?sort=score')
+        leaderboard = by_score.get_json()['leaderboard']
+        assert leaderboard[0]['id'] == popular['id']
+        assert leaderboard[0]['rank_score'] > leaderboard[1]['rank_score']
+
+    def test_stored_score_matches_formula(self, auth_client, sample_item):
+        """The score written by the database pipeline matches rank_score()"""
+        from models.item import rank_score
+
+        response = auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 4})
+        item = response.get_json()['item']
+        assert item['rank_score'] == round(rank_score(4, 1), 3)
+        assert rank_score(0, 0) == 0.0
+
+
+class TestItemPagination:
+    """Test keyset pagination of item listings"""
+
+    @pytest.fixture
+    def rated_items(self, auth_client, sample_group):
+        """Five items with mixed (and tied) ratings"""
+        ids = []
+        for n, score in enumerate([3, 5, 3, 1, 4]):
+            item = auth_client.post(f'/api/groups/{sample_group["id"]}/items', json={
+                'name': f'Paged {n}', 'description': ''
+            }).get_json()['item']
+            auth_client.post(f'/api/items/{item["id"]}/rate', json={'score': score})
+            ids.append(item['id'])
+        return ids
+
+    @pytest.mark.parametrize('path,key', [
+        ('leaderboard', 'leaderboard'),
+        ('items', 'items'),
+        ('items?sort=new&', 'items'),
+    ])
+    def test_pages_match_full_listing(self, auth_client, sample_group, rated_items, path, key):
+        """Walking every page yields the full listing with continuous ranks"""
+        base = f'/api/groups/{sample_group["id"]}/{path}'
+        sep = '' if base.endswith('&') else '?'
+        full = auth_client.get(base).get_json()[key]
+
+        paged = []
+        cursor = None
+        while True:
+            url = f'{base}{sep}limit=2' + (f'&after={cursor}' if cursor else '')
+            data = auth_client.get(url).get_json()
+            assert len(data[key]) <= 2
+            paged.extend(data[key])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+
+        assert [i['id'] for i in paged] == [i['id'] for i in full]
+        assert [i['rank'] for i in paged] == list(range(1, len(full) + 1))
+
+    def test_invalid_cursor_rejected(self, auth_client, sample_group, rated_items):
+        """A garbled cursor is a 400, not a server error"""
+        response = auth_client.get(
+            f'/api/groups/{sample_group["id"]}/leaderboard?limit=2&after=garbage'
+        )
+        assert response.status_code == 400
+
+    def test_cursor_from_other_sort_rejected(self, auth_client, sample_group, rated_items):
+        """A cursor only continues the sort it was issued for"""
+        cursor = auth_client.get(
+            f'/api/groups/{sample_group["id"]}/leaderboard?limit=2'
+        ).get_json()['next_cursor']
+        response = auth_client.get(
+            f'/api/groups/{sample_group["id"]}/leaderboard?sort=score&limit=2&after={cursor}'
+        )
+        assert response.status_code == 400
+
+    def test_cursor_operators_rejected(self, auth_client, sample_group, rated_items):
+        """Cursor values can't smuggle query operators into the filter"""
+        for payload in (
+            {'s': 'rating', 'k': [{'$regex': '.*'}, 0, {'$oid': '0' * 24}], 'r': 2},
+            {'s': 'rating', 'k': [4.0, 1, {'$oid': '0' * 24}], 'r': {'$gt': 0}},
+        ):
+            cursor = encode_cursor(json_util.loads(json.dumps(payload)))
+            response = auth_client.get(
+                f'/api/groups/{sample_group["id"]}/leaderboard?limit=2&after={cursor}'
+            )
+            assert response.status_code == 400
+
+
+class TestItemRank:
+    """Test single-item rank lookup"""
+
+    def test_rank_matches_leaderboard(self, auth_client, sample_group):
+        """Every item's rank equals its position in the full leaderboard"""
+        for n, score in enumerate([4, 2, 4, 5, 1]):
+            item = auth_client.post(f'/api/groups/{sample_group["id"]}/items', json={
+                'name': f'Ranked {n}', 'description': ''
+            }).get_json()['item']
+            auth_client.post(f'/api/items/{item["id"]}/rate', json={'score': score})
+
+        for sort in ('rating', 'score', 'new'):
+            leaderboard = auth_client.get(
+                f'/api/groups/{sample_group["id"]}/items?sort={sort}'
+            ).get_json()['items']
+            for entry in leaderboard:
+                data = auth_client.get(
+                    f'/api/items/{entry["id"]}/rank?sort={sort}'
+                ).get_json()
+                assert data['rank'] == entry['rank']
+
+    def test_rank_neighbors(self, auth_client, sample_group):
+        """Neighbours come back in leaderboard order with their ranks"""
+        ids = []
+        for n, score in enumerate([5, 4, 3, 2, 1]):
+            item = auth_client.post(f'/api/groups/{sample_group["id"]}/items', json={
+                'name': f'Neighbour {n}', 'description': ''
+            }).get_json()['item']
+            auth_client.post(f'/api/items/{item["id"]}/rate', json={'score': score})
+            ids.append(item['id'])
+
+        data = auth_client.get(f'/api/items/{ids[2]}/rank?neighbors=1').get_json()
+        assert data['rank'] == 3
+        assert [i['id'] for i in data['above']] == [ids[1]]
+        assert [i['rank'] for i in data['above']] == [2]
+        assert [i['id'] for i in data['below']] == [ids[3]]
+        assert data['below'][0]['rank'] == 4
+
+    def test_rank_neighbors_zero(self, auth_client, sample_item):
+        """The default of no neighbours can also be asked for explicitly"""
+        response = auth_client.get(f'/api/items/{sample_item["id"]}/rank?neighbors=0')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['above'] == [] and data['below'] == []
+
+        response = auth_client.get(f'/api/items/{sample_item["id"]}/rank?neighbors=-1')
+        assert response.status_code == 400
+
+    def test_rank_missing_item(self, client):
+        """Unknown items are a 404"""
+        response = client.get('/api/items/000000000000000000000000/rank')
+        assert response.status_code == 404
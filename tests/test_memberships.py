@@ -0,0 +1,326 @@
+"""
+Membership collection tests
+"""
+import os
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+import utils.db
+from models.group import Group
+from models.group_change import GroupChange
+from models.membership import Membership
+from models.user import User
+from utils.db import groups_collection, job_state_collection, memberships_collection, users_collection
+from utils.group_cleanup import group_cleanup
+from utils.identity import identity_map
+from utils.membership_cache import membership_cache
+
+
+def other_user(name='other'):
+    return User.create(name, f'{name}@example.com', 'password123')
+
+
+class TestMemberships:
+    """Test membership reads and writes"""
+
+    def test_group_document_has_no_member_arrays(self, sample_group):
+        group = groups_collection.find_one({'_id': ObjectId(sample_group['id'])})
+        assert 'members' not in group
+        assert 'admins' not in group
+        assert Membership.get_role(sample_group['id'], str(group['created_by'])) == 'owner'
+
+    def test_join_and_leave(self, sample_group):
+        user = other_user()
+        assert Group.add_member(sample_group['id'], user.id) is True
+        assert Group.add_member(sample_group['id'], user.id) is False
+        assert Group.find_by_id(sample_group['id'])['member_count'] == 2
+        assert Group.is_member(sample_group['id'], user.id)
+        assert not Group.is_admin(sample_group['id'], user.id)
+
+        assert Group.remove_member(sample_group['id'], user.id) is True
+        assert Group.remove_member(sample_group['id'], user.id) is False
+        assert Group.find_by_id(sample_group['id'])['member_count'] == 1
+        assert not Group.is_member(sample_group['id'], user.id)
+
+    def test_repeated_joins_count_once(self, auth_client, sample_group):
+        for _ in range(3):
+            auth_client.post(f'/api/groups/{sample_group["id"]}/join')
+        user = other_user()
+        for _ in range(3):
+            Group.add_member(sample_group['id'], user.id)
+        assert groups_collection.find_one({'_id': ObjectId(sample_group['id'])})['member_count'] == 2
+        assert users_collection.find_one({'_id': ObjectId(user.id)})['groups_joined'] == [sample_group['id']]
+
+        Group.remove_member(sample_group['id'], user.id)
+        Group.remove_member(sample_group['id'], user.id)
+        assert groups_collection.find_one({'_id': ObjectId(sample_group['id'])})['member_count'] == 1
+        assert users_collection.find_one({'_id': ObjectId(user.id)})['groups_joined'] == []
+
+    def test_owner_cannot_leave(self, auth_client, sample_group):
+        res = auth_client.post(f'/api/groups/{sample_group["id"]}/leave')
+        assert res.status_code == 403
+        assert groups_collection.find_one({'_id': ObjectId(sample_group['id'])})['member_count'] == 1
+
+    def test_join_route_errors(self, auth_client, sample_group):
+        assert auth_client.post(f'/api/groups/{sample_group["id"]}/join').status_code == 400
+        assert auth_client.post(f'/api/groups/{ObjectId()}/join').status_code == 404
+        user = other_user()
+        assert auth_client.delete(f'/api/groups/{sample_group["id"]}/members/{user.id}').status_code == 404
+
+    def test_join_missing_group_leaves_no_membership(self, app):
+        user = other_user()
+        assert Group.add_member(str(ObjectId()), user.id) is False
+        assert memberships_collection.count_documents({'user_id': ObjectId(user.id)}) == 0
+
+    def test_kick_rules(self, auth_client, sample_group):
+        owner = auth_client.get('/api/auth/me').get_json()['user']['id']
+        member, admin = other_user('member'), other_user('admin')
+        Group.add_member(sample_group['id'], member.id)
+        memberships_collection.insert_one({
+            'group_id': ObjectId(sample_group['id']), 'user_id': ObjectId(admin.id), 'role': 'admin'
+        })
+
+        res = auth_client.delete(f'/api/groups/{sample_group["id"]}/members/{admin.id}')
+        assert res.status_code == 403
+        res = auth_client.delete(f'/api/groups/{sample_group["id"]}/members/{member.id}')
+        assert res.status_code == 200
+        assert not Group.is_member(sample_group['id'], member.id)
+        assert Group.is_member(sample_group['id'], owner)
+
+    def test_list_flags_come_from_memberships(self, auth_client, sample_group):
+        user = other_user()
+        Group.create('Not Joined', 'Someone else', user.id)
+        groups = {g['name']: g for g in auth_client.get('/api/groups').get_json()['groups']}
+        assert groups[sample_group['name']]['is_member'] is True
+        assert groups[sample_group['name']]['is_admin'] is True
+        assert groups['Not Joined']['is_member'] is False
+
+    def test_my_groups_come_from_memberships(self, auth_client, sample_group):
+        user = other_user()
+        joined = Group.create('Joined Later', 'x', user.id)
+        auth_client.post(f'/api/groups/{joined["_id"]}/join')
+        ids = {g['id'] for g in auth_client.get('/api/me/groups').get_json()['groups']}
+        assert ids == {sample_group['id'], str(joined['_id'])}
+
+    def test_delete_group_removes_memberships(self, auth_client, sample_group):
+        auth_client.delete(f'/api/groups/{sample_group["id"]}')
+        group_cleanup.run_pending()
+        assert memberships_collection.count_documents({'group_id': ObjectId(sample_group['id'])}) == 0
+
+
+class FailingUsers:
+    """users_collection stand-in whose writes fail mid-join"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def update_one(self, *args, **kwargs):
+        raise RuntimeError('users write failed')
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+class TestMembershipTransactions:
+    """Test joins and leaves on deployments with transactions"""
+
+    @pytest.fixture(autouse=True)
+    def require_transactions(self, app):
+        if not utils.db.supports_transactions():
+            if os.getenv('REQUIRE_TRANSACTIONS'):
+                pytest.fail('REQUIRE_TRANSACTIONS is set but the server has no transactions')
+            pytest.skip('needs a replica set')
+
+    def test_interrupted_join_rolls_back(self, sample_group, monkeypatch):
+        user = other_user()
+        monkeypatch.setattr(utils.db, 'users_collection', FailingUsers(users_collection))
+
+        with pytest.raises(RuntimeError):
+            Group.add_member(sample_group['id'], user.id)
+
+        assert Membership.get_role(sample_group['id'], user.id) is None
+        assert groups_collection.find_one({'_id': ObjectId(sample_group['id'])})['member_count'] == 1
+
+    def test_interrupted_leave_rolls_back(self, sample_group, monkeypatch):
+        user = other_user()
+        Group.add_member(sample_group['id'], user.id)
+        monkeypatch.setattr(utils.db, 'users_collection', FailingUsers(users_collection))
+
+        with pytest.raises(RuntimeError):
+            Group.remove_member(sample_group['id'], user.id)
+
+        assert Membership.get_role(sample_group['id'], user.id) == 'member'
+        assert groups_collection.find_one({'_id': ObjectId(sample_group['id'])})['member_count'] == 2
+
+    def test_join_missing_group_leaves_no_membership(self, app):
+        user = other_user()
+        group_id = str(ObjectId())
+        assert Group.add_member(group_id, user.id) is False
+        assert memberships_collection.count_documents({'group_id': ObjectId(group_id)}) == 0
+
+
+class TestMembershipMigration:
+    """Test copying legacy member arrays into the memberships collection"""
+
+    def legacy_group(self, owner, admin, member):
+        return groups_collection.insert_one({
+            'name': 'Legacy', 'name_lower': 'legacy', 'description': 'Old shape',
+            'created_by': owner, 'members': [owner, admin, member], 'admins': [owner, admin],
+            'member_count': 3, 'version': 0, 'created_at': datetime.utcnow()
+        }).inserted_id
+
+    def test_arrays_become_memberships(self, app):
+        owner, admin, member = ObjectId(), ObjectId(), ObjectId()
+        group_id = self.legacy_group(owner, admin, member)
+        job_state_collection.delete_many({})
+
+        assert Membership.migrate_from_arrays(batch_size=1) == 1
+        assert Membership.get_roles_in_group(group_id, [owner, admin, member]) == {
+            str(owner): 'owner', str(admin): 'admin', str(member): 'member'
+        }
+        group = groups_collection.find_one({'_id': group_id})
+        assert 'members' not in group and 'admins' not in group
+
+    def test_migration_is_resumable_and_runs_once(self, app):
+        owner, admin, member = ObjectId(), ObjectId(), ObjectId()
+        group_id = self.legacy_group(owner, admin, member)
+        # An earlier run copied one membership and then stopped
+        memberships_collection.insert_one({'group_id': group_id, 'user_id': member, 'role': 'member'})
+        job_state_collection.delete_many({})
+
+        assert Membership.migrate_from_arrays() == 1
+        assert memberships_collection.count_documents({'group_id': group_id}) == 3
+
+        self.legacy_group(owner, admin, member)
+        assert Membership.migrate_from_arrays() == 0
+
+    def test_members_index_kept_until_done(self, app):
+        groups_collection.create_index('members')
+        self.legacy_group(ObjectId(), ObjectId(), ObjectId())
+        job_state_collection.delete_many({})
+        assert 'members_1' in groups_collection.index_information()
+        assert Membership.migration_pending()
+
+        assert Membership.migrate_from_arrays(batch_size=1) == 1
+        assert not Membership.migration_pending()
+        assert 'members_1' not in groups_collection.index_information()
+
+    def test_unmigrated_members_keep_access(self, app):
+        owner, admin, member = ObjectId(), ObjectId(), ObjectId()
+        group_id = self.legacy_group(owner, admin, member)
+        job_state_collection.delete_many({})
+        assert Membership.migration_pending()
+
+        assert Group.is_member(group_id, member)
+        assert Group.is_admin(group_id, admin)
+        assert Membership.get_role(group_id, owner) == 'owner'
+        assert Membership.get_roles(member, [group_id]) == {str(group_id): 'member'}
+        assert Membership.get_roles_in_group(group_id, [admin, ObjectId()]) == {str(admin): 'admin'}
+        assert [g['_id'] for g in Group.get_user_groups(member)] == [group_id]
+
+    def test_non_members_not_cached_during_migration(self, app):
+        group_id = self.legacy_group(ObjectId(), ObjectId(), ObjectId())
+        user = ObjectId()
+        job_state_collection.delete_many({})
+        assert Membership.migration_pending()
+        assert not Group.is_member(group_id, user)
+
+        # Another worker's write, which this worker's cache never hears about
+        memberships_collection.insert_one({'group_id': group_id, 'user_id': user, 'role': 'member'})
+        identity_map.finish()
+        assert Group.is_member(group_id, user)
+
+    def test_batches_walk_groups_once(self, app, monkeypatch):
+        for _ in range(5):
+            self.legacy_group(ObjectId(), ObjectId(), ObjectId())
+        job_state_collection.delete_many({})
+        original = groups_collection.find
+        queries = []
+
+        def recorded(query, *args, **kwargs):
+            queries.append(query)
+            return original(query, *args, **kwargs)
+
+        monkeypatch.setattr(groups_collection, 'find', recorded)
+        assert Membership.migrate_from_arrays(batch_size=2) == 5
+        # Each batch starts after the last _id of the one before
+        assert len(queries) == 4
+        assert all('_id' in query for query in queries[1:])
+
+
+class TestMembershipCache:
+    """Test the cross-request role cache"""
+
+    @pytest.fixture
+    def cache(self, app):
+        membership_cache.configure(check_interval=0)
+        yield membership_cache
+        membership_cache.configure(
+            enabled=app.config['MEMBERSHIP_CACHE_ENABLED'],
+            max_entries=app.config['MEMBERSHIP_CACHE_MAX_ENTRIES'],
+            ttl=app.config['MEMBERSHIP_CACHE_TTL'],
+            check_interval=app.config['MEMBERSHIP_CACHE_CHECK_INTERVAL']
+        )
+
+    def is_member(self, group_id, user_id):
+        """Check membership as a fresh request would"""
+        identity_map.finish()
+        return Group.is_member(group_id, user_id)
+
+    def test_repeat_checks_skip_the_database(self, cache, sample_group, monkeypatch):
+        user = other_user()
+        Group.add_member(sample_group['id'], user.id)
+        assert self.is_member(sample_group['id'], user.id)
+
+        calls = []
+        original = memberships_collection.find_one
+        monkeypatch.setattr(memberships_collection, 'find_one',
+                            lambda *args, **kwargs: calls.append(args) or original(*args, **kwargs))
+        assert self.is_member(sample_group['id'], user.id)
+        assert not self.is_member(sample_group['id'], str(ObjectId()))
+        assert self.is_member(sample_group['id'], user.id)
+        assert len(calls) == 1
+
+    def test_local_writes_invalidate(self, cache, auth_client, sample_group):
+        user = other_user()
+        assert not self.is_member(sample_group['id'], user.id)
+        Group.add_member(sample_group['id'], user.id)
+        assert self.is_member(sample_group['id'], user.id)
+
+        auth_client.delete(f'/api/groups/{sample_group["id"]}/members/{user.id}')
+        assert not self.is_member(sample_group['id'], user.id)
+
+    def test_delete_group_invalidates(self, cache, auth_client, sample_group):
+        owner = auth_client.get('/api/auth/me').get_json()['user']['id']
+        assert self.is_member(sample_group['id'], owner)
+        auth_client.delete(f'/api/groups/{sample_group["id"]}')
+        group_cleanup.run_pending()
+        assert not self.is_member(sample_group['id'], owner)
+
+    def test_kick_in_another_worker_is_seen_through_the_log(self, cache, sample_group):
+        user = other_user()
+        Group.add_member(sample_group['id'], user.id)
+        assert self.is_member(sample_group['id'], user.id)
+
+        # Another worker removed the membership: nothing here was told
+        memberships_collection.delete_one({'user_id': ObjectId(user.id)})
+        assert self.is_member(sample_group['id'], user.id)
+
+        invalidations = cache.stats()['remote_invalidations']
+        GroupChange.record(sample_group['id'], 99, members=True)
+        assert not self.is_member(sample_group['id'], user.id)
+        assert cache.stats()['remote_invalidations'] == invalidations + 1
+
+    def test_item_changes_keep_cached_roles(self, cache, sample_group, sample_item):
+        user = other_user()
+        Group.add_member(sample_group['id'], user.id)
+        assert self.is_member(sample_group['id'], user.id)
+        memberships_collection.delete_one({'user_id': ObjectId(user.id)})
+
+        Group.mark_changed(sample_group['id'], item_ids=[sample_item['id']])
+        assert self.is_member(sample_group['id'], user.id)
+
+    def test_metrics_on_health_check(self, client):
+        metrics = client.get('/api/health').get_json()['metrics']['membership_cache']
+        assert 'hit_rate' in metrics and 'check_interval' in metrics
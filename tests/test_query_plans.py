@@ -0,0 +1,238 @@
+"""
+Query plan regression tests
+
+Every query the models send is captured with a pymongo command listener and
+re-run through explain() against a seeded mongod. A COLLSCAN or a blocking
+SORT stage in any winning plan fails the test, so a missing or mismatched
+index is caught before deploy.
+"""
+import sys
+
+import pytest
+from bson import ObjectId
+from pymongo import MongoClient, monitoring
+from pymongo.collection import Collection
+
+import utils.db
+from models.group import Group
+from models.group_change import GroupChange
+from models.item import Item
+from models.membership import Membership
+from models.rating import Rating
+from models.user import User
+from utils.group_cleanup import GroupCleanup
+from utils.membership_cache import MembershipCache
+from utils.pagination import encode_cursor
+from utils.suggest import GroupSuggester
+
+EXPLAINABLE = {'find', 'aggregate', 'count', 'distinct', 'update', 'delete', 'findAndModify'}
+FORBIDDEN_STAGES = {'COLLSCAN', 'SORT'}
+
+# Relevance order can only be sorted after the text index has matched,
+# and partial-word matches $or two indexes, so SORT is expected there
+# (bounded by the page limit). A user's latest rating in a group is sorted
+# from the ratings of that one user and group.
+ALLOWED_STAGES = {
+    'group.get_page.search': {'SORT'},
+    'group.get_page.partial': {'SORT'},
+    'rating.last_rated_at': {'SORT'},
+}
+
+
+class CommandRecorder(monitoring.CommandListener):
+    """Collects read/write commands that can be explained"""
+
+    def __init__(self):
+        self.commands = []
+
+    def started(self, event):
+        if event.command_name in EXPLAINABLE:
+            self.commands.append(dict(event.command))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def explainable_commands(command):
+    """Strip driver fields and split multi-statement writes for explain()"""
+    command = {
+        key: value for key, value in command.items()
+        if not key.startswith('$')
+        and key not in ('lsid', 'txnNumber', 'ordered', 'readConcern', 'writeConcern')
+    }
+    for statements in ('updates', 'deletes'):
+        if statements in command:
+            for statement in command[statements]:
+                yield dict(command, **{statements: [statement]})
+            return
+    yield command
+
+
+def plan_stages(node):
+    """Yield every stage name in the winning plans of an explain() result"""
+    if isinstance(node, list):
+        for child in node:
+            yield from plan_stages(child)
+    elif isinstance(node, dict):
+        for key, value in node.items():
+            if key == 'winningPlan':
+                yield from _stages(value)
+            elif key != 'rejectedPlans':
+                yield from plan_stages(value)
+
+
+def _stages(node):
+    if isinstance(node, list):
+        for child in node:
+            yield from _stages(child)
+    elif isinstance(node, dict):
+        if 'stage' in node:
+            yield node['stage']
+        for value in node.values():
+            yield from _stages(value)
+
+
+@pytest.fixture
+def recorder(app, monkeypatch):
+    """Route every model collection through a client that records commands"""
+    recorder = CommandRecorder()
+    try:
+        client = MongoClient(utils.db.MONGO_URI, event_listeners=[recorder],
+                             serverSelectionTimeoutMS=2000)
+        database = client[utils.db.db.name]
+        database.command('explain', {'find': 'items', 'filter': {}}, verbosity='queryPlanner')
+    except Exception as e:
+        pytest.skip(f"explain() needs a running mongod: {e}")
+
+    for name, module in list(sys.modules.items()):
+        if module is None or not name.startswith(('models', 'utils')):
+            continue
+        for attr, value in list(vars(module).items()):
+            if isinstance(value, Collection):
+                monkeypatch.setattr(module, attr, database[value.name])
+
+    recorder.database = database
+    yield recorder
+    client.close()
+
+
+@pytest.fixture
+def seeded(recorder):
+    """A user, a group with a second member, rated items, and recorded commands reset"""
+    owner = User.create('planowner', 'planowner@example.com', 'password123')
+    member = User.create('planmember', 'planmember@example.com', 'password123')
+    group = Group.create('Plan Group', 'Explain plan fixtures', owner.id)
+    Group.add_member(str(group['_id']), member.id)
+
+    items = [
+        Item.create(str(group['_id']), f'Item {n}', '', owner.id)
+        for n in range(30)
+    ]
+    for n, item in enumerate(items):
+        for user in (owner, member):
+            score = (n % 5) + 1
+            Rating.create_or_update(user.id, str(group['_id']), str(item['_id']), score)
+            Item.update_rating_stats(str(item['_id']), None, score)
+
+    recorder.commands.clear()
+    return {
+        'owner': owner.id,
+        'member': member.id,
+        'group': str(group['_id']),
+        'item': str(items[0]['_id']),
+        'items': [str(i['_id']) for i in items],
+    }
+
+
+def run_cleanup():
+    """Cascade deleted groups in small batches"""
+    cleanup = GroupCleanup()
+    cleanup.configure(batch_size=10, interval=0)
+    return cleanup.run_pending()
+
+
+def check_membership_log():
+    """Run a membership cache's change log check (the first one only sets its marker)"""
+    cache = MembershipCache()
+    cache.configure(check_interval=0)
+    cache._check_remote_writes()
+    cache._check_remote_writes()
+
+
+QUERIES = [
+    ('item.find_by_id', lambda s: Item.find_by_id(s['item'])),
+    ('item.find_many', lambda s: Item.find_many(s['items'][:5], s['group'])),
+    ('item.get_by_group.rating', lambda s: Item.get_by_group(s['group'], 'rating')),
+    ('item.get_by_group.score', lambda s: Item.get_by_group(s['group'], 'score')),
+    ('item.get_by_group.new', lambda s: Item.get_by_group(s['group'], 'new')),
+    ('item.get_page', lambda s: Item.get_page(s['group'], 'rating', 10)),
+    ('item.get_page.after',
+     lambda s: Item.get_page(s['group'], 'score', 10, Item.get_page(s['group'], 'score', 10)[2])),
+    ('item.get_rank', lambda s: Item.get_rank(Item.find_by_id(s['items'][10]), 'rating', 3)),
+    ('item.top_by_groups', lambda s: Item.top_by_groups([s['group'], str(ObjectId())])),
+    ('item.update_rating_stats', lambda s: Item.update_rating_stats(s['item'], 3, 4)),
+    ('item.apply_rating_changes', lambda s: Item.apply_rating_changes({s['item']: (4, 5)})),
+    ('item.recompute_rating_stats', lambda s: Item.recompute_rating_stats(s['items'][:5])),
+    ('item.delete', lambda s: Item.delete(s['items'][-1])),
+    ('rating.create_or_update', lambda s: Rating.create_or_update(s['owner'], s['group'], s['item'], 2)),
+    ('rating.create_or_update_many',
+     lambda s: Rating.create_or_update_many(s['owner'], s['group'], {i: 3 for i in s['items'][:5]})),
+    ('rating.last_rated_at', lambda s: Rating.last_rated_at(s['owner'], s['group'])),
+    ('rating.get_user_rating', lambda s: Rating.get_user_rating(s['owner'], s['item'])),
+    ('rating.get_user_ratings_for_group', lambda s: Rating.get_user_ratings_for_group(s['owner'], s['group'])),
+    ('rating.get_user_ratings_for_group.page',
+     lambda s: Rating.get_user_ratings_for_group(s['owner'], s['group'], s['items'][:5])),
+    ('rating.count_by_groups', lambda s: Rating.count_by_groups(s['owner'], [s['group'], str(ObjectId())])),
+    ('rating.delete_by_item', lambda s: Rating.delete_by_item(s['item'])),
+    ('group.find_by_id', lambda s: Group.find_by_id(s['group'])),
+    ('group.get_version', lambda s: Group.get_version(s['group'])),
+    ('group.mark_changed', lambda s: Group.mark_changed(s['group'])),
+    ('group_change.since', lambda s: GroupChange.since(s['group'], 0)),
+    ('group.get_page.popular', lambda s: Group.get_page(sort='popular')),
+    ('group.get_page.new', lambda s: Group.get_page(sort='new')),
+    ('group.get_page.name', lambda s: Group.get_page(sort='name')),
+    ('group.get_page.after',
+     lambda s: Group.get_page(sort='popular', cursor=encode_cursor({'s': 'popular', 'k': [2, ObjectId()]}))),
+    ('group.get_page.search', lambda s: Group.get_page(search='plan fixtures')),
+    ('group.get_page.partial', lambda s: Group.get_page(search='fixtu')),
+    ('group.get_page.prefix', lambda s: Group.get_page(search='Pl')),
+    ('group.get_page.prefix.after',
+     lambda s: Group.get_page(search='Pl', cursor=encode_cursor({'s': 'name', 'k': ['pl', ObjectId()]}))),
+    ('membership.get_role', lambda s: Membership.get_role(s['group'], s['member'])),
+    ('membership.get_roles', lambda s: Membership.get_roles(s['member'], [s['group'], ObjectId()])),
+    ('membership.get_roles_in_group',
+     lambda s: Membership.get_roles_in_group(s['group'], [s['owner'], s['member']])),
+    ('membership.get_group_ids', lambda s: Membership.get_group_ids(s['member'])),
+    ('membership.remove', lambda s: Membership.remove(s['group'], s['member'])),
+    ('group.get_user_groups', lambda s: Group.get_user_groups(s['member'])),
+    ('group.is_member', lambda s: Group.is_member(s['group'], s['member'])),
+    ('group.is_admin', lambda s: Group.is_admin(s['group'], s['owner'])),
+    ('group.add_member', lambda s: Group.add_member(s['group'], str(ObjectId()))),
+    ('group.remove_member', lambda s: Group.remove_member(s['group'], s['member'])),
+    ('group.kick_member', lambda s: Group.kick_member(s['group'], s['member'], s['owner'])),
+    ('group.delete', lambda s: Group.delete(s['group'])),
+    ('group_cleanup.run_pending', lambda s: Group.delete(s['group']) and run_cleanup()),
+    ('group_cleanup.stats', lambda s: GroupCleanup().stats()),
+    ('group_suggestions.rebuild', lambda s: GroupSuggester().rebuild()),
+    ('membership_cache.check', lambda s: check_membership_log()),
+    ('user.find_by_id', lambda s: User.find_by_id(s['owner'])),
+    ('user.find_by_email', lambda s: User.find_by_email('planowner@example.com')),
+]
+
+
+@pytest.mark.parametrize('name,query', QUERIES)
+def test_query_plan_uses_indexes(name, query, seeded, recorder):
+    """The model query is served by an index and needs no in-memory sort"""
+    query(seeded)
+    assert recorder.commands, f"{name} sent no explainable commands"
+
+    for command in recorder.commands:
+        for explainable in explainable_commands(command):
+            result = recorder.database.command(
+                'explain', explainable, verbosity='queryPlanner'
+            )
+            bad = (FORBIDDEN_STAGES - ALLOWED_STAGES.get(name, set())).intersection(plan_stages(result))
+            assert not bad, f"{name}: {sorted(bad)} in plan for {explainable}"
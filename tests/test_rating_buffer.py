@@ -0,0 +1,238 @@
+"""
+Write-behind rating buffer tests
+"""
+import pytest
+from datetime import datetime, timedelta
+from bson import ObjectId
+from models.group import Group
+from utils.db import items_collection, ratings_collection, job_state_collection
+from utils.rating_buffer import RatingBuffer, rating_buffer, STATE_ID, OWNER_ID
+
+
+@pytest.fixture
+def buffer(app):
+    """Buffer with the timer disabled so flushes are explicit"""
+    buf = RatingBuffer()
+    buf.configure(enabled=True, flush_interval=0, flush_threshold=100, max_items=2)
+    return buf
+
+
+def stored(item_id):
+    return items_collection.find_one({'_id': ObjectId(item_id)})
+
+
+class TestRatingBuffer:
+    """Test delta coalescing, flushing and recovery"""
+
+    def test_deltas_are_coalesced_until_flush(self, buffer, sample_item):
+        """Several changes to one item become one pending delta"""
+        buffer.add(sample_item['id'], None, 4)
+        buffer.add(sample_item['id'], 4, 2)
+
+        assert buffer.pending(sample_item['id']) == (1, 2, {2: 1})
+        assert stored(sample_item['id'])['rating_count'] == 0
+
+        assert buffer.flush() == 1
+        item = stored(sample_item['id'])
+        assert item['rating_count'] == 1
+        assert item['avg_rating'] == 2.0
+        assert item['rating_hist'] == {'1': 0, '2': 1, '3': 0, '4': 0, '5': 0}
+        assert buffer.stats()['depth'] == 0
+
+    def test_overlay_reflects_pending_deltas(self, buffer, sample_item):
+        """Responses can show ratings that have not been flushed yet"""
+        buffer.add(sample_item['id'], None, 5)
+
+        item = buffer.overlay(stored(sample_item['id']))
+        assert item['rating_count'] == 1
+        assert item['avg_rating'] == 5.0
+
+    def test_backpressure_flushes_when_full(self, buffer, auth_client, sample_group, sample_item):
+        """A full buffer is flushed by the writer before accepting more"""
+        others = [
+            auth_client.post(f'/api/groups/{sample_group["id"]}/items', json={
+                'name': f'Item {n}', 'description': ''
+            }).get_json()['item']
+            for n in range(2)
+        ]
+        buffer.add(others[0]['id'], None, 3)
+        buffer.add(others[1]['id'], None, 3)
+        buffer.add(sample_item['id'], None, 3)
+
+        stats = buffer.stats()
+        assert stats['backpressure_flushes'] == 1
+        assert stats['depth'] == 1
+        assert stored(others[0]['id'])['rating_count'] == 1
+
+    def test_flush_records_watermark(self, buffer, sample_item):
+        """A successful flush persists the recovery watermark"""
+        buffer.add(sample_item['id'], None, 3)
+        buffer.flush()
+
+        state = job_state_collection.find_one({'_id': STATE_ID})
+        assert state['watermark'] <= datetime.utcnow()
+
+    def test_recover_rebuilds_lost_deltas(self, buffer, auth_client, sample_item):
+        """Ratings whose deltas were never flushed are rebuilt from ratings"""
+        job_state_collection.insert_one({
+            '_id': STATE_ID,
+            'watermark': datetime.utcnow() - timedelta(minutes=1)
+        })
+        # Simulate a crash: the rating is durable but the delta was lost
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 4})
+        items_collection.update_one(
+            {'_id': ObjectId(sample_item['id'])},
+            {'$set': {'rating_count': 0, 'rating_sum': 0, 'avg_rating': 0.0}}
+        )
+        assert ratings_collection.count_documents({}) == 1
+
+        assert buffer.recover() == 1
+        assert stored(sample_item['id'])['avg_rating'] == 4.0
+
+
+class TestRatingBufferLease:
+    """Test that only one worker buffers at a time"""
+
+    def test_second_worker_writes_through(self, app):
+        """A worker that cannot take the lease does not buffer"""
+        job_state_collection.insert_one({
+            '_id': OWNER_ID,
+            'owner': 'other-host:1',
+            'expires_at': datetime.utcnow() + timedelta(minutes=1)
+        })
+        buf = RatingBuffer()
+        buf.configure(enabled=True, flush_interval=0)
+
+        assert buf.requested is True
+        assert buf.enabled is False
+
+    def test_takeover_after_lease_expires_recovers(self, auth_client, sample_item):
+        """An expired owner's lost deltas are rebuilt by the worker taking over"""
+        job_state_collection.insert_many([
+            {'_id': STATE_ID, 'watermark': datetime.utcnow() - timedelta(minutes=1)},
+            {
+                '_id': OWNER_ID,
+                'owner': 'other-host:1',
+                'expires_at': datetime.utcnow() + timedelta(minutes=1)
+            }
+        ])
+        buf = RatingBuffer()
+        buf.configure(enabled=True, flush_interval=0)
+        assert buf.enabled is False
+
+        # The owner buffered this rating and died before flushing
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 4})
+        items_collection.update_one(
+            {'_id': ObjectId(sample_item['id'])},
+            {'$set': {'rating_count': 0, 'rating_sum': 0, 'avg_rating': 0.0}}
+        )
+        job_state_collection.update_one(
+            {'_id': OWNER_ID},
+            {'$set': {'expires_at': datetime.utcnow() - timedelta(seconds=1)}}
+        )
+
+        assert buf._hold_lease() is True
+        assert buf.enabled is True
+        assert buf.stats()['takeovers'] == 1
+        assert stored(sample_item['id'])['avg_rating'] == 4.0
+
+    def test_lost_lease_rebuilds_pending_items(self, buffer, auth_client, sample_item):
+        """Deltas held past the lease are not applied on top of a takeover"""
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 4})
+        buffer.add(sample_item['id'], None, 4)
+        # Another worker took over (and recovered) while this one stalled
+        job_state_collection.update_one(
+            {'_id': OWNER_ID},
+            {'$set': {
+                'owner': 'other-host:1',
+                'expires_at': datetime.utcnow() + timedelta(minutes=1)
+            }}
+        )
+        buffer._renew_at = 0
+
+        assert buffer._hold_lease() is False
+        assert buffer.enabled is False
+        assert buffer.stats()['depth'] == 0
+        assert stored(sample_item['id'])['rating_count'] == 1
+
+    def test_flush_without_lease_rebuilds_instead(self, buffer, auth_client, sample_item):
+        """Deltas are never applied by a process that doesn't hold the lease"""
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 4})
+        buffer.add(sample_item['id'], None, 4)
+        buffer._owner_pid = None
+
+        assert buffer.flush() == 1
+        assert stored(sample_item['id'])['rating_count'] == 1
+
+    def test_disable_releases_lease(self, buffer):
+        """Turning write-behind off lets another worker take over at once"""
+        assert job_state_collection.find_one({'_id': OWNER_ID}) is not None
+        buffer.configure(enabled=False)
+        assert job_state_collection.find_one({'_id': OWNER_ID}) is None
+
+
+class TestRatingBufferRoutes:
+    """Test the rating routes with write-behind enabled"""
+
+    @pytest.fixture(autouse=True)
+    def enable_buffer(self, app):
+        rating_buffer.configure(enabled=True, flush_interval=0)
+        yield
+        rating_buffer.flush()
+        rating_buffer.configure(enabled=False)
+
+    def test_rate_item_is_buffered(self, auth_client, sample_item):
+        """The response reflects the rating before it reaches the item"""
+        response = auth_client.post(
+            f'/api/items/{sample_item["id"]}/rate',
+            json={'score': 5}
+        )
+        assert response.status_code == 200
+        assert response.get_json()['item']['avg_rating'] == 5.0
+        assert stored(sample_item['id'])['rating_count'] == 0
+
+        rating_buffer.flush()
+        assert stored(sample_item['id'])['rating_count'] == 1
+
+    def test_flush_reports_the_rating_once(self, auth_client, sample_group, sample_item):
+        """The group changes when the stats do: once, at the flush"""
+        version = Group.get_version(sample_group['id'])
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 5})
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 4})
+        assert Group.get_version(sample_group['id']) == version
+        rating_buffer.flush()
+        group = Group.find_by_id(sample_group['id'])
+        assert group['version'] == version + 1
+        assert group['rating_count'] == 1
+
+    def test_raters_etag_changes_before_the_flush(self, auth_client, sample_group, sample_item):
+        """The rater's own user_rating is not answered with a stale 304"""
+        url = f'/api/groups/{sample_group["id"]}/leaderboard'
+        etag = auth_client.get(url).headers['ETag']
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 5})
+
+        response = auth_client.get(url, headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.get_json()['leaderboard'][0]['user_rating'] == 5
+
+    def test_rating_writes_through_without_the_lease(self, auth_client, sample_item):
+        """A worker that lost the lease writes stats instead of buffering"""
+        job_state_collection.update_one(
+            {'_id': OWNER_ID},
+            {'$set': {'owner': 'other-host:1', 'expires_at': datetime.utcnow() + timedelta(minutes=1)}}
+        )
+        rating_buffer._renew_at = 0
+        rating_buffer._hold_lease()
+
+        assert rating_buffer.add(sample_item['id'], None, 3) is False
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 5})
+        assert rating_buffer.stats()['depth'] == 0
+        assert stored(sample_item['id'])['rating_count'] == 1
+
+    def test_health_reports_buffer_metrics(self, client):
+        """Buffer depth and flush latency are exposed on the health check"""
+        response = client.get('/api/health')
+        assert response.status_code == 200
+        metrics = response.get_json()['metrics']['rating_buffer']
+        assert metrics['enabled'] is True
+        assert 'depth' in metrics and 'last_flush_ms' in metrics
@@ -2,6 +2,10 @@
 Rating tests
 """
 import pytest
+from bson import ObjectId
+from models.group import Group
+from models.item import Item
+from utils.db import items_collection, ratings_collection
 
 
 class TestRatings:
@@ -78,3 +82,186 @@ class TestRatings:
         item = response.get_json()['item']
         assert item['avg_rating'] == 5.0
         assert item['rating_count'] == 1
+
+    def test_rerating_adjusts_sum_not_count(self, auth_client, sample_item):
+        """Changing a rating moves the average without adding a new vote"""
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 2})
+        response = auth_client.post(
+            f'/api/items/{sample_item["id"]}/rate',
+            json={'score': 4}
+        )
+        assert response.status_code == 200
+
+        item = response.get_json()['item']
+        assert item['rating_count'] == 1
+        assert item['avg_rating'] == 4.0
+        assert item['user_rating'] == 4
+
+    def test_rating_same_score_is_idempotent(self, auth_client, sample_item):
+        """Submitting the same score twice leaves the stats unchanged"""
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 3})
+        response = auth_client.post(
+            f'/api/items/{sample_item["id"]}/rate',
+            json={'score': 3}
+        )
+        assert response.status_code == 200
+
+        item = response.get_json()['item']
+        assert item['rating_count'] == 1
+        assert item['avg_rating'] == 3.0
+
+    def test_average_across_multiple_raters(self, auth_client, app, sample_group, sample_item):
+        """Ratings from different users are combined into one average"""
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 5})
+
+        other = app.test_client()
+        other.post('/api/auth/register', json={
+            'username': 'otheruser',
+            'email': 'other@example.com',
+            'password': 'password123'
+        })
+        other.post(f'/api/groups/{sample_group["id"]}/join')
+        response = other.post(
+            f'/api/items/{sample_item["id"]}/rate',
+            json={'score': 2}
+        )
+        assert response.status_code == 200
+
+        item = response.get_json()['item']
+        assert item['rating_count'] == 2
+        assert item['avg_rating'] == 3.5
+
+
+class TestBatchRatings:
+    """Test batch rating endpoint"""
+
+    def test_batch_rates_multiple_items(self, auth_client, sample_group, sample_item):
+        """All valid ratings in a batch are applied"""
+        second = auth_client.post(f'/api/groups/{sample_group["id"]}/items', json={
+            'name': 'Second Item',
+            'description': 'Another one'
+        }).get_json()['item']
+
+        response = auth_client.post(
+            f'/api/groups/{sample_group["id"]}/ratings/batch',
+            json={'ratings': [
+                {'item_id': sample_item['id'], 'score': 4},
+                {'item_id': second['id'], 'score': 2},
+            ]}
+        )
+        assert response.status_code == 200
+
+        results = {r['item_id']: r for r in response.get_json()['results']}
+        assert results[sample_item['id']]['status'] == 'ok'
+        assert results[sample_item['id']]['item']['avg_rating'] == 4.0
+        assert results[second['id']]['item']['user_rating'] == 2
+
+    def test_batch_updates_existing_rating(self, auth_client, sample_group, sample_item):
+        """Re-rating through a batch adjusts the sum without adding a vote"""
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 1})
+
+        response = auth_client.post(
+            f'/api/groups/{sample_group["id"]}/ratings/batch',
+            json={'ratings': [{'item_id': sample_item['id'], 'score': 5}]}
+        )
+        item = response.get_json()['results'][0]['item']
+        assert item['rating_count'] == 1
+        assert item['avg_rating'] == 5.0
+
+    def test_batch_reports_invalid_entries(self, auth_client, sample_group, sample_item):
+        """Invalid entries are reported per item while valid ones still apply"""
+        response = auth_client.post(
+            f'/api/groups/{sample_group["id"]}/ratings/batch',
+            json={'ratings': [
+                {'item_id': sample_item['id'], 'score': 3},
+                {'item_id': sample_item['id'][::-1], 'score': 3},
+                {'item_id': 'not-an-id', 'score': 3},
+                {'item_id': sample_item['id'][::-1], 'score': 9},
+            ]}
+        )
+        assert response.status_code == 200
+
+        statuses = [r['status'] for r in response.get_json()['results']]
+        assert statuses.count('ok') == 1
+        assert statuses.count('error') == 2
+
+    @pytest.mark.parametrize('already_rated', [False, True])
+    def test_batch_racing_a_single_rate_counts_once(self, auth_client, sample_group, sample_item,
+                                                     monkeypatch, already_rated):
+        """A rating written between the batch's read and its upsert isn't counted twice"""
+        user_id = Group.find_by_id(sample_group['id'])['created_by']
+        if already_rated:
+            auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 1})
+        original_find = ratings_collection.find
+
+        def find_then_race(*args, **kwargs):
+            rows = list(original_find(*args, **kwargs))
+            monkeypatch.setattr(ratings_collection, 'find', original_find)
+            auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 3})
+            return rows
+
+        monkeypatch.setattr(ratings_collection, 'find', find_then_race)
+        response = auth_client.post(
+            f'/api/groups/{sample_group["id"]}/ratings/batch',
+            json={'ratings': [{'item_id': sample_item['id'], 'score': 5}]}
+        )
+        assert response.status_code == 200
+        item = response.get_json()['results'][0]['item']
+        assert item['rating_count'] == 1
+        assert item['avg_rating'] == 5.0
+        assert ratings_collection.count_documents({'user_id': user_id}) == 1
+        assert Group.find_by_id(sample_group['id'])['rating_count'] == 1
+
+    def test_batch_item_deleted_mid_request(self, auth_client, sample_group, sample_item, monkeypatch):
+        """An item deleted after validation is reported, not a server error"""
+        original_find_many = Item.find_many
+        calls = []
+
+        def find_many_then_delete(item_ids, group_id=None):
+            calls.append(item_ids)
+            if len(calls) == 2:
+                items_collection.delete_one({'_id': ObjectId(sample_item['id'])})
+            return original_find_many(item_ids, group_id)
+
+        monkeypatch.setattr(Item, 'find_many', staticmethod(find_many_then_delete))
+        response = auth_client.post(
+            f'/api/groups/{sample_group["id"]}/ratings/batch',
+            json={'ratings': [{'item_id': sample_item['id'], 'score': 4}]}
+        )
+        assert response.status_code == 200
+        assert response.get_json()['results'][0]['status'] == 'error'
+
+    def test_batch_requires_list(self, auth_client, sample_group):
+        """A missing or empty ratings list is rejected"""
+        response = auth_client.post(
+            f'/api/groups/{sample_group["id"]}/ratings/batch',
+            json={'ratings': []}
+        )
+        assert response.status_code == 400
+
+
+class TestRatingHistogram:
+    """Test per-item star histogram"""
+
+    def test_histogram_is_opt_in(self, auth_client, sample_item):
+        """Items only include the histogram when asked for"""
+        response = auth_client.get(f'/api/items/{sample_item["id"]}')
+        assert 'histogram' not in response.get_json()['item']
+
+    def test_new_rating_fills_bucket(self, auth_client, sample_item):
+        """A first rating increments its star bucket"""
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 4})
+
+        response = auth_client.get(f'/api/items/{sample_item["id"]}?histogram=1')
+        histogram = response.get_json()['item']['histogram']
+        assert histogram == {'1': 0, '2': 0, '3': 0, '4': 1, '5': 0}
+
+    def test_changed_rating_moves_between_buckets(self, auth_client, sample_group, sample_item):
+        """Changing a rating moves its count from the old bucket to the new one"""
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 2})
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 5})
+
+        response = auth_client.get(f'/api/groups/{sample_group["id"]}/leaderboard?histogram=true')
+        histogram = response.get_json()['leaderboard'][0]['histogram']
+        assert histogram['2'] == 0
+        assert histogram['5'] == 1
@@ -0,0 +1,115 @@
+"""
+Rating stats reconciliation tests
+"""
+from bson import ObjectId
+from models.group import Group
+from models.user import User
+from utils.db import groups_collection, items_collection, users_collection
+from utils.reconcile import reconcile_rating_stats, reconcile_memberships, reconcile_group_summaries
+
+
+def corrupt(item_id):
+    items_collection.update_one(
+        {'_id': ObjectId(item_id)},
+        {'$set': {'rating_count': 7, 'rating_sum': 1, 'avg_rating': 0.1}}
+    )
+
+
+class TestReconcileRatingStats:
+    """Test recomputing item stats from ratings"""
+
+    def test_full_run_repairs_drifted_item(self, auth_client, sample_item):
+        """A full run rebuilds stats from ratings"""
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 4})
+        corrupt(sample_item['id'])
+
+        result = reconcile_rating_stats(full=True)
+        assert result['items_corrected'] == 1
+
+        item = items_collection.find_one({'_id': ObjectId(sample_item['id'])})
+        assert item['rating_count'] == 1
+        assert item['avg_rating'] == 4.0
+
+    def test_consistent_items_are_not_rewritten(self, auth_client, sample_item):
+        """Items that already match their ratings are not counted as fixes"""
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 3})
+
+        result = reconcile_rating_stats(full=True)
+        assert result['items_checked'] == 1
+        assert result['items_corrected'] == 0
+
+    def test_incremental_run_only_checks_new_ratings(self, auth_client, sample_group, sample_item):
+        """After a run, only items rated since the watermark are checked"""
+        other = auth_client.post(f'/api/groups/{sample_group["id"]}/items', json={
+            'name': 'Other Item', 'description': ''
+        }).get_json()['item']
+        reconcile_rating_stats()
+
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 5})
+        corrupt(sample_item['id'])
+        corrupt(other['id'])
+
+        result = reconcile_rating_stats()
+        assert result['items_checked'] == 1
+        assert result['items_corrected'] == 1
+
+        untouched = items_collection.find_one({'_id': ObjectId(other['id'])})
+        assert untouched['rating_count'] == 7
+
+    def test_cli_command_reports_corrections(self, runner, auth_client, sample_item):
+        """The reconcile-ratings command prints how many items it fixed"""
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 2})
+        corrupt(sample_item['id'])
+
+        result = runner.invoke(args=['reconcile-ratings', '--full'])
+        assert result.exit_code == 0
+        assert 'corrected 1' in result.output
+
+
+class TestReconcileMemberships:
+    """Test recomputing member counts and joined lists from memberships"""
+
+    def test_repairs_interrupted_join(self, auth_client, sample_group):
+        """A join whose counter and user updates never ran is completed"""
+        user = User.create('member', 'member@example.com', 'password123')
+        Group.add_member(sample_group['id'], user.id)
+        groups_collection.update_one({'_id': ObjectId(sample_group['id'])}, {'$set': {'member_count': 1}})
+        users_collection.update_one({'_id': ObjectId(user.id)}, {'$set': {'groups_joined': []}})
+
+        result = reconcile_memberships(batch_size=1)
+        assert result['groups_corrected'] == 1
+        assert result['users_corrected'] == 1
+        assert groups_collection.find_one({'_id': ObjectId(sample_group['id'])})['member_count'] == 2
+        assert users_collection.find_one({'_id': ObjectId(user.id)})['groups_joined'] == [sample_group['id']]
+
+    def test_consistent_data_is_not_rewritten(self, auth_client, sample_group):
+        """Groups and users that match their memberships are left alone"""
+        result = reconcile_memberships()
+        assert result['groups_checked'] == 1
+        assert result['groups_corrected'] == 0
+        assert result['users_corrected'] == 0
+
+
+class TestReconcileGroupSummaries:
+    """Test recomputing group card summaries from items and ratings"""
+
+    def test_repairs_drifted_summary(self, auth_client, sample_item, sample_group):
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 4})
+        groups_collection.update_one(
+            {'_id': ObjectId(sample_group['id'])},
+            {'$set': {'item_count': 9, 'rating_count': 0}, '$unset': {'last_activity_at': ''}}
+        )
+        version = Group.get_version(sample_group['id'])
+
+        result = reconcile_group_summaries(batch_size=1)
+        assert result == {'groups_checked': 1, 'groups_corrected': 1}
+
+        group = groups_collection.find_one({'_id': ObjectId(sample_group['id'])})
+        assert group['item_count'] == 1
+        assert group['rating_count'] == 1
+        assert group['last_activity_at'] >= group['created_at']
+        assert Group.get_version(sample_group['id']) > version
+
+    def test_consistent_summary_is_left_alone(self, auth_client, sample_item, sample_group):
+        auth_client.post(f'/api/items/{sample_item["id"]}/rate', json={'score': 4})
+        assert reconcile_group_summaries()['groups_corrected'] == 0
@@ -0,0 +1,141 @@
+"""
+Group name autocomplete tests
+"""
+import pytest
+from bson import ObjectId
+from utils.db import groups_collection
+from utils.suggest import GroupSuggester, group_suggestions
+
+
+def suggest(client, prefix, **params):
+    response = client.get('/api/groups/suggest', query_string=dict(params, prefix=prefix))
+    assert response.status_code == 200
+    return [s['name'] for s in response.get_json()['suggestions']]
+
+
+class TestGroupSuggester:
+    """Test the prefix index itself"""
+
+    @pytest.fixture
+    def suggester(self, app):
+        suggester = GroupSuggester()
+        suggester.configure(refresh_interval=0)
+        return suggester
+
+    def test_matches_prefix_ranked_by_members(self, suggester):
+        groups_collection.insert_many([
+            {'name': 'Best Books', 'member_count': 3},
+            {'name': 'Best  Burgers', 'member_count': 9},
+            {'name': 'Worst Burgers', 'member_count': 20},
+        ])
+        suggester.rebuild()
+        names = [name for _, name, _ in suggester.suggest('BEST b')]
+        assert names == ['Best  Burgers', 'Best Books']
+
+    def test_nothing_suggested_until_built(self, suggester):
+        groups_collection.insert_one({'name': 'Best Books', 'member_count': 3})
+        assert suggester.suggest('best') == []
+        assert suggester.stats()['loaded'] is False
+
+        suggester.rebuild()
+        assert [name for _, name, _ in suggester.suggest('best')] == ['Best Books']
+
+    def test_memory_estimate_follows_changes(self, suggester):
+        suggester.rebuild()
+        empty = suggester.stats()['memory_bytes']
+        group_id = ObjectId()
+        suggester.add(group_id, 'Best Books')
+        assert suggester.stats()['memory_bytes'] > empty
+        suggester.remove(group_id)
+        assert suggester.stats()['memory_bytes'] == empty
+
+    def test_create_and_delete_update_loaded_index(self, suggester):
+        suggester.rebuild()
+        group_id = str(ObjectId())
+        suggester.add(group_id, 'Pizza Palace')
+        assert suggester.suggest('piz') == [(group_id, 'Pizza Palace', 1)]
+
+        suggester.remove(group_id)
+        assert suggester.suggest('piz') == []
+
+    def test_prefix_matches_names_beyond_the_bmp(self, suggester):
+        suggester.rebuild()
+        group_id = str(ObjectId())
+        suggester.add(group_id, 'Tea \U0001F375 Club')
+        assert [name for _, name, _ in suggester.suggest('tea ')] == ['Tea \U0001F375 Club']
+
+    def test_index_is_bounded(self, suggester):
+        groups_collection.insert_many([
+            {'name': f'Group {n}', 'member_count': n} for n in range(5)
+        ])
+        suggester.configure(max_groups=3, refresh_interval=0)
+        assert suggester.rebuild() == 3
+        assert [count for _, _, count in suggester.suggest('group')] == [4, 3, 2]
+
+        suggester.add(str(ObjectId()), 'Group New')
+        stats = suggester.stats()
+        assert stats['groups'] == 3
+        assert stats['skipped'] == 1
+        assert stats['memory_bytes'] > 0
+
+    def test_writes_during_rebuild_are_kept(self, suggester, monkeypatch):
+        suggester.rebuild()
+        late = str(ObjectId())
+        original_find = groups_collection.find
+
+        def find_then_create(*args, **kwargs):
+            cursor = original_find(*args, **kwargs)
+            suggester.add(late, 'Late Group')
+            return cursor
+
+        monkeypatch.setattr(groups_collection, 'find', find_then_create)
+        suggester.rebuild()
+        assert suggester.suggest('late') == [(late, 'Late Group', 1)]
+
+    def test_rebuild_picks_up_member_counts(self, suggester):
+        groups_collection.insert_one({'name': 'Tacos', 'member_count': 1})
+        suggester.suggest('tac')
+        groups_collection.update_one({'name': 'Tacos'}, {'$set': {'member_count': 12}})
+        suggester.rebuild()
+        assert suggester.suggest('tac')[0][2] == 12
+
+
+class TestSuggestRoute:
+    """Test the autocomplete endpoint"""
+
+    @pytest.fixture(autouse=True)
+    def built(self, app):
+        group_suggestions.rebuild()
+
+    def test_new_group_is_suggested(self, auth_client, sample_group):
+        assert suggest(auth_client, 'test') == [sample_group['name']]
+        auth_client.post('/api/groups', json={'name': 'Testing Ground', 'description': 'x'})
+        assert set(suggest(auth_client, 'test')) == {sample_group['name'], 'Testing Ground'}
+
+    def test_deleted_group_is_not_suggested(self, auth_client, sample_group):
+        assert suggest(auth_client, 'test')
+        auth_client.delete(f'/api/groups/{sample_group["id"]}')
+        assert suggest(auth_client, 'test') == []
+
+    def test_empty_prefix(self, client):
+        assert suggest(client, '') == []
+
+    def test_bad_limit(self, client):
+        response = client.get('/api/groups/suggest?prefix=a&limit=0')
+        assert response.status_code == 400
+
+    def test_disabled(self, app, client):
+        group_suggestions.configure(enabled=False)
+        try:
+            response = client.get('/api/groups/suggest?prefix=a')
+            assert response.status_code == 503
+        finally:
+            group_suggestions.configure(
+                enabled=app.config['GROUP_SUGGEST_ENABLED'],
+                max_groups=app.config['GROUP_SUGGEST_MAX_GROUPS'],
+                refresh_interval=app.config['GROUP_SUGGEST_REFRESH_INTERVAL']
+            )
+
+    def test_metrics_on_health_check(self, client):
+        metrics = client.get('/api/health').get_json()['metrics']['group_suggestions']
+        assert 'memory_bytes' in metrics and 'groups' in metrics
@@ -7,6 +7,7 @@ from .validators import (
     validate_password, 
     validate_username,
     validate_rating,
+    parse_bool,
     sanitize_input
 )
 
@@ -17,5 +18,6 @@ __all__ = [
     'validate_password',
     'validate_username',
     'validate_rating',
+    'parse_bool',
     'sanitize_input'
 ]
\ No newline at end of file
@@ -0,0 +1,157 @@
+"""
+In-process caches
+
+A small thread-safe LRU cache with per-entry TTL, hit/miss counters and
+tag-based invalidation (e.g. drop every cached page of one group's
+leaderboard at once). Each worker process has its own copy, so entries must
+either be invalidated by the writes that change them or be short-lived.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Bounded LRU cache with TTL expiry and tag invalidation"""
+
+    def __init__(self, name, max_entries=1024, ttl=60.0, enabled=True):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+
+        self._data = OrderedDict()  # key -> (value, expires_at, tag)
+        self._tags = {}  # tag -> set of keys
+        self._generations = {}  # tag -> number of invalidate_tag() calls
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def configure(self, enabled=True, max_entries=1024, ttl=60.0):
+        """
+        Configure the cache; clears it if it is being disabled
+
+        Args:
+            enabled (bool): When False, get() always misses and set() is a no-op
+            max_entries (int): Entries kept before least-recently-used eviction
+            ttl (float): Seconds an entry stays valid
+        """
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl = ttl
+        if not enabled:
+            self.clear()
+
+    def get(self, key, default=None):
+        """Return a cached value, or default on a miss or expired entry"""
+        if not self.enabled:
+            return default
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at, tag = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def generation(self, tag):
+        """
+        Return a token to pass to set() for a value about to be computed
+
+        If the tag is invalidated while the value is being built, set()
+        discards it instead of caching data the write already replaced.
+        """
+        with self._lock:
+            return self._generations.get(tag, 0)
+
+    def set(self, key, value, tag=None, generation=None):
+        """
+        Store a value
+
+        Args:
+            key: Hashable cache key
+            value: Value to cache (treated as immutable by callers)
+            tag (optional): Group key for invalidate_tag()
+            generation (int, optional): generation(tag) taken before the
+                value was computed
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generations.get(tag, 0):
+                return
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, time.monotonic() + self.ttl, tag)
+            if tag is not None:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._data) > self.max_entries:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Drop one entry"""
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+                self.invalidations += 1
+
+    def invalidate_tag(self, tag):
+        """Drop every entry stored with this tag"""
+        with self._lock:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+            for key in list(self._tags.get(tag, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        """Drop everything"""
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+
+    def stats(self):
+        """Return cache metrics for monitoring"""
+        with self._lock:
+            size = len(self._data)
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'size': size,
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations
+        }
+
+    def _remove(self, key):
+        """Remove a key; caller holds the lock"""
+        value, expires_at, tag = self._data.pop(key)
+        if tag is not None:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+# Serialized group leaderboards, tagged by group ID
+leaderboard_cache = LRUCache('leaderboard', max_entries=1024, ttl=30.0)
+
+# Approximate group total shown on the discover page
+group_count_cache = LRUCache('group_count', max_entries=1, ttl=60.0)
@@ -4,7 +4,7 @@ MongoDB connection with safe initialization and proper logging
 
 import os
 import logging
-from pymongo import MongoClient, ASCENDING, DESCENDING, TEXT
+from pymongo import MongoClient, ASCENDING, DESCENDING, TEXT, UpdateOne
 from pymongo.errors import ConnectionFailure, OperationFailure
 from dotenv import load_dotenv
 
@@ -37,6 +37,9 @@ users_collection = None
 groups_collection = None
 items_collection = None
 ratings_collection = None
+job_state_collection = None
+group_changes_collection = None
+memberships_collection = None
 
 try:
     logger.info("Connecting to MongoDB...")
@@ -75,6 +78,9 @@ try:
     groups_collection = db.groups
     items_collection = db.items
     ratings_collection = db.ratings
+    job_state_collection = db.job_state
+    group_changes_collection = db.group_changes
+    memberships_collection = db.memberships
     
     logger.info(f"✓ Database '{db_name}' initialized")
     
@@ -90,8 +96,79 @@ except Exception as e:
     # DON'T raise - let the module import succeed
 
 
-def init_db():
-    """Initialize database indexes"""
+# Indexes superseded by the query-shaped compound indexes in init_db
+LEGACY_INDEXES = {
+    "groups": [
+        "name_1",
+        "created_at_-1",
+        "member_count_-1",
+        "name_lower_1",
+        # members_1 is dropped by Membership.migrate_from_arrays once it is done
+    ],
+    "items": [
+        "group_id_1_name_1",
+        "created_at_-1",
+        "avg_rating_-1_rating_count_-1",
+        "group_id_1_rank_score_-1_rating_count_-1",
+        "name_text_description_text",
+    ],
+    "ratings": [
+        "user_id_1_item_id_1_group_id_1",
+        "item_id_1",
+        "user_id_1",
+    ],
+}
+
+
+def _drop_legacy_indexes(collection, names):
+    """Drop indexes from older schema versions if they still exist"""
+    existing = collection.index_information()
+    for name in names:
+        if name in existing:
+            collection.drop_index(name)
+            logger.info(f"Dropped legacy index {collection.name}.{name}")
+
+
+def _ensure_ttl_index(collection, field, seconds):
+    """Create a TTL index, or update its expiry if it already exists"""
+    try:
+        collection.create_index([(field, ASCENDING)], expireAfterSeconds=seconds)
+    except OperationFailure as e:
+        if e.code != 85:  # IndexOptionsConflict: same key, different expiry
+            raise
+        db.command("collMod", collection.name, index={
+            "keyPattern": {field: 1}, "expireAfterSeconds": seconds
+        })
+        logger.info(f"Updated TTL of {collection.name}.{field} to {seconds}s")
+
+
+def _backfill_name_lower():
+    """Add name_lower and name_words to groups created before prefix search existed"""
+    from models.group import Group
+
+    requests = [
+        UpdateOne({"_id": group["_id"]}, {"$set": {
+            "name_lower": group["name"].lower(),
+            "name_words": Group.name_words(group["name"]),
+        }})
+        for group in groups_collection.find(
+            {"$or": [{"name_lower": {"$exists": False}}, {"name_words": {"$exists": False}}]},
+            {"name": 1},
+        )
+    ]
+    if requests:
+        groups_collection.bulk_write(requests, ordered=False)
+        logger.info(f"Backfilled name_lower/name_words on {len(requests)} groups")
+
+
+def init_db(change_log_retention=7 * 24 * 3600):
+    """
+    Initialize database indexes
+
+    Args:
+        change_log_retention (int): Seconds group change-log entries are
+            kept for delta sync (Config.CHANGE_LOG_RETENTION)
+    """
     if client is None or db is None:
         raise ConnectionFailure("Cannot initialize database - MongoDB client not connected. Check MONGO_URI environment variable.")
     
@@ -104,32 +181,72 @@ def init_db():
         logger.debug("User indexes created")
 
         # Group indexes
-        groups_collection.create_index([("name", ASCENDING)])
-        groups_collection.create_index([("created_at", DESCENDING)])
-        groups_collection.create_index([("member_count", DESCENDING)])
+        # One per discover sort in Group.SORTS; _id keeps ties stable
+        groups_collection.create_index([("member_count", DESCENDING), ("_id", DESCENDING)])
+        groups_collection.create_index([("created_at", DESCENDING), ("_id", DESCENDING)])
+        # Also serves prefix search: anchored, case-sensitive $regex on the lowercased name
+        groups_collection.create_index([("name_lower", ASCENDING), ("_id", ASCENDING)])
         groups_collection.create_index([("name", TEXT), ("description", TEXT)])
-        groups_collection.create_index([("members", ASCENDING)])
+        # Partial words in longer searches: anchored $regex on one name word
+        groups_collection.create_index([("name_words", ASCENDING)])
+        # Deleted groups still being cleaned up (utils.group_cleanup)
+        groups_collection.create_index(
+            [("deleted_at", ASCENDING)],
+            partialFilterExpression={"deleted_at": {"$exists": True}},
+        )
+        _drop_legacy_indexes(groups_collection, LEGACY_INDEXES["groups"])
+        _backfill_name_lower()
         logger.debug("Group indexes created")
 
-        # Item indexes
-        items_collection.create_index([("group_id", ASCENDING), ("name", ASCENDING)])
-        items_collection.create_index([("created_at", DESCENDING)])
+        # Item indexes - one per leaderboard sort in Item.SORTS, all
+        # prefixed by group_id so filter + sort is a single index scan
+        items_collection.create_index(
+            [("group_id", ASCENDING), ("avg_rating", DESCENDING),
+             ("rating_count", DESCENDING), ("_id", DESCENDING)]
+        )
+        items_collection.create_index(
+            [("group_id", ASCENDING), ("rank_score", DESCENDING),
+             ("rating_count", DESCENDING), ("_id", DESCENDING)]
+        )
         items_collection.create_index(
-            [("avg_rating", DESCENDING), ("rating_count", DESCENDING)]
+            [("group_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]
         )
-        items_collection.create_index([("name", TEXT), ("description", TEXT)])
+        _drop_legacy_indexes(items_collection, LEGACY_INDEXES["items"])
         logger.debug("Item indexes created")
 
         # Rating indexes
+        # (user_id, group_id, item_id): upserts, a user's ratings in a group
         ratings_collection.create_index(
-            [("user_id", ASCENDING), ("item_id", ASCENDING), ("group_id", ASCENDING)],
+            [("user_id", ASCENDING), ("group_id", ASCENDING), ("item_id", ASCENDING)],
             unique=True,
         )
-        ratings_collection.create_index([("item_id", ASCENDING)])
-        ratings_collection.create_index([("user_id", ASCENDING)])
+        # (item_id, user_id): one user's rating of an item, per-item stats/deletes
+        ratings_collection.create_index([("item_id", ASCENDING), ("user_id", ASCENDING)])
         ratings_collection.create_index([("group_id", ASCENDING)])
+        ratings_collection.create_index([("updated_at", ASCENDING)])
+        _drop_legacy_indexes(ratings_collection, LEGACY_INDEXES["ratings"])
         logger.debug("Rating indexes created")
 
+        # Group change log: one entry per (group, version), expired by TTL
+        group_changes_collection.create_index(
+            [("group_id", ASCENDING), ("version", ASCENDING)], unique=True
+        )
+        _ensure_ttl_index(group_changes_collection, "created_at", change_log_retention)
+        # Recent membership changes, polled by every worker's membership cache
+        group_changes_collection.create_index(
+            [("created_at", ASCENDING)],
+            name="members_created_at",
+            partialFilterExpression={"members": True},
+        )
+        logger.debug("Group change log indexes created")
+
+        # Memberships: point lookups by group and listing a user's groups
+        memberships_collection.create_index(
+            [("group_id", ASCENDING), ("user_id", ASCENDING)], unique=True
+        )
+        memberships_collection.create_index([("user_id", ASCENDING), ("group_id", ASCENDING)])
+        logger.debug("Membership indexes created")
+
         logger.info("Database initialization complete")
 
     except OperationFailure as e:
@@ -137,6 +254,37 @@ def init_db():
         raise
 
 
+_supports_transactions = None
+
+
+def supports_transactions():
+    """True if the server is a replica set or mongos (standalone servers have no transactions)"""
+    global _supports_transactions
+    if _supports_transactions is None:
+        try:
+            hello = client.admin.command("hello")
+            _supports_transactions = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        except Exception:
+            _supports_transactions = False
+    return _supports_transactions
+
+
+def run_in_transaction(callback):
+    """
+    Run callback(session) as one multi-document transaction when the
+    deployment supports it, otherwise as plain ordered writes with
+    callback(None)
+
+    Callers write the document that decides the outcome first, so without
+    a transaction an interruption can only leave derived fields behind,
+    which the reconcile jobs repair.
+    """
+    if not supports_transactions():
+        return callback(None)
+    with client.start_session() as session:
+        return session.with_transaction(callback)
+
+
 def get_db_stats():
     """Get database statistics"""
     if client is None or db is None:
@@ -200,15 +348,19 @@ def seed_sample_data():
     group1 = {
         "_id": ObjectId(),
         "name": "Best Music Albums",
+        "name_lower": "best music albums",
+        "name_words": ["best", "music", "albums"],
         "description": "Rank your favorite albums of all time",
         "created_by": user1["_id"],
-        "members": [user1["_id"], user2["_id"]],
-        "admins": [user1["_id"]],
         "member_count": 2,
         "created_at": datetime.utcnow(),
     }
 
     groups_collection.insert_one(group1)
+    memberships_collection.insert_many([
+        {"group_id": group1["_id"], "user_id": user1["_id"], "role": "owner", "joined_at": group1["created_at"]},
+        {"group_id": group1["_id"], "user_id": user2["_id"], "role": "member", "joined_at": group1["created_at"]},
+    ])
     logger.debug("Created sample group")
 
     logger.info("Sample data seeded successfully")
@@ -0,0 +1,359 @@
+"""
+Live leaderboard events (Server-Sent Events fan-out)
+
+Each group with subscribers gets one feed thread per process. Writes call
+Group.mark_changed(), which publishes the changed item IDs here. The feed
+loads those items and their ranks once and hands the same pre-formatted SSE
+message to every subscriber's bounded queue. Subscribers that fall behind
+are dropped and reconnect with Last-Event-ID.
+
+The feed also polls the group's version, so writes made by other worker
+processes are noticed; their item IDs are read from the group change log.
+Reconnecting clients are caught up from the same log. When the history is
+gone or too much changed, clients are told to resync instead.
+"""
+import json
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Sorts whose rank is included with every pushed item
+STREAM_SORTS = ('rating', 'score')
+
+
+def format_event(event, data, event_id=None):
+    """
+    Format one SSE message
+
+    Args:
+        event (str): Event name
+        data (dict): JSON payload
+        event_id (int, optional): Group version, echoed back as Last-Event-ID
+
+    Returns:
+        str: Message ready to write to the stream
+    """
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, separators=(",", ":"))}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def update_message(events, group_id, version, item_ids, deleted_ids):
+    """
+    Build the message that brings a client to `version`
+
+    Args:
+        events (LeaderboardEvents): Supplies the max_items threshold
+        group_id (str): Group ID
+        version (int): Version the message is tagged with
+        item_ids (set): Items created or updated
+        deleted_ids (set): Items deleted
+
+    Returns:
+        str: An `update` message, or `resync` if too many items changed
+    """
+    from models.item import Item
+
+    item_ids, deleted_ids = set(item_ids), set(deleted_ids)
+    if len(item_ids) + len(deleted_ids) > events.max_items:
+        return format_event('resync', {'version': version}, version)
+
+    items = Item.find_many(list(item_ids - deleted_ids), group_id)
+    rows = []
+    for item in items.values():
+        row = Item.to_dict(item)
+        del row['user_rating']
+        row['ranks'] = {sort: Item.get_rank(item, sort)[0] for sort in STREAM_SORTS}
+        row['rank'] = row['ranks']['rating']
+        rows.append(row)
+    gone = sorted(deleted_ids | (item_ids - set(items)))
+    return format_event('update', {'version': version, 'items': rows, 'deleted': gone}, version)
+
+
+def logged_changes(group_id, since, version):
+    """
+    Read the change log from `since` up to `version`
+
+    Returns:
+        tuple or None: (updated_ids, deleted_ids), or None if the log does
+            not cover every version in between
+    """
+    from models.group_change import GroupChange
+
+    if version - since > GroupChange.MAX_ENTRIES:
+        return None
+    entries = GroupChange.since(group_id, since, limit=version - since)
+    if entries is None or len(entries) != version - since:
+        return None
+    return GroupChange.summarize(entries)
+
+
+class Subscriber:
+    """One stream connection's bounded queue of pending messages"""
+
+    def __init__(self, group_id, max_queue):
+        self.group_id = group_id
+        self.queue = queue.Queue(max_queue)
+        self.closed = False
+
+    def deliver(self, message):
+        """Queue a message; returns False if the subscriber is too slow"""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except queue.Full:
+            self.closed = True
+            return False
+
+    def close(self):
+        """Stop the stream after anything already queued"""
+        self.closed = True
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+
+class GroupFeed:
+    """Builds and fans out updates for one group"""
+
+    def __init__(self, events, group_id, version):
+        self.events = events
+        self.group_id = group_id
+        self.version = version  # last version delivered to subscribers
+        self.subscribers = set()
+        self._items = set()
+        self._deleted = set()
+        self._published = version  # highest version published in this process
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def notify(self, version, item_ids, deleted_ids):
+        """Record a local write and wake the feed"""
+        with self._lock:
+            self._items.update(item_ids)
+            self._deleted.update(deleted_ids)
+            self._published = max(self._published, version)
+        self._wakeup.set()
+
+    def start(self):
+        """Start the feed thread (no-op when polling is disabled)"""
+        if self.events.poll_interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name=f'leaderboard-feed-{self.group_id}', daemon=True
+        )
+        self._thread.start()
+
+    def tick(self):
+        """
+        Deliver everything that changed since the last tick
+
+        Returns:
+            bool: False once the group is gone and the feed has closed
+        """
+        from models.group import Group
+
+        with self._lock:
+            item_ids, self._items = self._items, set()
+            deleted_ids, self._deleted = self._deleted, set()
+            published = self._published
+
+        version = Group.get_version(self.group_id)
+        if version is None:
+            self._broadcast(format_event('gone', {'group_id': self.group_id}))
+            self.events._close_feed(self)
+            return False
+        if version <= self.version:
+            return True
+
+        changes = (item_ids, deleted_ids)
+        if version > published:
+            # Another process wrote to the group; its items are in the log
+            changes = logged_changes(self.group_id, self.version, version)
+        if changes is None:
+            message = format_event('resync', {'version': version}, version)
+        else:
+            message = update_message(self.events, self.group_id, version, *changes)
+
+        self.version = version
+        self._broadcast(message)
+        return True
+
+    def _broadcast(self, message):
+        """Hand one message to every subscriber, dropping slow ones"""
+        with self._lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            if subscriber.deliver(message):
+                continue
+            self.events.dropped += 1
+            self.events.unsubscribe(subscriber)
+        self.events.messages += 1
+
+    def _run(self):
+        """Feed loop: wake on local writes, poll for remote ones"""
+        while True:
+            self._wakeup.wait(self.events.poll_interval)
+            self._wakeup.clear()
+            if self.events._retire_if_idle(self):
+                return
+            try:
+                if not self.tick():
+                    return
+            except Exception as e:
+                logger.error(f"Leaderboard feed for {self.group_id} failed: {e}")
+
+
+class LeaderboardEvents:
+    """Registry of per-group feeds"""
+
+    def __init__(self):
+        self.enabled = True
+        self.heartbeat_interval = 15.0
+        self.poll_interval = 2.0
+        self.max_queue = 100
+        self.max_items = 50
+
+        self._feeds = {}  # group_id -> GroupFeed
+        self._lock = threading.Lock()
+
+        self.messages = 0
+        self.dropped = 0
+
+    def configure(self, enabled=True, heartbeat_interval=15.0, poll_interval=2.0,
+                  max_queue=100, max_items=50):
+        """
+        Configure live streams
+
+        Args:
+            enabled (bool): Accept stream connections
+            heartbeat_interval (float): Seconds between keep-alive comments
+            poll_interval (float): Seconds between version checks for writes
+                made by other processes (0 disables feed threads; call tick())
+            max_queue (int): Messages buffered per connection before it is dropped
+            max_items (int): Changed items above which clients are told to resync
+        """
+        self.enabled = enabled
+        self.heartbeat_interval = heartbeat_interval
+        self.poll_interval = poll_interval
+        self.max_queue = max_queue
+        self.max_items = max_items
+
+    def subscribe(self, group_id, version):
+        """
+        Open a subscription to a group's feed
+
+        Args:
+            group_id (str): Group ID
+            version (int): Group version the client has already seen
+
+        Returns:
+            Subscriber: Read messages from subscriber.queue (None ends the stream)
+        """
+        subscriber = Subscriber(group_id, self.max_queue)
+        with self._lock:
+            feed = self._feeds.get(group_id)
+            if feed is None:
+                feed = self._feeds[group_id] = GroupFeed(self, group_id, version)
+            with feed._lock:
+                feed.subscribers.add(subscriber)
+            feed.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """Remove a subscriber; idle feeds stop on their next wakeup"""
+        subscriber.closed = True
+        with self._lock:
+            feed = self._feeds.get(subscriber.group_id)
+        if feed is not None:
+            with feed._lock:
+                feed.subscribers.discard(subscriber)
+            self._retire_if_idle(feed)
+            feed._wakeup.set()
+
+    def publish(self, group_id, version, item_ids=(), deleted_ids=()):
+        """
+        Tell a group's feed about a write (called by Group.mark_changed)
+
+        Cheap when nobody is subscribed to the group.
+        """
+        with self._lock:
+            feed = self._feeds.get(group_id)
+        if feed is not None:
+            feed.notify(version, item_ids, deleted_ids)
+
+    def replay(self, group_id, since, version):
+        """
+        Build the catch-up message for a client reconnecting at `since`
+
+        Returns:
+            str: `update` from the change log, or `resync` if it is incomplete
+        """
+        changes = logged_changes(group_id, since, version) if since < version else None
+        if changes is None:
+            return format_event('resync', {'version': version}, version)
+        return update_message(self, group_id, version, *changes)
+
+    def tick(self, group_id):
+        """Run one delivery round for a group's feed synchronously"""
+        with self._lock:
+            feed = self._feeds.get(group_id)
+        if feed is not None:
+            feed.tick()
+
+    def close_all(self):
+        """End every open stream"""
+        with self._lock:
+            feeds = list(self._feeds.values())
+        for feed in feeds:
+            self._close_feed(feed)
+
+    def stats(self):
+        """Return stream metrics for monitoring"""
+        with self._lock:
+            feeds = list(self._feeds.values())
+        return {
+            'enabled': self.enabled,
+            'groups': len(feeds),
+            'subscribers': sum(len(feed.subscribers) for feed in feeds),
+            'messages': self.messages,
+            'dropped': self.dropped
+        }
+
+    def _close_feed(self, feed):
+        """End every stream on a feed"""
+        with feed._lock:
+            subscribers, feed.subscribers = feed.subscribers, set()
+        for subscriber in subscribers:
+            subscriber.close()
+        self._retire_if_idle(feed)
+
+    def _retire_if_idle(self, feed):
+        """
+        Unregister a feed with no subscribers
+
+        Runs under the registry lock, so a concurrent subscribe() either
+        joins the feed before this check or creates a new feed after it.
+
+        Returns:
+            bool: True if the feed is retired and its thread should exit
+        """
+        with self._lock:
+            with feed._lock:
+                if feed.subscribers:
+                    return False
+            if self._feeds.get(feed.group_id) is feed:
+                del self._feeds[feed.group_id]
+            return True
+
+
+leaderboard_events = LeaderboardEvents()
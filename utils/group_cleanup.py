@@ -0,0 +1,248 @@
+"""
+Background cascade for deleted groups
+
+Group.delete() only marks the group with deleted_at, which hides it from
+every read, and hands the rest to this worker. The worker removes the
+group's memberships (pulling the group from users' groups_joined in the
+same batches), items, ratings and change log, batch_size documents at a
+time, and finally the group document itself.
+
+Progress is stored on the group document (cleanup.stage and a count per
+stage), so the work survives restarts: the marked group is picked up again
+on the next run and each stage simply continues deleting what is left.
+A lease on the document keeps two workers off the same group; if a worker
+dies mid-cascade, the lease expires and another one takes over.
+"""
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+
+import utils.db
+from utils.identity import identity_map
+from utils.membership_cache import membership_cache
+
+logger = logging.getLogger(__name__)
+
+# Cascade order: memberships first, so nobody can add items or ratings to
+# a deleted group once that stage is done
+STAGES = ('memberships', 'items', 'ratings', 'changes')
+
+
+class GroupCleanup:
+    """Deletes the data of deleted groups in bounded batches"""
+
+    def __init__(self):
+        self.batch_size = 1000
+        self.interval = 30.0
+        self.lease = 300.0
+
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+        self._current = None  # progress of the group being cleaned up
+        self.groups_deleted = 0
+        self.documents_deleted = dict.fromkeys(STAGES, 0)
+        self.batches = 0
+        self.errors = 0
+        self._last_error = None
+
+    def configure(self, batch_size=1000, interval=30.0, lease=300.0):
+        """
+        Configure the worker
+
+        Args:
+            batch_size (int): Documents deleted per round trip
+            interval (float): Seconds between scans for unfinished deletions
+                (0 disables the thread; call run_pending())
+            lease (float): Seconds a worker owns a group before another
+                worker may resume it
+        """
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lease = lease
+
+    def start(self):
+        """Start the background thread, which also resumes interrupted cascades"""
+        self._ensure_thread()
+        self._wakeup.set()
+
+    def enqueue(self, group_id):
+        """Wake the worker for a group Group.delete() just marked"""
+        logger.info(f"Group {group_id} marked deleted; cleanup queued")
+        self.start()
+
+    def run_pending(self):
+        """
+        Clean up every marked group that no other worker holds
+
+        Returns:
+            int: Number of groups fully deleted
+        """
+        finished = 0
+        with self._run_lock:
+            while True:
+                group = self._claim()
+                if group is None:
+                    return finished
+                self._cascade(group)
+                finished += 1
+
+    def stats(self):
+        """Return worker metrics and the progress of the current group"""
+        try:
+            pending = utils.db.groups_collection.count_documents({'deleted_at': {'$exists': True}})
+        except Exception:
+            pending = None
+        with self._lock:
+            current = dict(self._current) if self._current else None
+        return {
+            'pending': pending,
+            'current': current,
+            'groups_deleted': self.groups_deleted,
+            'documents_deleted': dict(self.documents_deleted),
+            'batches': self.batches,
+            'errors': self.errors,
+            'last_error': self._last_error,
+            'batch_size': self.batch_size
+        }
+
+    def _claim(self):
+        """Take the lease on one marked group, or return None"""
+        now = datetime.utcnow()
+        return utils.db.groups_collection.find_one_and_update(
+            {
+                'deleted_at': {'$exists': True},
+                '$or': [{'cleanup_lease': {'$exists': False}}, {'cleanup_lease': {'$lt': now}}]
+            },
+            {'$set': {'cleanup_lease': now + timedelta(seconds=self.lease)}},
+            projection={'cleanup': 1},
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _cascade(self, group):
+        """Run the remaining stages for one group, then delete it"""
+        group_id = group['_id']
+        progress = dict.fromkeys(STAGES, 0)
+        progress.update(group.get('cleanup') or {})
+        with self._lock:
+            self._current = dict(progress, group_id=str(group_id))
+
+        start = STAGES.index(progress['stage']) if progress.get('stage') in STAGES else 0
+        for stage in STAGES[start:]:
+            self._drain(group_id, stage)
+            if stage == 'memberships':
+                # Other workers drop their cached roles for the group
+                from models.group import Group
+                Group.mark_changed(group_id, members=True)
+        # A rating or item whose request saw the group live just before it
+        # was marked can land after its stage; sweep once more
+        for stage in ('items', 'ratings'):
+            self._drain(group_id, stage)
+
+        utils.db.groups_collection.delete_one({'_id': group_id})
+        with self._lock:
+            self._current = None
+        self.groups_deleted += 1
+        logger.info(f"Group {group_id} cleanup finished")
+
+    def _drain(self, group_id, stage):
+        """Run one stage in batches until nothing is left"""
+        while True:
+            deleted = getattr(self, f'_delete_{stage}')(group_id)
+            if not deleted:
+                return
+            self._record(group_id, stage, deleted)
+
+    def _record(self, group_id, stage, deleted):
+        """Save progress and renew the lease after a batch"""
+        utils.db.groups_collection.update_one(
+            {'_id': group_id},
+            {
+                '$set': {
+                    'cleanup.stage': stage,
+                    'cleanup_lease': datetime.utcnow() + timedelta(seconds=self.lease)
+                },
+                '$inc': {f'cleanup.{stage}': deleted}
+            }
+        )
+        with self._lock:
+            self._current['stage'] = stage
+            self._current[stage] += deleted
+        self.documents_deleted[stage] += deleted
+        self.batches += 1
+
+    def _batch_ids(self, collection, query, fields=None):
+        """Read the next batch of documents to delete"""
+        return list(collection.find(query, fields or {'_id': 1}).limit(self.batch_size))
+
+    def _delete_memberships(self, group_id):
+        batch = self._batch_ids(
+            utils.db.memberships_collection, {'group_id': group_id}, {'user_id': 1}
+        )
+        if not batch:
+            return 0
+        utils.db.users_collection.update_many(
+            {'_id': {'$in': [m['user_id'] for m in batch]}},
+            {'$pull': {'groups_joined': str(group_id)}}
+        )
+        utils.db.memberships_collection.delete_many({'_id': {'$in': [m['_id'] for m in batch]}})
+        membership_cache.invalidate_group(group_id)
+        identity_map.evict_where('membership', lambda key, _: key[0] == str(group_id))
+        return len(batch)
+
+    def _delete_items(self, group_id):
+        identity_map.evict_where('item', lambda _, item: item is not None and item['group_id'] == group_id)
+        return self._delete_batch(utils.db.items_collection, {'group_id': group_id})
+
+    def _delete_ratings(self, group_id):
+        return self._delete_batch(utils.db.ratings_collection, {'group_id': group_id})
+
+    def _delete_changes(self, group_id):
+        # Membership entries stay until the log's TTL, so workers that have
+        # not polled yet still learn that the group's members are gone
+        return self._delete_batch(
+            utils.db.group_changes_collection, {'group_id': group_id, 'members': {'$ne': True}}
+        )
+
+    def _delete_batch(self, collection, query):
+        """Delete up to batch_size matching documents by _id"""
+        ids = [doc['_id'] for doc in self._batch_ids(collection, query)]
+        if ids:
+            collection.delete_many({'_id': {'$in': ids}})
+        return len(ids)
+
+    def _ensure_thread(self):
+        """Start the cleanup thread (once per process, so it survives forks)"""
+        if self.interval <= 0:
+            return
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name='group-cleanup', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        """Cleanup loop for the background thread"""
+        while self.interval > 0:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.run_pending()
+            except Exception as e:
+                self.errors += 1
+                self._last_error = str(e)
+                logger.error(f"Group cleanup failed: {e}")
+
+
+group_cleanup = GroupCleanup()
@@ -0,0 +1,121 @@
+"""
+Per-request identity map for model lookups
+
+One request often loads the same document more than once (a membership
+check, then the model method that re-checks it; an item, then its group).
+Group.find_by_id, Item.find_by_id, User.find_by_id and Membership.get_role
+go through this map, so within one request each document is read from
+MongoDB once and later lookups return the same object.
+
+Entries live on flask.g and are dropped when the request ends, so nothing
+is shared between requests or workers. Writes through the models evict the
+entries they change (Group.mark_changed, Membership.add/remove, ...).
+Outside a request (CLI commands, background threads) lookups go straight
+to the database.
+"""
+import threading
+
+from flask import g, has_request_context
+
+_MISSING = object()
+
+
+class IdentityMap:
+    """Request-scoped map of (kind, key) -> loaded document"""
+
+    def __init__(self):
+        self.enabled = True
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.reads_saved = 0
+
+    def configure(self, enabled=True):
+        """
+        Configure the map
+
+        Args:
+            enabled (bool): When False, every lookup goes to the database
+        """
+        self.enabled = enabled
+
+    def get(self, kind, key, loader):
+        """
+        Return a document loaded earlier in this request, or load it
+
+        Args:
+            kind (str): Model name ('group', 'item', 'user', 'membership')
+            key: Hashable identity within the kind (e.g. the ID as a str)
+            loader (callable): Reads the document; None results are kept too,
+                so a repeated miss is also served from memory
+
+        Returns:
+            The loaded document
+        """
+        entries = self._entries()
+        if entries is None:
+            return loader()
+        value = entries.get((kind, key), _MISSING)
+        if value is not _MISSING:
+            g._identity_saved = g.get('_identity_saved', 0) + 1
+            return value
+        value = loader()
+        entries[(kind, key)] = value
+        return value
+
+    def put(self, kind, key, value):
+        """Record a document read by some other query in this request"""
+        entries = self._entries()
+        if entries is not None:
+            entries[(kind, key)] = value
+
+    def evict(self, kind, key):
+        """Forget one entry after a write changed it"""
+        entries = self._entries()
+        if entries is not None:
+            entries.pop((kind, key), None)
+
+    def evict_where(self, kind, predicate):
+        """Forget every entry of a kind for which predicate(key, value) is true"""
+        entries = self._entries()
+        if entries is not None:
+            for entry in [e for e, value in entries.items() if e[0] == kind and predicate(e[1], value)]:
+                del entries[entry]
+
+    def saved(self):
+        """Number of database reads saved so far in this request"""
+        if not has_request_context():
+            return 0
+        return g.get('_identity_saved', 0)
+
+    def finish(self):
+        """Drop this request's entries and add its savings to the totals"""
+        if not has_request_context():
+            return
+        g.pop('_identity_map', None)
+        saved = g.pop('_identity_saved', 0)
+        with self._lock:
+            self.requests += 1
+            self.reads_saved += saved
+
+    def stats(self):
+        """Return identity map metrics for monitoring"""
+        with self._lock:
+            requests, reads_saved = self.requests, self.reads_saved
+        return {
+            'enabled': self.enabled,
+            'requests': requests,
+            'reads_saved': reads_saved,
+            'reads_saved_per_request': round(reads_saved / requests, 2) if requests else 0.0
+        }
+
+    def _entries(self):
+        """This request's entries, or None when there is no request to scope them to"""
+        if not self.enabled or not has_request_context():
+            return None
+        if '_identity_map' not in g:
+            g._identity_map = {}
+        return g._identity_map
+
+
+identity_map = IdentityMap()
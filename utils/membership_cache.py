@@ -0,0 +1,148 @@
+"""
+Cross-request cache of membership roles
+
+Group.is_member and Group.is_admin guard every write route (add item, rate,
+join, leave, kick, delete item). Each worker keeps the answers as
+(group_id, user_id) -> role, non-members included, in a bounded LRU with a
+TTL, so repeat checks don't reach MongoDB.
+
+Writes in this worker invalidate the cache directly: Membership.add and
+remove drop the group's entries, and so does Membership.delete_by_group.
+Writes in other workers are found through the group change log, where
+Group.add_member and Group._drop_member log their version bump with
+members=True, as does Group.delete. At most every check_interval seconds,
+one lookup first reads the membership entries logged since the last check
+and drops those groups. A kick or group delete in any worker therefore
+stops granting access everywhere within check_interval seconds; ttl
+bounds everything else.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+import utils.db
+from utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+# Change log entries are stamped with the writing worker's clock; look back
+# this much further so skew between hosts can't hide a kick
+CLOCK_SKEW = timedelta(seconds=5)
+
+
+class MembershipCache:
+    """Per-worker role cache, checked against the change log for remote writes"""
+
+    def __init__(self):
+        self.check_interval = 5.0
+        self._cache = LRUCache('membership', max_entries=10000, ttl=300.0)
+        self._checked_at = None  # UTC time the last change log check started
+        self._seen = set()  # log entries the last check already handled
+        self._next_check = 0.0
+        self._check_lock = threading.Lock()
+
+        self.checks = 0
+        self.remote_invalidations = 0
+
+    @property
+    def enabled(self):
+        return self._cache.enabled
+
+    def configure(self, enabled=True, max_entries=10000, ttl=300.0, check_interval=5.0):
+        """
+        Configure the cache
+
+        Args:
+            enabled (bool): Cache roles (disabling clears the cache)
+            max_entries (int): Roles kept before least-recently-used eviction
+            ttl (float): Seconds a role stays valid
+            check_interval (float): Most seconds between change log checks,
+                i.e. how long a write in another worker can go unseen
+                (0 checks before every lookup)
+        """
+        self._cache.configure(enabled=enabled, max_entries=max_entries, ttl=ttl)
+        self._cache.clear()
+        self.check_interval = check_interval
+        self._checked_at = None
+        self._seen = set()
+        self._next_check = 0.0
+
+    def get_role(self, group_id, user_id, loader, cache_none=True):
+        """
+        Return a cached role, or load and cache it
+
+        Args:
+            group_id (str or ObjectId): Group ID
+            user_id (str or ObjectId): User ID
+            loader (callable): Reads the role (None for non-members)
+            cache_none (bool): Also cache non-membership (off while the
+                answer may still change without a membership write)
+
+        Returns:
+            str or None: Role, None if the user is not a member
+        """
+        if not self.enabled:
+            return loader()
+        self._check_remote_writes()
+
+        key = (str(group_id), str(user_id))
+        role = self._cache.get(key, _MISSING)
+        if role is not _MISSING:
+            return role
+        # A write to the group while the role is being read makes set() a no-op
+        generation = self._cache.generation(key[0])
+        role = loader()
+        if role is not None or cache_none:
+            self._cache.set(key, role, tag=key[0], generation=generation)
+        return role
+
+    def invalidate_group(self, group_id):
+        """Drop every cached role in a group (called on membership writes)"""
+        self._cache.invalidate_tag(str(group_id))
+
+    def clear(self):
+        """Drop everything"""
+        self._cache.clear()
+
+    def stats(self):
+        """Return cache metrics for monitoring"""
+        return dict(
+            self._cache.stats(),
+            check_interval=self.check_interval,
+            checks=self.checks,
+            remote_invalidations=self.remote_invalidations
+        )
+
+    def _check_remote_writes(self):
+        """Drop groups whose membership changed since the last check"""
+        if time.monotonic() < self._next_check:
+            return
+        with self._check_lock:
+            if time.monotonic() < self._next_check:
+                return
+            started = datetime.utcnow()
+            if self._checked_at is not None:
+                try:
+                    changes = list(utils.db.group_changes_collection.find(
+                        {'members': True, 'created_at': {'$gt': self._checked_at - CLOCK_SKEW}},
+                        {'group_id': 1}
+                    ))
+                    # The skew window overlaps the last check; skip what it handled
+                    groups = {str(c['group_id']) for c in changes if c['_id'] not in self._seen}
+                    for group_id in groups:
+                        self._cache.invalidate_tag(group_id)
+                        self.remote_invalidations += 1
+                    self._seen = {c['_id'] for c in changes}
+                except Exception as e:
+                    # Without the log we can't tell what changed: start over
+                    logger.error(f"Membership cache check failed: {e}")
+                    self._cache.clear()
+            self._checked_at = started
+            self._next_check = time.monotonic() + self.check_interval
+            self.checks += 1
+
+
+membership_cache = MembershipCache()
@@ -0,0 +1,109 @@
+"""
+Keyset (cursor) pagination helpers
+
+Pages are addressed by the sort-key values of the last row served instead of
+an offset, so fetching page N costs the same index seek as page 1. Cursors
+are opaque to clients: base64-encoded extended JSON that round-trips
+ObjectId and datetime values exactly.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from bson import ObjectId, json_util
+
+# Types a sort key can hold. Anything else (a dict such as {"$regex": ...})
+# would be read as a query operator once placed in keyset_filter()
+SORT_KEY_TYPES = (int, float, str, datetime, ObjectId, type(None))
+
+
+def encode_cursor(payload):
+    """
+    Encode a cursor payload as an opaque URL-safe token
+
+    Args:
+        payload (dict): JSON-serializable values (ObjectId/datetime allowed)
+
+    Returns:
+        str: Cursor token
+    """
+    raw = json_util.dumps(payload, json_options=json_util.CANONICAL_JSON_OPTIONS)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Decode a cursor token produced by encode_cursor
+
+    Tokens come back from clients, so the payload is checked before its
+    values reach a query: 'k' must be a list of plain sort-key values and
+    'r' an integer.
+
+    Raises:
+        ValueError: If the token is malformed
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        payload = json_util.loads(raw)
+    except (binascii.Error, UnicodeError, ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(payload, dict):
+        raise ValueError("Invalid cursor")
+    keys = payload.get('k', [])
+    if not isinstance(keys, list) or not all(
+        isinstance(v, SORT_KEY_TYPES) and not isinstance(v, bool) for v in keys
+    ):
+        raise ValueError("Invalid cursor")
+    rank = payload.get('r', 0)
+    if not isinstance(rank, int) or isinstance(rank, bool):
+        raise ValueError("Invalid cursor")
+    return payload
+
+
+def keyset_filter(sort_spec, values, after=True):
+    """
+    Build a filter matching rows strictly after (or before) a sort position
+
+    Args:
+        sort_spec (list): [(field, direction), ...] ending in a unique field
+        values (list): Sort-key values of the reference row, in spec order
+        after (bool): Rows that sort after the reference row if True,
+            before it if False
+
+    Returns:
+        dict: MongoDB filter using $or over the key prefix
+    """
+    clauses = []
+    for i, (field, direction) in enumerate(sort_spec):
+        clause = {f: v for (f, _), v in zip(sort_spec[:i], values[:i])}
+        forward = (direction == -1) == after
+        clause[field] = {'$lt' if forward else '$gt': values[i]}
+        clauses.append(clause)
+    return {'$or': clauses}
+
+
+def sort_values(doc, sort_spec):
+    """Return a document's values for the fields of a sort spec"""
+    return [doc.get(field) for field, _ in sort_spec]
+
+
+def parse_limit(value, default=None, maximum=100, minimum=1):
+    """
+    Parse a ?limit= query parameter
+
+    Args:
+        value (str or None): Raw parameter
+        default (int or None): Used when the parameter is absent
+        maximum (int): Upper bound; larger values are clamped
+        minimum (int): Smallest accepted value (0 for counts that may be empty)
+
+    Raises:
+        ValueError: If the value is not an integer of at least minimum
+    """
+    if value is None or value == '':
+        return default
+    limit = int(value)
+    if limit < minimum:
+        raise ValueError(f"limit must be at least {minimum}")
+    return min(limit, maximum)
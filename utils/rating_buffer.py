@@ -0,0 +1,423 @@
+"""
+Write-behind buffer for item rating stats
+
+When enabled, rating deltas are coalesced per item in memory and flushed to
+the items collection in batches instead of one update per rating. The
+ratings collection stays the source of truth: every flush records a
+watermark, and on restart `recover()` rebuilds stats for items whose ratings
+changed after it.
+
+Only one process may buffer at a time. The watermark is shared, so a second
+buffering worker could move it past deltas the first still holds, and its
+recovery would rebuild items whose deltas are still pending elsewhere and
+then count them twice. Buffering therefore needs a lease in job_state:
+the worker that holds it buffers, and any other worker writes stats through
+and takes over (running recovery first) only once the lease has expired.
+"""
+import atexit
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+import utils.db
+
+logger = logging.getLogger(__name__)
+
+STATE_ID = 'rating_buffer'
+OWNER_ID = 'rating_buffer_owner'
+
+
+class RatingBuffer:
+    """Coalesces per-item rating deltas and flushes them in batches"""
+
+    def __init__(self):
+        self.requested = False
+        self.flush_interval = 1.0
+        self.flush_threshold = 500
+        self.max_items = 5000
+        self.recovery_slack = 5.0
+        self.lease = 30.0
+
+        self._owner_pid = None  # pid that holds the lease, so forks never inherit it
+        self._renew_at = 0.0
+        self._pending = {}  # item_id -> (count_delta, sum_delta, hist_delta)
+        self._groups = {}  # item_id -> group_id, when the caller knows it
+        self._oldest = None  # when the first pending delta was buffered
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._exit_hook = False
+
+        self._flushes = 0
+        self._items_flushed = 0
+        self._flush_errors = 0
+        self._backpressure_flushes = 0
+        self._last_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+        self._takeovers = 0
+
+    @property
+    def enabled(self):
+        """True if this process buffers deltas (write-behind on and lease held)"""
+        return self.requested and self._owner_pid == os.getpid()
+
+    def configure(self, enabled=False, flush_interval=1.0, flush_threshold=500,
+                  max_items=5000, recovery_slack=5.0, lease=30.0):
+        """
+        Configure the buffer
+
+        Args:
+            enabled (bool): Buffer rating deltas instead of writing them through
+            flush_interval (float): Seconds between timed flushes (0 disables the timer)
+            flush_threshold (int): Pending items that trigger an early flush
+            max_items (int): Pending items at which writers flush synchronously
+            recovery_slack (float): Seconds subtracted from the watermark on recovery
+            lease (float): Seconds the buffering process owns write-behind
+                without renewing before another worker takes over
+        """
+        self.requested = enabled
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.max_items = max_items
+        self.recovery_slack = recovery_slack
+        self.lease = lease
+
+        if not enabled:
+            self._release()
+            return
+        if not self._claim():
+            logger.warning(
+                "Rating write-behind is owned by another worker; "
+                "this one writes rating stats through until it can take over"
+            )
+        self._ensure_thread()
+
+    def add(self, item_id, old_rating, new_rating, group_id=None):
+        """
+        Buffer a rating change for an item
+
+        Args:
+            item_id (str): Item ID
+            old_rating (int or None): Previous score, None for a new rating
+            new_rating (int): New score
+            group_id (str, optional): The item's group, so the flush can
+                invalidate its leaderboard without a lookup
+
+        Returns:
+            bool: True if buffered. False if this process does not own
+                write-behind (checked under the buffer lock, so a lease
+                lost meanwhile is seen); the caller writes the stats through.
+        """
+        from models.item import Item
+
+        if not self.enabled:
+            return False
+        delta = Item._rating_delta(old_rating, new_rating)
+        item_id = str(item_id)
+
+        if self._is_full(item_id):
+            # Backpressure: the writer pays for the flush instead of growing
+            # the buffer without bound.
+            self._backpressure_flushes += 1
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Backpressure flush failed, writing through: {e}")
+                Item.apply_rating_deltas(
+                    {item_id: delta}, groups={item_id: group_id} if group_id else None
+                )
+                return True
+
+        with self._lock:
+            if not self.enabled:
+                return False
+            if not self._pending:
+                self._oldest = datetime.utcnow()
+            if item_id in self._pending:
+                delta = Item._combine_deltas(self._pending[item_id], delta)
+            self._pending[item_id] = delta
+            if group_id:
+                self._groups[item_id] = str(group_id)
+            depth = len(self._pending)
+
+        self._ensure_thread()
+        if depth >= self.flush_threshold:
+            self._wakeup.set()
+        return True
+
+    def pending(self, item_id):
+        """Return the buffered (count_delta, sum_delta, hist_delta) for an item"""
+        with self._lock:
+            return self._pending.get(str(item_id), (0, 0, {}))
+
+    def overlay(self, item):
+        """
+        Return a copy of an item document with buffered deltas applied
+
+        Args:
+            item (dict): Item document as stored in MongoDB
+
+        Returns:
+            dict: Item document reflecting pending ratings
+        """
+        from models.item import Item
+
+        return Item.with_delta(item, self.pending(item['_id']))
+
+    def flush(self):
+        """
+        Write all buffered deltas to the items collection
+
+        Without the lease, another worker has taken over and recovered, so
+        the deltas may already be counted: their items are recomputed from
+        the ratings collection instead.
+
+        Returns:
+            int: Number of items flushed
+        """
+        from models.item import Item
+
+        if self._owner_pid != os.getpid():
+            return self._discard_pending()
+
+        with self._flush_lock:
+            started = time.perf_counter()
+            flush_started_at = datetime.utcnow()
+
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                groups, self._groups = self._groups, {}
+                batch_oldest, self._oldest = self._oldest, None
+
+            if not batch:
+                return 0
+
+            try:
+                Item.apply_rating_deltas(batch, groups=groups)
+            except Exception:
+                self._flush_errors += 1
+                self._restore(batch, groups, batch_oldest)
+                raise
+
+            # Anything buffered after the swap was rated after flush_started_at,
+            # except in-flight writes, which recovery_slack covers.
+            self._save_watermark(flush_started_at)
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self._flushes += 1
+            self._items_flushed += len(batch)
+            self._last_flush_ms = elapsed_ms
+            self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+            logger.debug(f"Flushed rating deltas for {len(batch)} items in {elapsed_ms:.1f}ms")
+            return len(batch)
+
+    def recover(self, batch_size=1000):
+        """
+        Rebuild stats for items rated since the last successful flush
+
+        Intended to run once when this process takes the write-behind lease,
+        before it buffers any deltas of its own. No other process buffers
+        while the lease is held, so nothing it rebuilds is still pending.
+
+        Returns:
+            int: Number of item documents corrected
+        """
+        from utils.reconcile import recompute_rated_since
+
+        recovery_started_at = datetime.utcnow()
+        state = utils.db.job_state_collection.find_one({'_id': STATE_ID})
+        if not state or not state.get('watermark'):
+            # Nothing was ever buffered; start tracking from now
+            self._save_watermark(recovery_started_at)
+            return 0
+
+        since = state['watermark'] - timedelta(seconds=self.recovery_slack)
+        _, corrected = recompute_rated_since(since, batch_size)
+
+        self._save_watermark(recovery_started_at)
+        if corrected:
+            logger.warning(f"Recovered rating stats for {corrected} items")
+        return corrected
+
+    def stats(self):
+        """Return buffer metrics for monitoring"""
+        with self._lock:
+            depth = len(self._pending)
+            oldest = self._oldest
+        return {
+            'enabled': self.enabled,
+            'requested': self.requested,
+            'depth': depth,
+            'oldest_pending_seconds': (
+                (datetime.utcnow() - oldest).total_seconds() if oldest else 0.0
+            ),
+            'flushes': self._flushes,
+            'items_flushed': self._items_flushed,
+            'flush_errors': self._flush_errors,
+            'backpressure_flushes': self._backpressure_flushes,
+            'last_flush_ms': round(self._last_flush_ms, 2),
+            'max_flush_ms': round(self._max_flush_ms, 2),
+            'takeovers': self._takeovers
+        }
+
+    def _is_full(self, item_id):
+        """True if buffering this item would exceed max_items"""
+        with self._lock:
+            return item_id not in self._pending and len(self._pending) >= self.max_items
+
+    def _restore(self, batch, groups, batch_oldest):
+        """Merge a failed batch back into the buffer"""
+        from models.item import Item
+
+        with self._lock:
+            for item_id, group_id in groups.items():
+                self._groups.setdefault(item_id, group_id)
+            for item_id, delta in batch.items():
+                if item_id in self._pending:
+                    delta = Item._combine_deltas(delta, self._pending[item_id])
+                self._pending[item_id] = delta
+            if batch_oldest and (self._oldest is None or batch_oldest < self._oldest):
+                self._oldest = batch_oldest
+
+    def _save_watermark(self, watermark):
+        """Persist the time before which all deltas are known to be flushed"""
+        utils.db.job_state_collection.update_one(
+            {'_id': STATE_ID},
+            {'$set': {'watermark': watermark}},
+            upsert=True
+        )
+
+    def _process_id(self):
+        """Identify this process in the lease document"""
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def _claim(self):
+        """
+        Take or renew the write-behind lease
+
+        Returns:
+            bool: True if this process now owns write-behind
+        """
+        now = datetime.utcnow()
+        try:
+            utils.db.job_state_collection.update_one(
+                {
+                    '_id': OWNER_ID,
+                    '$or': [{'owner': self._process_id()}, {'expires_at': {'$lt': now}}]
+                },
+                {'$set': {
+                    'owner': self._process_id(),
+                    'expires_at': now + timedelta(seconds=self.lease)
+                }},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Held by another live process
+            self._owner_pid = None
+            return False
+        self._owner_pid = os.getpid()
+        self._renew_at = time.monotonic() + self.lease / 2
+        return True
+
+    def _release(self):
+        """Flush and give up the lease so another worker can take over at once"""
+        if self._owner_pid != os.getpid():
+            return
+        self.flush()
+        utils.db.job_state_collection.delete_one(
+            {'_id': OWNER_ID, 'owner': self._process_id()}
+        )
+        self._owner_pid = None
+
+    def _hold_lease(self):
+        """
+        Renew the lease when due, or try to take it over if this process
+        does not hold it
+
+        Returns:
+            bool: True if this process owns write-behind
+        """
+        if self.enabled:
+            if time.monotonic() < self._renew_at or self._claim():
+                return True
+            # Stalled past the lease: another worker took over and recovered.
+            # Pending deltas may already be counted there, so rebuild those
+            # items from the ratings collection instead of applying them.
+            self._discard_pending()
+            logger.error("Lost the rating write-behind lease; writing rating stats through")
+            return False
+        if self._claim():
+            self._takeovers += 1
+            logger.warning("Took over rating write-behind from an expired worker")
+            try:
+                self.recover()
+            except Exception:
+                # Give the lease back so the takeover (and recovery) is retried
+                self._release()
+                raise
+            return True
+        return False
+
+    def _discard_pending(self):
+        """
+        Drop buffered deltas and recompute their items from ratings
+
+        Returns:
+            int: Number of items recomputed
+        """
+        from models.item import Item
+
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._groups = {}
+                self._oldest = None
+            if batch:
+                Item.recompute_rating_stats(list(batch))
+            return len(batch)
+
+    def _ensure_thread(self):
+        """Start the timed flusher (once per process, so it survives forks)"""
+        if self.flush_interval <= 0:
+            return
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name='rating-buffer-flusher', daemon=True
+            )
+            self._thread.start()
+            if not self._exit_hook:
+                atexit.register(self._flush_at_exit)
+                self._exit_hook = True
+
+    def _flush_at_exit(self):
+        """Best-effort flush and lease release when the process exits"""
+        try:
+            self._release()
+        except Exception as e:
+            logger.error(f"Rating buffer flush at exit failed: {e}")
+
+    def _run(self):
+        """Flush loop for the background thread"""
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                if self._hold_lease():
+                    self.flush()
+            except Exception as e:
+                logger.error(f"Rating buffer flush failed: {e}")
+
+
+rating_buffer = RatingBuffer()
@@ -0,0 +1,238 @@
+"""
+Reconciliation jobs for denormalized counters
+
+Item rating stats are denormalized from the ratings collection and can drift
+(deleted items, crashes between writes, buffered deltas that never flushed).
+Group member_count and users' groups_joined are denormalized from the
+memberships collection and can drift on servers without transactions when a
+join or leave is interrupted. The group card summary (item_count,
+rating_count, last_activity_at) is kept up by Group.mark_changed and can
+drift the same way, or when an item is deleted while its ratings still sit
+in the write-behind buffer. These jobs rebuild them in bounded batches,
+streaming IDs from MongoDB cursors so memory use does not grow with the
+collection size.
+"""
+import logging
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+import utils.db
+
+logger = logging.getLogger(__name__)
+
+RATING_STATS_JOB = 'rating_stats_reconcile'
+
+
+def _recompute_in_batches(item_ids, batch_size):
+    """
+    Recompute stats for a stream of item IDs, one batch at a time
+
+    Returns:
+        tuple: (items_checked, items_corrected)
+    """
+    from models.item import Item
+
+    checked = corrected = 0
+    batch = []
+    for item_id in item_ids:
+        batch.append(item_id)
+        if len(batch) >= batch_size:
+            corrected += Item.recompute_rating_stats(batch)
+            checked += len(batch)
+            batch = []
+    if batch:
+        corrected += Item.recompute_rating_stats(batch)
+        checked += len(batch)
+    return checked, corrected
+
+
+def recompute_rated_since(since, batch_size=1000):
+    """
+    Recompute stats for every item with a rating updated at or after `since`
+
+    Args:
+        since (datetime): Lower bound on ratings.updated_at
+        batch_size (int): Items per aggregation/bulk_write round
+
+    Returns:
+        tuple: (items_checked, items_corrected)
+    """
+    cursor = utils.db.ratings_collection.aggregate([
+        {'$match': {'updated_at': {'$gte': since}}},
+        {'$group': {'_id': '$item_id'}}
+    ], allowDiskUse=True, batchSize=batch_size)
+    return _recompute_in_batches((row['_id'] for row in cursor), batch_size)
+
+
+def reconcile_rating_stats(batch_size=1000, full=False):
+    """
+    Bring item rating stats back in line with the ratings collection
+
+    Incremental runs only touch items whose ratings changed since the last
+    run's watermark. A full run checks every item, which also repairs items
+    whose ratings were deleted. Do not run this while another process holds
+    unflushed write-behind deltas for the same items.
+
+    Args:
+        batch_size (int): Items per aggregation/bulk_write round
+        full (bool): Check every item instead of using the watermark
+
+    Returns:
+        dict: items_checked, items_corrected and the new watermark
+    """
+    started_at = datetime.utcnow()
+    state = utils.db.job_state_collection.find_one({'_id': RATING_STATS_JOB}) or {}
+    since = None if full else state.get('watermark')
+
+    if since is None:
+        cursor = utils.db.items_collection.find({}, {'_id': 1}, batch_size=batch_size)
+        checked, corrected = _recompute_in_batches((row['_id'] for row in cursor), batch_size)
+    else:
+        checked, corrected = recompute_rated_since(since, batch_size)
+
+    utils.db.job_state_collection.update_one(
+        {'_id': RATING_STATS_JOB},
+        {'$set': {
+            'watermark': started_at,
+            'last_checked': checked,
+            'last_corrected': corrected
+        }},
+        upsert=True
+    )
+    logger.info(f"Rating stats reconciled: {checked} checked, {corrected} corrected")
+    return {
+        'items_checked': checked,
+        'items_corrected': corrected,
+        'watermark': started_at
+    }
+
+
+def _batches(cursor, batch_size):
+    """Yield lists of up to batch_size documents from a cursor"""
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def reconcile_memberships(batch_size=1000):
+    """
+    Bring member_count and groups_joined back in line with memberships
+
+    Returns:
+        dict: groups_checked, groups_corrected, users_checked, users_corrected
+    """
+    result = dict.fromkeys(('groups_checked', 'groups_corrected', 'users_checked', 'users_corrected'), 0)
+
+    groups = utils.db.groups_collection.find({}, {'member_count': 1}, batch_size=batch_size)
+    for batch in _batches(groups, batch_size):
+        counts = {
+            row['_id']: row['count']
+            for row in utils.db.memberships_collection.aggregate([
+                {'$match': {'group_id': {'$in': [g['_id'] for g in batch]}}},
+                {'$group': {'_id': '$group_id', 'count': {'$sum': 1}}}
+            ])
+        }
+        fixes = [
+            UpdateOne({'_id': g['_id']}, {'$set': {'member_count': counts.get(g['_id'], 0)}})
+            for g in batch if g.get('member_count') != counts.get(g['_id'], 0)
+        ]
+        if fixes:
+            utils.db.groups_collection.bulk_write(fixes, ordered=False)
+        result['groups_checked'] += len(batch)
+        result['groups_corrected'] += len(fixes)
+
+    users = utils.db.users_collection.find({}, {'groups_joined': 1}, batch_size=batch_size)
+    for batch in _batches(users, batch_size):
+        joined = {}
+        for membership in utils.db.memberships_collection.find(
+            {'user_id': {'$in': [u['_id'] for u in batch]}}, {'_id': 0, 'user_id': 1, 'group_id': 1}
+        ):
+            joined.setdefault(membership['user_id'], []).append(str(membership['group_id']))
+        fixes = [
+            UpdateOne({'_id': u['_id']}, {'$set': {'groups_joined': sorted(joined.get(u['_id'], []))}})
+            for u in batch if set(u.get('groups_joined', [])) != set(joined.get(u['_id'], []))
+        ]
+        if fixes:
+            utils.db.users_collection.bulk_write(fixes, ordered=False)
+        result['users_checked'] += len(batch)
+        result['users_corrected'] += len(fixes)
+
+    logger.info(
+        f"Memberships reconciled: {result['groups_corrected']} groups, "
+        f"{result['users_corrected']} users corrected"
+    )
+    return result
+
+
+def reconcile_group_summaries(batch_size=1000):
+    """
+    Bring group item_count, rating_count and last_activity_at back in line
+    with the items and ratings collections
+
+    last_activity_at is only moved forward: item edits leave no trace to
+    rebuild it from, so a later stored value is kept.
+
+    Returns:
+        dict: groups_checked, groups_corrected
+    """
+    from models.group import Group
+
+    result = dict.fromkeys(('groups_checked', 'groups_corrected'), 0)
+
+    groups = utils.db.groups_collection.find(
+        Group.LIVE,
+        {'item_count': 1, 'rating_count': 1, 'last_activity_at': 1, 'created_at': 1},
+        batch_size=batch_size
+    )
+    for batch in _batches(groups, batch_size):
+        match = {'$match': {'group_id': {'$in': [g['_id'] for g in batch]}}}
+        items = {
+            row['_id']: row
+            for row in utils.db.items_collection.aggregate([
+                match,
+                {'$group': {'_id': '$group_id', 'count': {'$sum': 1}, 'last': {'$max': '$created_at'}}}
+            ])
+        }
+        ratings = {
+            row['_id']: row
+            for row in utils.db.ratings_collection.aggregate([
+                match,
+                {'$group': {'_id': '$group_id', 'count': {'$sum': 1}, 'last': {'$max': '$updated_at'}}}
+            ])
+        }
+
+        fixed = []
+        fixes = []
+        for g in batch:
+            item_row = items.get(g['_id'], {})
+            rating_row = ratings.get(g['_id'], {})
+            summary = {
+                'item_count': item_row.get('count', 0),
+                'rating_count': rating_row.get('count', 0),
+                'last_activity_at': max(
+                    t for t in (g.get('last_activity_at'), g['created_at'],
+                                item_row.get('last'), rating_row.get('last')) if t
+                )
+            }
+            if any(g.get(field) != value for field, value in summary.items()):
+                fixes.append(UpdateOne({'_id': g['_id']}, {'$set': summary}))
+                fixed.append(g['_id'])
+        if fixes:
+            utils.db.groups_collection.bulk_write(fixes, ordered=False)
+            for group_id in fixed:
+                # Cards served with the old version would keep the old counts
+                Group.mark_changed(group_id)
+        result['groups_checked'] += len(batch)
+        result['groups_corrected'] += len(fixes)
+
+    logger.info(
+        f"Group summaries reconciled: {result['groups_checked']} checked, "
+        f"{result['groups_corrected']} corrected"
+    )
+    return result
@@ -0,0 +1,268 @@
+"""
+In-process prefix index for group name autocomplete
+
+Group names are kept lowercased in a sorted list, so every name starting
+with a prefix is one contiguous slice found with bisect. Matches are ranked
+by member_count. Group.create() and Group.delete() update the index in
+place; a background thread builds it when the app starts and rebuilds it
+from MongoDB every refresh_interval seconds to pick up member counts and
+writes made by other processes. Lookups never load the index themselves:
+until the first build finishes they return no suggestions.
+
+At most max_groups groups are indexed (the largest by member_count).
+"""
+import bisect
+import heapq
+import logging
+import os
+import sys
+import threading
+import time
+
+import utils.db
+
+logger = logging.getLogger(__name__)
+
+# Seconds before a failed first build is retried
+WARM_RETRY_INTERVAL = 5.0
+
+
+def normalize(name):
+    """Lowercase a name or typed prefix and collapse its whitespace"""
+    return ' '.join(name.split()).lower()
+
+
+class GroupSuggester:
+    """Sorted-array prefix index over group names"""
+
+    def __init__(self):
+        self.enabled = True
+        self.max_groups = 50000
+        self.refresh_interval = 300.0
+
+        self._keys = []  # sorted (name_lower, group_id)
+        self._groups = {}  # group_id -> (name_lower, name, member_count)
+        self._loaded = False
+        self._replay = None  # changes made while a rebuild is reading MongoDB
+        self._memory = 0  # approximate bytes held, kept up by every change
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+        self.lookups = 0
+        self.rebuilds = 0
+        self.skipped = 0  # creates not indexed because the index was full
+        self._last_rebuild_ms = 0.0
+        self._loaded_at = None
+
+    def configure(self, enabled=True, max_groups=50000, refresh_interval=300.0):
+        """
+        Configure the index
+
+        Args:
+            enabled (bool): Serve suggestions (disabling frees the index)
+            max_groups (int): Most groups kept in memory
+            refresh_interval (float): Seconds between rebuilds from MongoDB
+                (0 disables the thread; call rebuild())
+        """
+        self.enabled = enabled
+        self.max_groups = max_groups
+        self.refresh_interval = refresh_interval
+        if not enabled:
+            self.clear()
+            return
+        # Build in the background now rather than in the first request
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            self._wakeup.set()
+        else:
+            self._ensure_thread()
+
+    def suggest(self, prefix, limit=8):
+        """
+        Get the largest groups whose name starts with a prefix
+
+        Args:
+            prefix (str): Typed text (case and extra spaces are ignored)
+            limit (int): Most suggestions to return
+
+        Returns:
+            list: (group_id, name, member_count) tuples, most members first
+                (none until the index has been built)
+        """
+        prefix = normalize(prefix)
+        if not prefix or not self.enabled:
+            return []
+        self._ensure_thread()
+        if not self._loaded:
+            return []
+
+        with self._lock:
+            self.lookups += 1
+            start = bisect.bisect_left(self._keys, (prefix,))
+            end = bisect.bisect_left(self._keys, (prefix + '\U0010ffff',), start)
+            matches = [self._groups[group_id] + (group_id,) for _, group_id in self._keys[start:end]]
+        best = heapq.nlargest(limit, matches, key=lambda m: (m[2], m[0]))
+        return [(group_id, name, member_count) for _, name, member_count, group_id in best]
+
+    def add(self, group_id, name, member_count=1):
+        """Index a new group (called by Group.create)"""
+        group_id = str(group_id)
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append((group_id, name, member_count))
+            if self._loaded:
+                self._add(group_id, name, member_count)
+
+    def remove(self, group_id):
+        """Drop a deleted group (called by Group.delete)"""
+        group_id = str(group_id)
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append((group_id, None, None))
+            if self._loaded:
+                self._remove(group_id)
+
+    def rebuild(self):
+        """
+        Reload the index from MongoDB
+
+        Creates and deletes that happen while the groups are being read are
+        replayed onto the new index before it replaces the old one.
+
+        Returns:
+            int: Number of groups indexed
+        """
+        with self._load_lock:
+            started = time.perf_counter()
+            with self._lock:
+                self._replay = []
+
+            try:
+                groups = {}
+                cursor = utils.db.groups_collection.find(
+                    {'deleted_at': {'$exists': False}}, {'name': 1, 'member_count': 1}
+                ).sort('member_count', -1).limit(self.max_groups)
+                for group in cursor:
+                    groups[str(group['_id'])] = (
+                        normalize(group['name']), group['name'], group.get('member_count', 0)
+                    )
+            except Exception:
+                with self._lock:
+                    self._replay = None
+                raise
+
+            # Sort and size the new index before taking the lock lookups wait on
+            keys = sorted((name_lower, group_id) for group_id, (name_lower, _, _) in groups.items())
+            memory = sys.getsizeof(keys) + sys.getsizeof(groups) + sum(
+                self._entry_bytes(group_id, entry) for group_id, entry in groups.items()
+            )
+
+            with self._lock:
+                replay, self._replay = self._replay, None
+                self._groups = groups
+                self._keys = keys
+                self._memory = memory
+                for group_id, name, member_count in replay:
+                    if name is None:
+                        self._remove(group_id)
+                    else:
+                        self._add(group_id, name, member_count)
+                self._loaded = True
+                count = len(self._groups)
+
+            self.rebuilds += 1
+            self._last_rebuild_ms = (time.perf_counter() - started) * 1000
+            self._loaded_at = time.time()
+            return count
+
+    def clear(self):
+        """Forget every group; the next lookup reloads from MongoDB"""
+        with self._lock:
+            self._keys = []
+            self._groups = {}
+            self._memory = 0
+            self._loaded = False
+
+    def stats(self):
+        """Return index metrics for monitoring"""
+        return {
+            'enabled': self.enabled,
+            'loaded': self._loaded,
+            'groups': len(self._groups),
+            'max_groups': self.max_groups,
+            'memory_bytes': self._memory,
+            'lookups': self.lookups,
+            'rebuilds': self.rebuilds,
+            'skipped': self.skipped,
+            'last_rebuild_ms': round(self._last_rebuild_ms, 2),
+            'seconds_since_rebuild': (
+                round(time.time() - self._loaded_at, 1) if self._loaded_at else None
+            )
+        }
+
+    def _add(self, group_id, name, member_count):
+        """Insert or replace one group; caller holds the lock"""
+        if group_id in self._groups:
+            self._remove(group_id)
+        elif len(self._groups) >= self.max_groups:
+            self.skipped += 1
+            return
+        name_lower = normalize(name)
+        entry = (name_lower, name, member_count)
+        self._groups[group_id] = entry
+        bisect.insort(self._keys, (name_lower, group_id))
+        self._memory += self._entry_bytes(group_id, entry)
+
+    def _remove(self, group_id):
+        """Delete one group if indexed; caller holds the lock"""
+        entry = self._groups.pop(group_id, None)
+        if entry is None:
+            return
+        self._memory -= self._entry_bytes(group_id, entry)
+        index = bisect.bisect_left(self._keys, (entry[0], group_id))
+        if index < len(self._keys) and self._keys[index] == (entry[0], group_id):
+            del self._keys[index]
+
+    @staticmethod
+    def _entry_bytes(group_id, entry):
+        """Approximate size of one indexed group, its key in _keys included"""
+        name_lower, name, _ = entry
+        total = sys.getsizeof(group_id) + sys.getsizeof(entry) + sys.getsizeof(name_lower)
+        total += sys.getsizeof((name_lower, group_id))
+        if name is not name_lower:
+            total += sys.getsizeof(name)
+        return total
+
+    def _ensure_thread(self):
+        """Start the periodic rebuild (once per process, so it survives forks)"""
+        if self.refresh_interval <= 0:
+            return
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name='group-suggest-rebuild', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        """Build the index, then rebuild it every refresh_interval seconds"""
+        while self.refresh_interval > 0:
+            if self.enabled:
+                try:
+                    self.rebuild()
+                except Exception as e:
+                    logger.error(f"Group suggestion rebuild failed: {e}")
+            wait = self.refresh_interval
+            if not self._loaded:
+                wait = min(wait, WARM_RETRY_INTERVAL)
+            self._wakeup.wait(wait)
+            self._wakeup.clear()
+
+
+group_suggestions = GroupSuggester()
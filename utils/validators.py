@@ -92,6 +92,21 @@ def validate_rating(score):
         return False
 
 
+def parse_bool(value):
+    """
+    Interpret a query-string flag such as ?histogram=1
+    
+    Args:
+        value: Raw query parameter value (may be None)
+        
+    Returns:
+        bool: True for 1/true/yes/on (case-insensitive)
+    """
+    if value is None:
+        return False
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
 def sanitize_input(text, max_length=None):
     """
     Sanitize user input by stripping whitespace and limiting length